@@ -0,0 +1,55 @@
+import random
+import time
+
+from synthetic import SRC_DIR  # noqa: F401  (puts src/santa_bot on sys.path)
+
+import numpy as np
+
+from core.batch import calculate_arrival_time_batch, find_nearest_stop_batch
+from core.tracker import calculate_arrival_time, find_nearest_stop
+from services.santa_api import SantaAPI
+
+"""
+Throughput of the NumPy batch geometry against the scalar functions on the
+real route.
+
+Usage: BOT_TOKEN=x python benchmarks/bench_batch.py
+"""
+
+SIZES = [10_000, 1_000_000]
+SCALAR_SAMPLE = 2_000
+
+
+def main():
+    route = SantaAPI().get_route()
+    rng = np.random.default_rng(0)
+
+    print(f"{'coords':>10} {'function':>24} {'scalar/s':>12} {'batch/s':>12}")
+
+    for n in SIZES:
+        lat = rng.uniform(-90, 90, n)
+        lon = rng.uniform(-180, 180, n)
+        sample = random.Random(0).sample(range(n), min(n, SCALAR_SAMPLE))
+
+        for name, scalar, batch in (
+            ("find_nearest_stop", find_nearest_stop, find_nearest_stop_batch),
+            (
+                "calculate_arrival_time",
+                calculate_arrival_time,
+                calculate_arrival_time_batch,
+            ),
+        ):
+            start = time.perf_counter()
+            for i in sample:
+                scalar(lat[i], lon[i], route)
+            scalar_rate = len(sample) / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            batch(lat, lon, route)
+            batch_rate = n / (time.perf_counter() - start)
+
+            print(f"{n:>10} {name:>24} {scalar_rate:>12,.0f} {batch_rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
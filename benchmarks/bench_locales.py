@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import List
+
+from synthetic import SRC_DIR
+
+# Nothing here talks to Telegram, but settings refuses to load without a token
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+from services.locales import LocaleRegistry  # noqa: E402
+from services.santa_api import SantaAPI  # noqa: E402
+
+"""
+Memory used by 1, 5 and 20 languages.
+
+Every language gets a copy of data/santa_en.json with its own city and region
+names. "shared" loads them through the LocaleRegistry: one route, plus the
+names of each language. "per locale" is what a SantaAPI per language would
+cost: a full route, with its indexes, for each. Memory is measured once the
+languages are loaded, and again once every stop's status texts and arrival
+time were rendered in every language, as after a day of traffic.
+
+Usage: python benchmarks/bench_locales.py [--locales 1,5,20]
+"""
+
+DATA_PATH = SRC_DIR.parent.parent / "data" / "santa_en.json"
+
+
+def write_locales(data_dir: Path, count: int) -> List[str]:
+    shutil.copy(DATA_PATH, data_dir / "santa_en.json")
+    with open(DATA_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    locales = ["en"]
+    for i in range(1, count):
+        locale = f"l{i:02d}"
+        for stop in data["destinations"]:
+            stop["city"] = f"{stop['city'].split(' [')[0]} [{locale}]"
+            stop["region"] = f"{stop['region'].split(' [')[0]} [{locale}]"
+        with open(data_dir / f"santa_{locale}.json", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        locales.append(locale)
+    return locales
+
+
+def load_api(data_path: Path) -> SantaAPI:
+    api = SantaAPI()
+    api.data_path = data_path
+    api.snapshot_path = data_path.with_suffix(".missing")
+    api.raster_path = data_path.with_suffix(".missing")
+    api.get_route()
+    return api
+
+
+def render_all(route, messages):
+    for i in range(len(route)):
+        messages.visiting(i)
+        messages.in_flight(i, 42)
+        messages.arrival_text(i)
+
+
+def traced_mb() -> float:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / 1024 / 1024
+
+
+"""
+Returns (MB once loaded, MB once rendered, load seconds)
+"""
+
+
+def shared(data_dir: Path, locales: List[str]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    api = load_api(data_dir / "santa_en.json")
+    registry = LocaleRegistry(api)
+
+    async def load():
+        return [await registry.names(locale) for locale in locales]
+
+    names = asyncio.run(load())
+    elapsed = time.perf_counter() - start
+    loaded = traced_mb()
+
+    for locale_names in names:
+        render_all(api.get_route(), locale_names.messages)
+    rendered = traced_mb()
+    tracemalloc.stop()
+    return loaded, rendered, elapsed
+
+
+def per_locale(data_dir: Path, locales: List[str]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    apis = [load_api(data_dir / f"santa_{locale}.json") for locale in locales]
+    elapsed = time.perf_counter() - start
+    loaded = traced_mb()
+
+    for api in apis:
+        route = api.get_route()
+        render_all(route, route.messages)
+    rendered = traced_mb()
+    tracemalloc.stop()
+    return loaded, rendered, elapsed
+
+
+def main(counts: List[int]):
+    print(f"{'':>8} {'shared':^29} {'per locale':^29}")
+    print(
+        f"{'locales':>8}" + f" {'loaded MB':>10} {'rendered MB':>11} {'load s':>6}" * 2
+    )
+    for count in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = Path(tmp)
+            locales = write_locales(data_dir, count)
+            row = [*shared(data_dir, locales), *per_locale(data_dir, locales)]
+        print(
+            f"{count:>8}"
+            + f" {row[0]:>10.2f} {row[1]:>11.2f} {row[2]:>6.2f}"
+            + f" {row[3]:>10.2f} {row[4]:>11.2f} {row[5]:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory use per language")
+    parser.add_argument("--locales", default="1,5,20")
+    main([int(n) for n in parser.parse_args().locales.split(",")])
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from synthetic import SRC_DIR  # noqa: F401 (puts the bot's sources on sys.path)
+
+# Importing the bot never talks to Telegram, but settings refuses to load without
+# a token. Its stores go to a scratch directory.
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+SCRATCH = tempfile.mkdtemp()
+for name, file in [
+    ("SUBSCRIPTIONS_DB_PATH", "subscriptions.sqlite3"),
+    ("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3"),
+]:
+    os.environ.setdefault(name, os.path.join(SCRATCH, file))
+
+from services.metrics import Histogram, Registry  # noqa: E402
+from services.telegram import metrics, timed  # noqa: E402
+
+"""
+Overhead of the metrics on the update path.
+
+Compares a trivial handler called directly with the same handler wrapped in
+telegram.timed(), which is what every update goes through, and times
+Histogram.observe() on its own. Also times rendering the bot's whole
+registry, which only happens when /metrics is scraped.
+
+Usage: python benchmarks/bench_metrics.py [--updates 200000]
+"""
+
+
+async def handler(update, context):
+    pass
+
+
+async def per_update(callback, updates: int) -> float:
+    start = time.perf_counter()
+    for _ in range(updates):
+        await callback(None, None)
+    return (time.perf_counter() - start) / updates
+
+
+def best_of(fn, rounds: int = 5) -> float:
+    return min(fn() for _ in range(rounds))
+
+
+def main(updates: int):
+    plain = best_of(lambda: asyncio.run(per_update(handler, updates)))
+    wrapped = best_of(lambda: asyncio.run(per_update(timed("bench", handler), updates)))
+    print(f"handler called directly   {plain * 1e6:8.3f} us/update")
+    print(f"handler wrapped in timed  {wrapped * 1e6:8.3f} us/update")
+    print(f"overhead                  {(wrapped - plain) * 1e6:8.3f} us/update")
+
+    histogram = Histogram()
+
+    def observe():
+        start = time.perf_counter()
+        for i in range(updates):
+            histogram.observe(i * 1e-6, "bench")
+        return (time.perf_counter() - start) / updates
+
+    print(f"Histogram.observe         {best_of(observe) * 1e6:8.3f} us")
+
+    # Every handler with samples, as after some traffic
+    registry = Registry()
+    for name in ("start", "notify", "list", "stats", "help", "share"):
+        histogram.observe(0.01, name)
+    registry.histogram("bench_seconds", "Benchmark", histogram, ("handler",))
+
+    def render(registry):
+        start = time.perf_counter()
+        for _ in range(100):
+            registry.render()
+        return (time.perf_counter() - start) / 100
+
+    print(
+        f"render, 7 series          {best_of(lambda: render(registry)) * 1e6:8.1f} us"
+    )
+    print(f"render, bot registry      {best_of(lambda: render(metrics)) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("--updates", type=int, default=200_000)
+    main(parser.parse_args().updates)
@@ -0,0 +1,72 @@
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import SRC_DIR  # noqa: F401  (puts src/santa_bot on sys.path)
+
+from fake_bot_api import FakeBotAPI
+from telegram import Bot
+
+from services.outbox import INTERACTIVE, Outbox
+from services.photos import PhotoCache
+
+"""
+"Where is Santa now?" photo latency against a local fake Bot API: sending
+the photo URL every time versus sending the cached file_id.
+
+Usage: BOT_TOKEN=x python benchmarks/bench_photos.py [requests] [url latency s]
+"""
+
+PHOTO_URL = "https://lh3.googleusercontent.com/p/santa-stop-photo"
+
+
+async def measure(outbox: Outbox, photos: PhotoCache, requests: int, cached: bool):
+    timings = []
+    for chat_id in range(requests):
+        start = time.perf_counter()
+        if cached:
+            await photos.send(outbox, chat_id, PHOTO_URL, INTERACTIVE, caption="🎅🏻")
+        else:
+            await outbox.send(
+                "send_photo", chat_id, INTERACTIVE, photo=PHOTO_URL, caption="🎅🏻"
+            )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings):
+    timings = sorted(timings)
+    print(
+        f"{name:>10}: mean {statistics.mean(timings) * 1000:7.1f} ms"
+        f"  p50 {timings[len(timings) // 2] * 1000:7.1f} ms"
+        f"  p99 {timings[int(len(timings) * 0.99)] * 1000:7.1f} ms"
+    )
+
+
+async def main(requests: int, url_latency: float):
+    with FakeBotAPI(latency=0.005, photo_url_latency=url_latency) as server:
+        bot = Bot("123:fake", base_url=server.base_url)
+        await bot.initialize()
+
+        # No rate limit, only the send latency is measured
+        outbox = Outbox(global_rate=1e6, chat_rate=1e6, chat_burst=1e6)
+        outbox.start(bot)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            photos = PhotoCache(Path(tmp) / "photos.sqlite3")
+
+            report("url", await measure(outbox, photos, requests, cached=False))
+            report("file_id", await measure(outbox, photos, requests, cached=True))
+
+        print(f"photo downloads by the Bot API: {server.calls['photo_downloads']}")
+        await outbox.stop()
+        await bot.shutdown()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    asyncio.run(main(count, latency))
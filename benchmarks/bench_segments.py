@@ -0,0 +1,77 @@
+import random
+import time
+
+from synthetic import SRC_DIR  # noqa: F401  (puts src/santa_bot on sys.path)
+
+from core.spatial import to_unit_vector
+from core.tracker import calculate_distance, match_segment
+from services.santa_api import SantaAPI
+
+"""
+Micro-benchmark of ETA estimation on the real route: the original
+three-haversines-per-segment scan, a full scan over the precomputed segment
+table, and match_segment (segment table + spatial index).
+
+Usage: BOT_TOKEN=x python benchmarks/bench_segments.py
+"""
+
+QUERIES = 2_000
+
+
+def haversine_scan(user_lat, user_lon, route):
+    best_arrival_time = None
+    min_detour = float("inf")
+
+    for i in range(len(route) - 1):
+        lat_a, lon_a = route.lat[i], route.lng[i]
+        lat_b, lon_b = route.lat[i + 1], route.lng[i + 1]
+
+        dist_a_b = calculate_distance(lat_a, lon_a, lat_b, lon_b)
+        dist_a_user = calculate_distance(lat_a, lon_a, user_lat, user_lon)
+        dist_user_b = calculate_distance(user_lat, user_lon, lat_b, lon_b)
+
+        detour = (dist_a_user + dist_user_b) - dist_a_b
+        if detour < min_detour:
+            min_detour = detour
+            fraction = dist_a_user / (dist_a_user + dist_user_b)
+            duration = route.arrival[i + 1] - route.departure[i]
+            best_arrival_time = route.departure[i] + duration * fraction
+
+    return best_arrival_time
+
+
+def table_scan(user_lat, user_lon, route):
+    table = route.segments
+    user = to_unit_vector(user_lat, user_lon)
+    distances = {}
+
+    best = min(range(len(table)), key=lambda i: table.detour(i, user, distances))
+    return table.match(best, user, distances).eta_ms
+
+
+def indexed(user_lat, user_lon, route):
+    return match_segment(user_lat, user_lon, route).eta_ms
+
+
+def main():
+    route = SantaAPI().get_route()
+    rng = random.Random(0)
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(QUERIES)]
+
+    reference = [haversine_scan(lat, lon, route) for lat, lon in points]
+
+    for name, fn in (
+        ("haversine scan", haversine_scan),
+        ("segment table scan", table_scan),
+        ("segment table + index", indexed),
+    ):
+        start = time.perf_counter()
+        results = [fn(lat, lon, route) for lat, lon in points]
+        elapsed_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        max_error_ms = max(abs(a - b) for a, b in zip(results, reference))
+        print(f"{name:>22}: {elapsed_us:8.1f} us/query, max diff {max_error_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from synthetic import SRC_DIR
+
+"""
+Cold start of the bot, each run in a fresh interpreter: time to import
+services.telegram, and time until the first "Where is Santa now?" answer is
+ready, with the route loaded from the JSON file or from the compiled snapshot.
+
+Compile the snapshot first: python src/santa_bot/main.py compile-route
+Usage: BOT_TOKEN=x python benchmarks/bench_startup.py [runs]
+"""
+
+PROBE = """
+import asyncio, json, sys, time
+from pathlib import Path
+
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import services.telegram as bot
+
+imported = time.perf_counter()
+if sys.argv[2] == "json":
+    bot.api.snapshot_path = Path("/nonexistent")
+asyncio.run(bot.status_cache.get())
+answered = time.perf_counter()
+
+bot.subscriptions.close()
+print(json.dumps({"import": imported - start, "first": answered - start}))
+"""
+
+
+def probe(mode: str, env) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, str(SRC_DIR), mode],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs: int = 5):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            SUBSCRIPTIONS_DB_PATH=os.path.join(tmp, "subscriptions.sqlite3"),
+            GEOCODE_CACHE_PATH=os.path.join(tmp, "geocode_cache.sqlite3"),
+        )
+
+        for mode in ("json", "snapshot"):
+            results = [probe(mode, env) for _ in range(runs)]
+            imported = statistics.median(r["import"] for r in results) * 1000
+            first = statistics.median(r["first"] for r in results) * 1000
+            print(
+                f"{mode:>8}: import {imported:6.1f} ms, "
+                f"first answer {first:6.1f} ms (route {first - imported:5.1f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
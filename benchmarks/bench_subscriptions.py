@@ -0,0 +1,78 @@
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import SRC_DIR  # noqa: F401  (puts src/santa_bot on sys.path)
+
+from services.subscriptions import SQLiteSubscriptionStore, Subscription
+
+"""
+Load test for the persistent subscription store: 1M subscriptions spread
+over 200k users and 5k cities.
+
+Usage: BOT_TOKEN=x python benchmarks/bench_subscriptions.py [count]
+"""
+
+USERS = 200_000
+CITIES = 5_000
+
+
+def main(count: int = 1_000_000):
+    rng = random.Random(0)
+    cities = [f"City {i}" for i in range(CITIES)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "subscriptions.sqlite3"
+        store = SQLiteSubscriptionStore(db_path)
+
+        start = time.perf_counter()
+        added = 0
+        while added < count:
+            subscription = Subscription(
+                rng.randrange(USERS),
+                rng.choice(cities),
+                rng.uniform(-90, 90),
+                rng.uniform(-180, 180),
+                1577181600000 + rng.uniform(0, 9e7),
+            )
+            added += store.add(subscription)
+        add_s = time.perf_counter() - start
+        print(f"add:        {count / add_s:12,.0f} subscriptions/s (handler side)")
+
+        start = time.perf_counter()
+        store.flush()
+        print(f"flush:      {time.perf_counter() - start:12.2f} s left to persist")
+
+        users = [rng.randrange(USERS) for _ in range(100_000)]
+        start = time.perf_counter()
+        for user_id in users:
+            store.cities_of(user_id)
+            store.is_subscribed(user_id, "City 1")
+        lookup_us = (time.perf_counter() - start) / len(users) * 1e6
+        print(f"lookups:    {lookup_us:12.2f} us per /list + membership check")
+
+        start = time.perf_counter()
+        for user_id in users[:10_000]:
+            store.remove(user_id, rng.choice(cities))
+        remove_us = (time.perf_counter() - start) / 10_000 * 1e6
+        print(f"remove:     {remove_us:12.2f} us per unsubscribe")
+        store.close()
+
+        start = time.perf_counter()
+        reloaded = SQLiteSubscriptionStore(db_path)
+        print(
+            f"reload:     {time.perf_counter() - start:12.2f} s "
+            f"for {len(reloaded):,} subscriptions"
+        )
+        reloaded.close()
+
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"peak RSS:   {peak_mb:12.0f} MB")
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,59 @@
+import random
+import time
+from typing import Optional, Tuple
+
+from synthetic import synthetic_route
+
+from core.timeline import Timeline
+
+"""
+Compares the bisect based timeline index with the linear scan that
+get_santa_status used to do.
+
+Usage: python benchmarks/bench_timeline.py
+"""
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+QUERIES = 200
+
+
+def linear_locate(route, t_ms: float) -> Tuple[Optional[int], Optional[int]]:
+    for i, (arrival, departure) in enumerate(zip(route.arrival, route.departure)):
+        if arrival <= t_ms <= departure:
+            return i, i + 1 if i + 1 < len(route) else None
+        if t_ms < arrival:
+            return i - 1 if i > 0 else None, i
+    return None, None
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'stops':>10} {'build ms':>10} {'linear us':>12} {'bisect us':>12}")
+
+    for n in SIZES:
+        route = synthetic_route(n)
+
+        start = time.perf_counter()
+        timeline = Timeline(route.arrival, route.departure)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # Late-route queries are the worst case for the linear scan
+        times = [
+            rng.uniform(route.arrival[n // 2], route.arrival[-1])
+            for _ in range(QUERIES)
+        ]
+
+        start = time.perf_counter()
+        expected = [linear_locate(route, t) for t in times]
+        linear_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        start = time.perf_counter()
+        got = [timeline.locate(t)[1:] for t in times]
+        bisect_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        assert got == expected, "timeline index disagrees with the linear scan"
+        print(f"{n:>10} {build_ms:>10.1f} {linear_us:>12.1f} {bisect_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+"""
+Minimal local stand-in for the Telegram Bot API, for benchmarks and tests.
+
+Answers the methods the bot uses with plausible objects, after `latency`
+seconds. Photos sent by URL take `photo_url_latency` more, like Telegram
+downloading the remote image, and are answered with a file_id that can be
+sent again without that cost. The time of the first message sent to each chat
+is kept in `first_reply` (time.monotonic). Updates passed to push_update()
+are served by getUpdates, with long polling. `on_reply` is called with the
+chat id of every message sent, from the server's threads.
+
+Misbehaviour can be injected into the send methods: a `slow_rate` share of
+them take `slow_latency` longer, and a `throttle_rate` share are answered
+with a 429 and `retry_after`, like Telegram's flood control. fail() answers
+the next send calls with given errors instead. Every send call is logged in
+`sends`, failed ones included.
+
+    with FakeBotAPI() as server:
+        bot = telegram.Bot(token, base_url=server.base_url)
+"""
+
+# Answer of a call refused by flood control
+THROTTLED = object()
+# Answer of a call that failed upstream, which the bot sees as a network error
+BAD_GATEWAY = object()
+
+FAILURES = {429: THROTTLED, 502: BAD_GATEWAY}
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Santa Bot",
+    "username": "where_is_santa_bot",
+}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        photo_url_latency: float = 0.3,
+        slow_rate: float = 0.0,
+        slow_latency: float = 1.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.photo_url_latency = photo_url_latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.first_reply: Dict[int, float] = {}
+        self.on_reply: Optional[Callable[[int], None]] = None
+        self._random = random.Random(seed)
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._updates: List[Dict[str, Any]] = []
+        self._updates_ready = threading.Condition(self._lock)
+        # (time.monotonic(), method, chat id, text or caption)
+        self.sends: List[Tuple[float, str, int, str]] = []
+        self._failures: List[Any] = []
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeBotAPI":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    """
+    Answers the next send calls with these HTTP statuses (429 or 502), in order
+    """
+
+    def fail(self, *statuses: int):
+        with self._lock:
+            self._failures.extend(FAILURES[status] for status in statuses)
+
+    def push_update(self, update: Dict[str, Any]):
+        with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def _get_updates(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+
+        with self._updates_ready:
+            while True:
+                # Updates below the offset are confirmed
+                if self._updates and self._updates[0]["update_id"] < offset:
+                    self._updates = [
+                        u for u in self._updates if u["update_id"] >= offset
+                    ]
+                remaining = deadline - time.monotonic()
+                if self._updates or remaining <= 0:
+                    return self._updates[:limit]
+                self._updates_ready.wait(remaining)
+
+    def _message(self, params: Dict[str, str]) -> Dict[str, Any]:
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+
+        chat_id = int(params.get("chat_id", 0))
+        self.first_reply.setdefault(chat_id, time.monotonic())
+        if self.on_reply is not None:
+            self.on_reply(chat_id)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+    def _misbehave(self) -> bool:
+        with self._lock:
+            slow = self._random.random() < self.slow_rate
+            throttled = self._random.random() < self.throttle_rate
+        if slow:
+            self.calls["slowed"] += 1
+            time.sleep(self.slow_latency)
+        if throttled:
+            self.calls["throttled"] += 1
+        return throttled
+
+    def call(self, method: str, params: Dict[str, str]) -> Any:
+        self.calls[method] += 1
+        time.sleep(self.latency)
+
+        if method in ("sendMessage", "sendPhoto"):
+            text = params.get("text", params.get("caption", ""))
+            with self._lock:
+                self.sends.append(
+                    (time.monotonic(), method, int(params.get("chat_id", 0)), text)
+                )
+                failure = self._failures.pop(0) if self._failures else None
+            if failure is not None:
+                return failure
+            if self._misbehave():
+                return THROTTLED
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            return self._message(params)
+        if method == "sendPhoto":
+            photo = params.get("photo", "")
+            if photo.startswith("http"):
+                self.calls["photo_downloads"] += 1
+                time.sleep(self.photo_url_latency)
+                photo = f"file-{zlib.crc32(photo.encode()):08x}"
+
+            message = self._message(params)
+            message["photo"] = [
+                {
+                    "file_id": photo,
+                    "file_unique_id": photo,
+                    "width": 1280,
+                    "height": 720,
+                }
+            ]
+            return message
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method in ("deleteMessage", "setMyCommands", "setWebhook", "deleteWebhook"):
+            return True
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, and no Nagle delay between the headers and the body
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode()
+
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = {k: str(v) for k, v in json.loads(body or "{}").items()}
+                else:
+                    params = dict(parse_qsl(body))
+
+                result = server.call(method, params)
+                if result is THROTTLED:
+                    status = 429
+                    payload = {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": "Too Many Requests: retry after "
+                        f"{server.retry_after}",
+                        "parameters": {"retry_after": server.retry_after},
+                    }
+                elif result is BAD_GATEWAY:
+                    status = 502
+                    payload = {
+                        "ok": False,
+                        "error_code": 502,
+                        "description": "Bad Gateway",
+                    }
+                elif result is None:
+                    status = 404
+                    payload = {
+                        "ok": False,
+                        "error_code": 404,
+                        "description": "Not Found",
+                    }
+                else:
+                    status = 200
+                    payload = {"ok": True, "result": result}
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+"""
+Minimal local stand-in for Nominatim's /search, for load tests.
+
+Every query resolves to a fixed point derived from its text, after `latency`
+seconds, except queries containing "Nowhere", which are not found. Point the
+bot at it with NOMINATIM_DOMAIN=<host:port> and NOMINATIM_SCHEME=http.
+"""
+
+
+class FakeNominatim:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def domain(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeNominatim":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        self.calls["search"] += 1
+        time.sleep(self.latency)
+
+        if "nowhere" in query.lower():
+            return []
+
+        h = zlib.crc32(query.encode())
+        lat = (h % 12000) / 100 - 55.0
+        lon = (h // 12000 % 36000) / 100 - 180.0
+        return [
+            {
+                "place_id": h,
+                "lat": f"{lat:.5f}",
+                "lon": f"{lon:.5f}",
+                "display_name": query,
+                "importance": 0.5,
+            }
+        ]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path.rstrip("/") != "/search":
+                    result: Any = {"error": "Not Found"}
+                    status = 404
+                else:
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    result = server.search(query)
+                    status = 200
+
+                data = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
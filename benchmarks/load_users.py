@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from fake_bot_api import FakeBotAPI
+from fake_nominatim import FakeNominatim
+from load_webhook import UPDATES_PATH, percentile
+from synthetic import SRC_DIR
+
+"""
+End-to-end load test with simulated users, fully offline.
+
+Runs the bot in polling mode against a local fake Bot API and a fake
+Nominatim. Each simulated user goes through /start, the "Where is Santa
+now?" button, /notify (a city on the route or, for every other user, one
+that needs geocoding), /list and /stats, sending the next message once the
+bot answered the previous one. Users arrive at --arrival-rate until --users
+have started.
+
+The fake Bot API can be made to answer slowly (--slow-rate) or with 429s
+(--throttle-rate). The bot runs under a probe that samples event loop lag
+and resident memory. Reports throughput, latency percentiles per step (time
+until the complete answer), loop lag and memory growth.
+
+Usage: python benchmarks/load_users.py [--users 2000] [--arrival-rate 100]
+"""
+
+FIRST_CHAT = 200_000
+START_BUTTON = "🎅🏻 Where is Santa now?"
+
+PROBE = """
+import asyncio, json, resource, sys, time
+
+sys.path.insert(0, sys.argv[1])
+import services.telegram as bot
+
+lag_ms = []
+memory = []
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def sample(interval=0.05):
+    begin = time.monotonic()
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag_ms.append((time.perf_counter() - start - interval) * 1000)
+        if len(lag_ms) % 10 == 0:
+            memory.append((time.monotonic() - begin, rss_kb()))
+
+
+post_init, post_shutdown = bot.post_init, bot.post_shutdown
+tasks = []
+
+
+async def probe_init(application):
+    await post_init(application)
+    memory.append((0.0, rss_kb()))
+    tasks.append(asyncio.create_task(sample()))
+
+
+async def probe_shutdown(application):
+    for task in tasks:
+        task.cancel()
+    await post_shutdown(application)
+    with open(sys.argv[2], "w") as f:
+        json.dump({"lag_ms": lag_ms, "memory": memory}, f)
+
+
+bot.post_init = probe_init
+bot.post_shutdown = probe_shutdown
+bot.run_bot()
+"""
+
+
+def route_cities() -> List[str]:
+    with open(SRC_DIR.parent.parent / "data" / "santa_en.json", encoding="utf-8") as f:
+        destinations = json.load(f)["destinations"]
+    return [stop["city"] for stop in destinations[1:]]
+
+
+class Users:
+    """Simulated users, each one waiting for the bot's answers to its chat."""
+
+    def __init__(self, server: FakeBotAPI, cities: List[str]):
+        self.server = server
+        self.cities = cities
+        with open(UPDATES_PATH, "r", encoding="utf-8") as f:
+            self._template = json.loads(f.readline())
+
+        self._update_id = 0
+        self._waiting: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.timeouts: Dict[str, int] = defaultdict(int)
+        self.completed = 0
+
+    def _update(self, chat_id: int, text: str):
+        self._update_id += 1
+        update = copy.deepcopy(self._template)
+        update["update_id"] = self._update_id
+        message = update["message"]
+        message["chat"]["id"] = message["from"]["id"] = chat_id
+        message["text"] = text
+        if text.startswith("/"):
+            command = text.split(" ", 1)[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        else:
+            message.pop("entities", None)
+        return update
+
+    # Called from the fake Bot API's threads
+    def on_reply(self, chat_id: int):
+        if chat_id in self._waiting:
+            self._loop.call_soon_threadsafe(self._replied, chat_id)
+
+    def _replied(self, chat_id: int):
+        waiting = self._waiting.get(chat_id)
+        if waiting is None:
+            return
+        left, future = waiting
+        if left > 1:
+            self._waiting[chat_id] = (left - 1, future)
+        else:
+            del self._waiting[chat_id]
+            if not future.done():
+                future.set_result(time.monotonic())
+
+    async def _step(self, name: str, chat_id: int, text: str, replies: int):
+        future = self._loop.create_future()
+        self._waiting[chat_id] = (replies, future)
+        start = time.monotonic()
+        self.server.push_update(self._update(chat_id, text))
+        try:
+            done = await asyncio.wait_for(future, 30)
+            self.latencies[name].append(done - start)
+        except asyncio.TimeoutError:
+            self._waiting.pop(chat_id, None)
+            self.timeouts[name] += 1
+
+    async def user(self, i: int, think: float):
+        chat_id = FIRST_CHAT + i
+        if i % 2:
+            notify = ("notify_geocoded", f"/notify Elfville {i}", 2)
+        else:
+            notify = ("notify_route", f"/notify {self.cities[i % len(self.cities)]}", 1)
+
+        for name, text, replies in [
+            ("start", "/start", 1),
+            ("location", START_BUTTON, 1),
+            notify,
+            ("list", "/list", 1),
+            ("stats", "/stats", 1),
+        ]:
+            await self._step(name, chat_id, text, replies)
+            await asyncio.sleep(think)
+        self.completed += 1
+
+    async def run(self, users: int, arrival_rate: float, think: float) -> float:
+        self._loop = asyncio.get_running_loop()
+        tasks = []
+        begin = time.monotonic()
+        for i in range(users):
+            delay = begin + i / arrival_rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.user(i, think)))
+        await asyncio.gather(*tasks)
+        return time.monotonic() - begin
+
+
+def wait_ready(server: FakeBotAPI, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not server.calls["getUpdates"]:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("The bot did not start")
+        time.sleep(0.05)
+
+
+def report(users: Users, elapsed: float, probe, server: FakeBotAPI, args):
+    steps = sum(len(values) for values in users.latencies.values())
+    print(
+        f"{users.completed}/{args.users} users done in {elapsed:.1f}s, "
+        f"{steps / elapsed:.0f} answered updates/s"
+    )
+    print(
+        f"fake Bot API: {server.calls['sendMessage']} messages, "
+        f"{server.calls['sendPhoto']} photos, {server.calls['slowed']} slowed, "
+        f"{server.calls['throttled']} throttled"
+    )
+
+    print(f"\n{'step':<16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'timeouts':>9}")
+    for name, values in users.latencies.items():
+        print(
+            f"{name:<16} {percentile(values, 0.5) * 1000:>9.1f}"
+            f" {percentile(values, 0.9) * 1000:>9.1f}"
+            f" {percentile(values, 0.99) * 1000:>9.1f}"
+            f" {users.timeouts[name]:>9}"
+        )
+
+    lag = probe["lag_ms"]
+    if lag:
+        print(
+            f"\nloop lag   p50 {percentile(lag, 0.5):.1f} ms"
+            f"  p99 {percentile(lag, 0.99):.1f} ms  max {max(lag):.1f} ms"
+            f"  mean {statistics.mean(lag):.1f} ms"
+        )
+
+    memory = probe["memory"]
+    if memory:
+        # The last samples are taken while stopping
+        loaded = [kb for t, kb in memory if t <= elapsed] or [memory[-1][1]]
+        first, last, peak = memory[0][1], loaded[-1], max(kb for _, kb in memory)
+        print(
+            f"memory     {first / 1024:.1f} MB after startup, "
+            f"{last / 1024:.1f} MB after the load (+{(last - first) / 1024:.1f} MB), "
+            f"peak {peak / 1024:.1f} MB"
+        )
+
+
+def main(args):
+    cities = route_cities()
+    api_options = dict(
+        latency=args.api_latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        throttle_rate=args.throttle_rate,
+    )
+
+    with (
+        FakeBotAPI(**api_options) as server,
+        FakeNominatim(latency=args.geocode_latency) as nominatim,
+    ):
+        users = Users(server, cities)
+        server.on_reply = users.on_reply
+
+        with tempfile.TemporaryDirectory() as tmp:
+            probe_path = os.path.join(tmp, "probe.json")
+            env = dict(
+                os.environ,
+                BOT_TOKEN="123:fake",
+                BOT_MODE="polling",
+                TELEGRAM_BASE_URL=server.base_url,
+                NOMINATIM_DOMAIN=nominatim.domain,
+                NOMINATIM_SCHEME="http",
+                GEOCODE_RATE_PER_SECOND=str(args.geocode_rate),
+                OUTBOX_GLOBAL_RATE=str(args.global_rate),
+                SUBSCRIPTIONS_DB_PATH=os.path.join(tmp, "subscriptions.sqlite3"),
+                GEOCODE_CACHE_PATH=os.path.join(tmp, "geocode_cache.sqlite3"),
+            )
+
+            with open(os.path.join(tmp, "bot.log"), "w") as log:
+                process = subprocess.Popen(
+                    [sys.executable, "-c", PROBE, str(SRC_DIR), probe_path],
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                try:
+                    wait_ready(server, process)
+                    elapsed = asyncio.run(
+                        users.run(args.users, args.arrival_rate, args.think)
+                    )
+                    process.send_signal(signal.SIGINT)
+                    process.wait(timeout=60)
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+
+            with open(probe_path, "r") as f:
+                probe = json.load(f)
+
+    report(users, elapsed, probe, server, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument(
+        "--arrival-rate", type=float, default=100, help="New users per second"
+    )
+    parser.add_argument(
+        "--think", type=float, default=1.0, help="Pause between a user's messages (s)"
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=0.02, help="Fake Bot API latency (s)"
+    )
+    parser.add_argument(
+        "--slow-rate", type=float, default=0.0, help="Share of slow Bot API answers"
+    )
+    parser.add_argument(
+        "--slow-latency", type=float, default=1.0, help="Extra latency when slow (s)"
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.0, help="Share of 429 answers"
+    )
+    parser.add_argument(
+        "--geocode-latency", type=float, default=0.2, help="Fake Nominatim latency (s)"
+    )
+    parser.add_argument(
+        "--geocode-rate",
+        type=float,
+        default=1000,
+        help="Geocoding rate limit, Nominatim allows 1/s",
+    )
+    parser.add_argument(
+        "--global-rate",
+        type=float,
+        default=1e6,
+        help="Outbox global rate, Telegram allows ~30/s",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fake_bot_api import FakeBotAPI
+from synthetic import SRC_DIR
+
+"""
+Load test for webhook mode.
+
+Starts the bot in webhook mode against a local fake Bot API, replays the
+recorded updates in updates.jsonl at a fixed rate (each one from a different
+chat), then stops the bot with SIGINT right after the last update. Handler
+latency is the time from posting an update to the bot's first message to that
+chat. Updates still being handled at SIGINT must be answered before the bot
+exits.
+
+Usage: python benchmarks/load_webhook.py [--updates 2000] [--rate 200]
+"""
+
+UPDATES_PATH = Path(__file__).resolve().parent / "updates.jsonl"
+SECRET = "load-test-secret"
+FIRST_CHAT = 100_000
+
+
+def load_updates(count: int):
+    with open(UPDATES_PATH, "r", encoding="utf-8") as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+
+    for i in range(count):
+        update = copy.deepcopy(recorded[i % len(recorded)])
+        update["update_id"] = i + 1
+        message = update["message"]
+        message["chat"]["id"] = message["from"]["id"] = FIRST_CHAT + i
+        yield FIRST_CHAT + i, update
+
+
+async def replay(url: str, count: int, rate: float):
+    sent_at = {}
+    accept = []
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        rejected = await client.post(
+            url,
+            json={"update_id": 0},
+            headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+        )
+        print(f"wrong secret token answered {rejected.status_code}")
+
+        async def post(chat_id: int, update):
+            start = time.monotonic()
+            sent_at[chat_id] = start
+            response = await client.post(
+                url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            )
+            response.raise_for_status()
+            accept.append(time.monotonic() - start)
+
+        tasks = []
+        begin = time.monotonic()
+        for i, (chat_id, update) in enumerate(load_updates(count)):
+            delay = begin + i / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(post(chat_id, update)))
+        await asyncio.gather(*tasks)
+
+    return sent_at, accept
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def wait_ready(server: FakeBotAPI, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not server.calls["setWebhook"]:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("The bot did not start")
+        time.sleep(0.05)
+    # The webhook is set right before the server starts accepting
+    time.sleep(0.5)
+
+
+def main(args):
+    with FakeBotAPI(latency=args.api_latency, photo_url_latency=0.3) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"http://127.0.0.1:{args.port}/telegram"
+            env = dict(
+                os.environ,
+                BOT_TOKEN="123:fake",
+                BOT_MODE="webhook",
+                TELEGRAM_BASE_URL=server.base_url,
+                WEBHOOK_LISTEN="127.0.0.1",
+                WEBHOOK_PORT=str(args.port),
+                WEBHOOK_PATH="telegram",
+                WEBHOOK_URL=url,
+                WEBHOOK_SECRET_TOKEN=SECRET,
+                OUTBOX_GLOBAL_RATE=str(args.global_rate),
+                SUBSCRIPTIONS_DB_PATH=os.path.join(tmp, "subscriptions.sqlite3"),
+                GEOCODE_CACHE_PATH=os.path.join(tmp, "geocode_cache.sqlite3"),
+            )
+
+            with open(os.path.join(tmp, "bot.log"), "w") as log:
+                process = subprocess.Popen(
+                    [sys.executable, str(SRC_DIR / "main.py")],
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                try:
+                    wait_ready(server, process)
+
+                    begin = time.monotonic()
+                    sent_at, accept = asyncio.run(replay(url, args.updates, args.rate))
+                    process.send_signal(signal.SIGINT)
+                    stopping = time.monotonic()
+                    process.wait(timeout=60)
+                    stopped = time.monotonic()
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+
+    latencies = [
+        server.first_reply[chat_id] - start
+        for chat_id, start in sent_at.items()
+        if chat_id in server.first_reply
+    ]
+    answered_late = sum(
+        1 for chat_id in sent_at if server.first_reply.get(chat_id, 0) > stopping
+    )
+
+    print(
+        f"{args.updates} updates at {args.rate}/s in {stopping - begin:.1f}s, "
+        f"{len(latencies)} answered ({answered_late} while stopping), "
+        f"shutdown took {stopped - stopping:.1f}s"
+    )
+    print(
+        f"accept   p50 {percentile(accept, 0.5) * 1000:7.1f} ms"
+        f"  p99 {percentile(accept, 0.99) * 1000:7.1f} ms"
+    )
+    if latencies:
+        print(
+            f"handler  p50 {percentile(latencies, 0.5) * 1000:7.1f} ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+            f"  mean {statistics.mean(latencies) * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for webhook mode")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="Updates per second")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument(
+        "--api-latency", type=float, default=0.02, help="Fake Bot API latency (s)"
+    )
+    parser.add_argument(
+        "--global-rate",
+        type=float,
+        default=1e6,
+        help="Outbox global rate, Telegram allows ~30/s",
+    )
+    main(parser.parse_args())
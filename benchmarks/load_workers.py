@@ -0,0 +1,132 @@
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_bot_api import FakeBotAPI
+from load_webhook import load_updates, percentile
+from synthetic import SRC_DIR
+
+"""
+Load test for dispatcher mode.
+
+Starts the bot as a dispatcher with --workers worker processes against a local
+fake Bot API, feeds the recorded updates to getUpdates at a fixed rate (each
+one from a different chat), then stops it with SIGINT. Reports the handler
+latency like load_webhook.py, how the updates were spread over the workers,
+and checks that exactly one worker was elected to send the city alerts.
+
+Usage: python benchmarks/load_workers.py [--workers 4] [--updates 2000]
+"""
+
+
+def wait_ready(process: subprocess.Popen, log_path: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        with open(log_path, "r") as f:
+            if "Dispatching to" in f.read():
+                return
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("The dispatcher did not start")
+        time.sleep(0.1)
+
+
+def main(args):
+    with FakeBotAPI(latency=args.api_latency) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                BOT_TOKEN="123:fake",
+                BOT_MODE="dispatcher",
+                WORKERS=str(args.workers),
+                WORKER_BASE_PORT=str(args.port),
+                TELEGRAM_BASE_URL=server.base_url,
+                OUTBOX_GLOBAL_RATE=str(args.global_rate),
+                LEASE_TTL_SECONDS="3",
+                SUBSCRIPTIONS_DB_PATH=os.path.join(tmp, "subscriptions.sqlite3"),
+                GEOCODE_CACHE_PATH=os.path.join(tmp, "geocode_cache.sqlite3"),
+                PYTHONUNBUFFERED="1",
+            )
+
+            log_path = os.path.join(tmp, "bot.log")
+            with open(log_path, "w") as log:
+                process = subprocess.Popen(
+                    [sys.executable, str(SRC_DIR / "main.py")],
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                try:
+                    wait_ready(process, log_path)
+                    # Lets the workers' first lease attempts settle
+                    time.sleep(1)
+
+                    sent_at = {}
+                    begin = time.monotonic()
+                    for i, (chat_id, update) in enumerate(load_updates(args.updates)):
+                        delay = begin + i / args.rate - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                        sent_at[chat_id] = time.monotonic()
+                        server.push_update(update)
+
+                    # Waits for the answers before stopping
+                    deadline = time.monotonic() + 30
+                    while len(server.first_reply) < len(sent_at):
+                        if time.monotonic() > deadline:
+                            break
+                        time.sleep(0.05)
+                    finished = time.monotonic()
+
+                    process.send_signal(signal.SIGINT)
+                    process.wait(timeout=60)
+                finally:
+                    if process.poll() is None:
+                        process.kill()
+
+            with open(log_path, "r") as f:
+                output = f.read()
+
+    latencies = [
+        server.first_reply[chat_id] - start
+        for chat_id, start in sent_at.items()
+        if chat_id in server.first_reply
+    ]
+    elected = output.count("Elected to send the city alerts")
+    forwarded = re.findall(r"Worker (\d+): (\d+) updates forwarded", output)
+
+    print(
+        f"{args.workers} workers, {args.updates} updates at {args.rate}/s, "
+        f"{len(latencies)} answered in {finished - begin:.1f}s"
+    )
+    if latencies:
+        print(
+            f"handler  p50 {percentile(latencies, 0.5) * 1000:7.1f} ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+            f"  mean {statistics.mean(latencies) * 1000:7.1f} ms"
+        )
+    print("forwarded per worker: " + ", ".join(count for _, count in forwarded))
+    print(f"workers elected to send alerts: {elected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for dispatcher mode")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="Updates per second")
+    parser.add_argument("--port", type=int, default=8600, help="First worker port")
+    parser.add_argument(
+        "--api-latency", type=float, default=0.02, help="Fake Bot API latency (s)"
+    )
+    parser.add_argument(
+        "--global-rate",
+        type=float,
+        default=1e6,
+        help="Outbox global rate, Telegram allows ~30/s",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,342 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from synthetic import (
+    FLIGHT_MS,
+    SRC_DIR,
+    TAKEOFF_MS,
+    synthetic_route,
+    write_synthetic_data,
+)
+
+# The suite never talks to Telegram, but settings refuses to load without a token
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+from core.messages import MessageCatalogue, format_arrival  # noqa: E402
+from core.tracker import (  # noqa: E402
+    calculate_arrival_time,
+    find_nearest_stop,
+    get_santa_status,
+)
+from services.santa_api import SantaAPI  # noqa: E402
+
+"""
+Regression benchmarks for core.tracker, core.messages and SantaAPI on
+synthetic routes.
+
+Every case runs at each scale (number of stops, 420 is the size of the real
+data). A case is timed in `--repeat` rounds of at least MIN_ROUND_SECONDS,
+and the median and best time per call are saved as JSON, by default to
+benchmarks/results/<commit>.json. With --baseline, the results are compared
+with an earlier file and the run fails if a case got slower by more than
+--threshold. Comparisons use the best time, which is the least affected by
+other load on the machine.
+
+Usage:
+    python benchmarks/suite.py [--scales 420,10000,100000] [--repeat 5]
+    python benchmarks/suite.py --baseline benchmarks/results/<commit>.json
+    python benchmarks/suite.py --compare old.json new.json
+"""
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_SCALES = [420, 10_000, 100_000]
+MIN_ROUND_SECONDS = 0.2
+QUERIES = 100
+
+Result = Dict[str, float]
+
+
+"""
+Seconds per call of `fn`. With `setup`, every call gets a fresh argument
+made outside the timed part, for calls that change their input. `calls` is
+the number of calls `fn` makes itself, for functions too fast to time alone.
+"""
+
+
+def measure(
+    fn: Callable[..., Any],
+    repeat: int,
+    setup: Optional[Callable[[], Any]] = None,
+    calls: int = 1,
+) -> Result:
+    rounds: List[float] = []
+    for _ in range(repeat):
+        runs = 0
+        elapsed = 0.0
+        while runs == 0 or elapsed < MIN_ROUND_SECONDS:
+            if setup is not None:
+                arg = setup()
+                start = time.perf_counter()
+                fn(arg)
+            else:
+                start = time.perf_counter()
+                fn()
+            elapsed += time.perf_counter() - start
+            runs += 1
+        rounds.append(elapsed / (runs * calls))
+
+    return {
+        "median_us": statistics.median(rounds) * 1e6,
+        "min_us": min(rounds) * 1e6,
+        "rounds": repeat,
+    }
+
+
+def tracker_cases(n: int, repeat: int) -> Dict[str, Result]:
+    route = synthetic_route(n)
+    route.build_indexes()
+    mid = n // 2
+
+    moments = {
+        "before_takeoff": TAKEOFF_MS - 60 * 60 * 1000,
+        "visiting": route.arrival[mid] + 1,
+        "in_flight": route.departure[mid] + 1,
+        "last_stop": route.arrival[n - 1] - 1,
+        "after_landing": TAKEOFF_MS + FLIGHT_MS * 2,
+    }
+
+    rng = random.Random(42)
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(QUERIES)]
+
+    def nearest():
+        for lat, lon in points:
+            find_nearest_stop(lat, lon, route)
+
+    def arrival():
+        for lat, lon in points:
+            calculate_arrival_time(lat, lon, route)
+
+    results = {}
+    for name, t_ms in moments.items():
+        results[f"get_santa_status/{name}"] = measure(
+            lambda: get_santa_status(route, t_ms), repeat
+        )
+    results["find_nearest_stop"] = measure(nearest, repeat, calls=QUERIES)
+    results["calculate_arrival_time"] = measure(arrival, repeat, calls=QUERIES)
+    return results
+
+
+"""
+Rendering cost per request. "cold" is a stop's first message on a fresh
+route, the others are served from its catalogue.
+"""
+
+
+def message_cases(n: int, repeat: int) -> Dict[str, Result]:
+    route = synthetic_route(n)
+    messages = route.messages
+    mid = n // 2
+    messages.visiting(mid)
+    messages.in_flight(mid, 42)
+    messages.arrival_text(mid)
+
+    def fresh():
+        return MessageCatalogue(route.cities, route.regions, route.arrival)
+
+    def warm(render):
+        def run():
+            for _ in range(1000):
+                render()
+
+        return measure(run, repeat, calls=1000)
+
+    return {
+        "messages/pre_flight": warm(lambda: messages.pre_flight(1234)),
+        "messages/visiting": warm(lambda: messages.visiting(mid)),
+        "messages/in_flight": warm(lambda: messages.in_flight(mid, 42)),
+        "messages/in_flight_cold": measure(
+            lambda catalogue: catalogue.in_flight(mid, 42), repeat, setup=fresh
+        ),
+        "messages/arrival_text": warm(lambda: messages.arrival_text(mid)),
+        "messages/format_arrival": warm(lambda: format_arrival(route.arrival[mid])),
+    }
+
+
+def santa_api_cases(n: int, repeat: int) -> Dict[str, Result]:
+    api = SantaAPI()
+    target_year = api._target_year()
+
+    results = {
+        "_normalize_timestamps": measure(
+            lambda route: api._normalize_timestamps(route, target_year),
+            repeat,
+            setup=lambda: synthetic_route(n),
+        )
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = Path(tmp) / "santa_en.json"
+        write_synthetic_data(data_path, n)
+
+        def fresh_api(snapshot: bool) -> SantaAPI:
+            api = SantaAPI()
+            api.data_path = data_path
+            api.snapshot_path = data_path.with_suffix(".route")
+            if not snapshot:
+                api.snapshot_path = Path(tmp) / "missing.route"
+            api.raster_path = Path(tmp) / "missing.eta.npy"
+            return api
+
+        results["get_route/cold_json"] = measure(
+            lambda api: api.get_route(), repeat, setup=lambda: fresh_api(False)
+        )
+
+        fresh_api(True).compile_route()
+        results["get_route/cold_snapshot"] = measure(
+            lambda api: api.get_route(), repeat, setup=lambda: fresh_api(True)
+        )
+
+        warm = fresh_api(True)
+        warm.get_route()
+
+        def warm_loads():
+            for _ in range(1000):
+                warm.get_route()
+
+        results["get_route/warm"] = measure(warm_loads, repeat, calls=1000)
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_suite(scales: List[int], repeat: int) -> Dict[str, Any]:
+    results: Dict[str, Result] = {}
+    for n in scales:
+        for group in (tracker_cases, message_cases, santa_api_cases):
+            for name, result in group(n, repeat).items():
+                key = f"{name}[{n}]"
+                results[key] = result
+                print(
+                    f"{key:<42} {result['median_us']:>14.2f} us"
+                    f"  (best {result['min_us']:.2f})",
+                    flush=True,
+                )
+
+    return {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scales": scales,
+        "results": results,
+    }
+
+
+"""
+Prints the change of every case present in both runs. Returns the cases
+whose best time got slower by more than `threshold` (0.1 = 10%).
+"""
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    print(
+        f"\n{'case':<42} {baseline['commit']:>14} {current['commit']:>14} {'change':>8}"
+    )
+
+    regressions = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+
+        change = result["min_us"] / before["min_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  slower"
+            regressions.append(key)
+        elif change < -threshold:
+            flag = "  faster"
+
+        print(
+            f"{key:<42} {before['min_us']:>14.2f} {result['min_us']:>14.2f}"
+            f" {change:>+7.1%}{flag}"
+        )
+    return regressions
+
+
+def load(path: Path) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(args) -> int:
+    if args.compare:
+        regressions = compare(
+            load(args.compare[0]), load(args.compare[1]), args.threshold
+        )
+        return 1 if regressions else 0
+
+    scales = [int(n) for n in args.scales.split(",")]
+    current = run_suite(scales, args.repeat)
+
+    output = args.output or RESULTS_DIR / f"{current['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.baseline:
+        regressions = compare(load(args.baseline), current, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} cases slower than the baseline")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regression benchmark suite")
+    parser.add_argument(
+        "--scales",
+        default=",".join(str(n) for n in DEFAULT_SCALES),
+        help="Comma separated route sizes, e.g. 420,10000,1000000",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per case")
+    parser.add_argument("--output", type=Path, help="Results file")
+    parser.add_argument("--baseline", type=Path, help="Results file to compare with")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        type=Path,
+        metavar=("OLD", "NEW"),
+        help="Only compare two results files",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown reported as a regression",
+    )
+    sys.exit(main(parser.parse_args()))
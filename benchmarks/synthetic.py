@@ -0,0 +1,98 @@
+import json
+import random
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List
+
+"""
+Synthetic Santa routes for benchmarks.
+
+Routes follow the shape of the real data: a westward sweep around the globe
+over roughly 26 hours, with a short visit at every stop and a flight between
+consecutive stops.
+"""
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src" / "santa_bot"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from core.route import Route  # noqa: E402
+
+# 24 Dec 2019 10:00 UTC, the takeoff time in data/santa_en.json
+TAKEOFF_MS = 1577181600000
+FLIGHT_MS = 26 * 60 * 60 * 1000
+
+
+def _stops(n: int, seed: int):
+    rng = random.Random(seed)
+    step = FLIGHT_MS / max(n, 1)
+
+    for i in range(n):
+        progress = i / max(n - 1, 1)
+        lat = max(-89.0, min(89.0, rng.gauss(20.0, 30.0)))
+        lng = 180.0 - 360.0 * progress + rng.uniform(-5.0, 5.0)
+        lng = (lng + 180.0) % 360.0 - 180.0
+
+        arrival = int(TAKEOFF_MS + i * step)
+        departure = arrival + int(step * 0.4)
+        yield i, lat, lng, arrival, departure
+
+
+def synthetic_destinations(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"stop-{i}",
+            "arrival": arrival,
+            "departure": departure,
+            "population": 1000 + i,
+            "presentsDelivered": 100 * i,
+            "city": f"City {i}",
+            "region": f"Region {i % 200}",
+            "location": {"lat": lat, "lng": lng},
+            "details": {"timezone": 0, "photos": []},
+        }
+        for i, lat, lng, arrival, departure in _stops(n, seed)
+    ]
+
+
+"""
+Writes a data file like data/santa_en.json with `n` synthetic stops
+"""
+
+
+def write_synthetic_data(path: Path, n: int, seed: int = 0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"destinations": synthetic_destinations(n, seed)}, f)
+
+
+"""
+Builds the columns directly, which keeps million-stop routes cheap to create
+"""
+
+
+def synthetic_route(n: int, seed: int = 0) -> Route:
+    ids, cities, regions = [], [], []
+    lat, lng = array("d"), array("d")
+    arrival, departure = array("q"), array("q")
+
+    for i, stop_lat, stop_lng, stop_arrival, stop_departure in _stops(n, seed):
+        ids.append(f"stop-{i}")
+        cities.append(f"City {i}")
+        regions.append(sys.intern(f"Region {i % 200}"))
+        lat.append(stop_lat)
+        lng.append(stop_lng)
+        arrival.append(stop_arrival)
+        departure.append(stop_departure)
+
+    return Route(
+        ids=ids,
+        cities=cities,
+        regions=regions,
+        lat=lat,
+        lng=lng,
+        arrival=arrival,
+        departure=departure,
+        population=array("q", range(1000, 1000 + n)),
+        presents_delivered=array("q", range(0, 100 * n, 100)),
+    )
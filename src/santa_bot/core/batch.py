@@ -0,0 +1,120 @@
+from typing import Tuple
+
+import numpy as np
+
+from core.route import Route
+from core.tracker import EARTH_RADIUS
+
+"""
+NumPy versions of the tracker geometry, for many user coordinates at once
+(re-planning every stored subscription, bulk imports).
+Requires the optional `fast` extra: pip install santa-tracker[fast]
+
+Users are processed in chunks, so memory stays at about
+chunk_size * len(route) floats whatever the number of coordinates.
+"""
+
+DEFAULT_CHUNK_SIZE = 2048
+
+
+def _route_columns(route: Route) -> Tuple[np.ndarray, np.ndarray]:
+    lat = np.radians(np.asarray(route.lat, dtype=np.float64))
+    lng = np.radians(np.asarray(route.lng, dtype=np.float64))
+    return lat, lng
+
+
+def _haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    # Same formula as tracker.calculate_distance, on radians, broadcasting
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def _distance_matrix(user_lat, user_lon, stop_lat, stop_lng) -> np.ndarray:
+    return _haversine(user_lat[:, None], user_lon[:, None], stop_lat, stop_lng)
+
+
+def _as_radians(user_lat, user_lon) -> Tuple[np.ndarray, np.ndarray]:
+    lat = np.radians(np.atleast_1d(np.asarray(user_lat, dtype=np.float64)))
+    lon = np.radians(np.atleast_1d(np.asarray(user_lon, dtype=np.float64)))
+    if lat.shape != lon.shape:
+        raise ValueError("user_lat and user_lon must have the same shape")
+    return lat, lon
+
+
+"""
+Returns (stop indexes, distances in km) for every user coordinate.
+Ties go to the earliest stop, like find_nearest_stop.
+"""
+
+
+def find_nearest_stop_batch(
+    user_lat, user_lon, route: Route, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    lat, lon = _as_radians(user_lat, user_lon)
+    indexes = np.full(lat.shape, -1, dtype=np.int64)
+    distances = np.full(lat.shape, np.inf)
+
+    if not len(route):
+        return indexes, distances
+
+    stop_lat, stop_lng = _route_columns(route)
+
+    for start in range(0, len(lat), chunk_size):
+        end = start + chunk_size
+        matrix = _distance_matrix(lat[start:end], lon[start:end], stop_lat, stop_lng)
+
+        nearest = matrix.argmin(axis=1)
+        indexes[start:end] = nearest
+        distances[start:end] = matrix[np.arange(len(nearest)), nearest]
+
+    return indexes, distances
+
+
+"""
+Returns (ETAs in ms, segment indexes) for every user coordinate, using the
+same minimum-detour rule as calculate_arrival_time. Segment `i` is the flight
+from stop `i` to stop `i + 1`. ETAs are NaN when the route has no segments.
+"""
+
+
+def calculate_arrival_time_batch(
+    user_lat,
+    user_lon,
+    route: Route,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    lat, lon = _as_radians(user_lat, user_lon)
+    etas = np.full(lat.shape, np.nan)
+    segments = np.full(lat.shape, -1, dtype=np.int64)
+
+    if len(route) < 2:
+        return etas, segments
+
+    stop_lat, stop_lng = _route_columns(route)
+    departure = np.asarray(route.departure, dtype=np.float64)[:-1]
+    duration = np.asarray(route.arrival, dtype=np.float64)[1:] - departure
+
+    segment_lengths = np.asarray(route.segments.length_km, dtype=np.float64)
+
+    for start in range(0, len(lat), chunk_size):
+        end = start + chunk_size
+
+        # One distance per (user, stop): segment i reuses stops i and i + 1
+        matrix = _distance_matrix(lat[start:end], lon[start:end], stop_lat, stop_lng)
+        to_a = matrix[:, :-1]
+        to_b = matrix[:, 1:]
+
+        best = (to_a + to_b - segment_lengths).argmin(axis=1)
+        rows = np.arange(len(best))
+
+        dist_a_user = to_a[rows, best]
+        fraction = dist_a_user / (dist_a_user + to_b[rows, best])
+
+        etas[start:end] = departure[best] + duration[best] * fraction
+        segments[start:end] = best
+
+    return etas, segments
@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+"""
+Texts about Santa's route, and the formatting they share.
+
+Everything sent with parse_mode="Markdown" goes through `escape_markdown`,
+so names containing `_`, `*`, `` ` `` or `[` are shown as they are instead
+of breaking the message. Each route has a MessageCatalogue: the texts of a
+stop are built once, on first use, with its names already escaped and its
+arrival time already formatted. Serving a status then only fills in the
+minutes left.
+"""
+
+ARRIVAL_FORMAT = "%d %B at %H:%M"
+ARRIVAL_FORMAT_SECONDS = "%d %B at %H:%M:%S"
+
+# Characters with a meaning in Telegram's (legacy) Markdown
+_MARKDOWN_ESCAPES = str.maketrans({c: "\\" + c for c in "_*`["})
+
+PRE_FLIGHT_PREFIX = (
+    "🎅🏻 **Santa is at the North Pole!** 🏠\n\n"
+    "He is currently preparing the sleigh and feeding the reindeer.\n"
+    "🚀 **Takeoff in:** "
+)
+FINISHED_TEXT = (
+    "🎅🏻**Santa has returned to the North Pole!** 😴\n\n"
+    "Christmas is over for this year. See you next time!"
+)
+RESTING_TEXT = "Santa is currently resting at the North Pole! ❄️"
+
+
+def escape_markdown(text: str) -> str:
+    return text.translate(_MARKDOWN_ESCAPES)
+
+
+"""
+Pretty print minutes
+"""
+
+
+def prettify(minutes: int) -> str:
+    if minutes < 60:
+        return f"{minutes} minutes"
+
+    hours = minutes // 60
+    minutes = minutes % 60
+
+    if hours < 24:
+        return f"{hours}h {minutes}"
+
+    days = hours // 24
+    hours = hours % 24
+
+    return f"{days}d {hours}h {minutes}m"
+
+
+def format_arrival(t_ms: float, seconds: bool = False) -> str:
+    pattern = ARRIVAL_FORMAT_SECONDS if seconds else ARRIVAL_FORMAT
+    return datetime.fromtimestamp(t_ms / 1000).strftime(pattern)
+
+
+def city_alert(city: str, on_route: bool) -> str:
+    if on_route:
+        return f"🚨 **SANTA ALERT!** 🚨\n\nSanta has just landed in **{escape_markdown(city)}**! 🎁 Get to bed!"
+    return f"🚨 **SANTA ALERT!** 🚨\n\nSanta is estimated to be flying near **{escape_markdown(city)}** right now! 👀 Look up!"
+
+
+class MessageCatalogue:
+    def __init__(
+        self,
+        cities: Sequence[str],
+        regions: Sequence[str],
+        arrival: Sequence[int],
+        shared: Optional["MessageCatalogue"] = None,
+    ):
+        self.cities = cities
+        self.regions = regions
+        self.arrival = arrival
+
+        n = len(cities)
+        self._city: List[Optional[str]] = [None] * n
+        self._visiting: List[Optional[str]] = [None] * n
+        # Text before and after the minutes left, by the stop flown to
+        self._in_flight: List[Optional[Tuple[str, str]]] = [None] * n
+        # Arrival times do not depend on the names, catalogues of the same
+        # route share them
+        self._arrival_text: List[Optional[str]] = (
+            shared._arrival_text if shared is not None else [None] * n
+        )
+
+    """
+    The stop's city, escaped for Markdown
+    """
+
+    def city(self, index: int) -> str:
+        text = self._city[index]
+        if text is None:
+            text = self._city[index] = escape_markdown(self.cities[index])
+        return text
+
+    def arrival_text(self, index: int) -> str:
+        text = self._arrival_text[index]
+        if text is None:
+            text = self._arrival_text[index] = format_arrival(self.arrival[index])
+        return text
+
+    def pre_flight(self, minutes_left: int) -> str:
+        return PRE_FLIGHT_PREFIX + prettify(minutes_left)
+
+    def visiting(self, index: int) -> str:
+        text = self._visiting[index]
+        if text is None:
+            region = escape_markdown(self.regions[index])
+            text = self._visiting[index] = (
+                f"🎅🏻 **Santa is currently visiting {self.city(index)}!** \n\n"
+                f"He is delivering presents right now in {region}. 🎁"
+            )
+        return text
+
+    def in_flight(self, next_index: int, minutes_left: int) -> str:
+        parts = self._in_flight[next_index]
+        if parts is None:
+            # In the air before the first stop
+            origin = self.city(next_index - 1) if next_index > 0 else "the North Pole"
+            parts = self._in_flight[next_index] = (
+                f"🎅🏻 **Santa is in the air!** 🛷\n\n"
+                f"He has just left **{origin}**.\n"
+                f"He is heading to **{self.city(next_index)}** and will land in ",
+                " minutes!",
+            )
+        return f"{parts[0]}{minutes_left}{parts[1]}"
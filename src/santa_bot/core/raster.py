@@ -0,0 +1,123 @@
+import math
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.batch import calculate_arrival_time_batch
+from core.route import Route
+
+"""
+Precomputed global ETA grid.
+Requires the optional `fast` extra: pip install santa-tracker[fast]
+
+Each grid node stores the exact ETA (as an offset from takeoff, so it does
+not depend on the year shift) and the segment that produced it. A query
+interpolates the four surrounding nodes bilinearly. When those nodes
+disagree on the segment, the query is near a boundary where the best segment
+changes, and interpolating would be wrong. The caller then falls back to the
+exact computation.
+
+The grid is saved as a single (2, rows, cols) .npy file and memory-mapped
+on load.
+"""
+
+ETA_CHANNEL = 0
+SEGMENT_CHANNEL = 1
+
+
+class EtaRaster:
+    def __init__(self, grid: np.ndarray):
+        self.grid = grid
+        rows, cols = grid.shape[1:]
+        self.lat_step = 180.0 / (rows - 1)
+        self.lon_step = 360.0 / (cols - 1)
+
+    @classmethod
+    def build(cls, route: Route, resolution: float = 0.25) -> "EtaRaster":
+        rows = int(round(180.0 / resolution)) + 1
+        cols = int(round(360.0 / resolution)) + 1
+        lats = np.linspace(-90.0, 90.0, rows)
+        lons = np.linspace(-180.0, 180.0, cols)
+
+        grid = np.empty((2, rows, cols), dtype=np.float64)
+        takeoff = route.departure[0]
+
+        for row, lat in enumerate(lats):
+            etas, segments = calculate_arrival_time_batch(
+                np.full(cols, lat), lons, route
+            )
+            grid[ETA_CHANNEL, row] = etas - takeoff
+            grid[SEGMENT_CHANNEL, row] = segments
+
+        return cls(grid)
+
+    @classmethod
+    def load(cls, path: Path) -> "EtaRaster":
+        return cls(np.load(path, mmap_mode="r"))
+
+    def save(self, path: Path):
+        np.save(path, np.asarray(self.grid))
+
+    """
+    Returns (ETA in ms, segment index), or None when the point is close to
+    a change of segment and must be computed exactly
+    """
+
+    def lookup(
+        self, lat: float, lon: float, route: Route
+    ) -> Optional[Tuple[float, int]]:
+        lon = (lon + 180.0) % 360.0 - 180.0
+        y = (min(max(lat, -90.0), 90.0) + 90.0) / self.lat_step
+        x = (lon + 180.0) / self.lon_step
+
+        rows, cols = self.grid.shape[1:]
+        row = min(int(math.floor(y)), rows - 2)
+        col = min(int(math.floor(x)), cols - 2)
+        dy, dx = y - row, x - col
+
+        segments = self.grid[SEGMENT_CHANNEL, row : row + 2, col : col + 2]
+        segment = segments[0, 0]
+        if (segments != segment).any():
+            return None
+
+        etas = self.grid[ETA_CHANNEL, row : row + 2, col : col + 2]
+        offset = (
+            etas[0, 0] * (1 - dy) * (1 - dx)
+            + etas[0, 1] * (1 - dy) * dx
+            + etas[1, 0] * dy * (1 - dx)
+            + etas[1, 1] * dy * dx
+        )
+        return route.departure[0] + float(offset), int(segment)
+
+    """
+    Compares the raster with the exact computation on random points
+    """
+
+    def error_report(
+        self, route: Route, samples: int = 20_000, seed: int = 0
+    ) -> Dict[str, float]:
+        rng = np.random.default_rng(seed)
+
+        # Uniform on the sphere rather than on the lat/lon rectangle
+        lats = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, samples)))
+        lons = rng.uniform(-180.0, 180.0, samples)
+        exact, _ = calculate_arrival_time_batch(lats, lons, route)
+
+        errors = []
+        fallbacks = 0
+        for lat, lon, expected in zip(lats, lons, exact):
+            found = self.lookup(lat, lon, route)
+            if found is None:
+                fallbacks += 1
+                continue
+            errors.append(abs(found[0] - expected))
+
+        errors_s = np.asarray(errors) / 1000
+        return {
+            "samples": samples,
+            "fallback_rate": fallbacks / samples,
+            "max_error_s": float(errors_s.max()) if len(errors_s) else 0.0,
+            "mean_error_s": float(errors_s.mean()) if len(errors_s) else 0.0,
+            "p99_error_s": float(np.percentile(errors_s, 99)) if len(errors_s) else 0.0,
+        }
@@ -0,0 +1,231 @@
+import sys
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from core.messages import MessageCatalogue
+from core.segments import SegmentTable
+from core.spatial import SphereIndex
+from core.timeline import Timeline
+
+"""
+Compact, column oriented representation of Santa's route.
+
+Every numeric field lives in its own typed array and city/region names are
+interned, so a stop costs a few dozen bytes instead of a full dict with its
+photo list. The heavy `details` section (photos, attributions, timezone) is
+only read through `details_loader` when somebody actually asks for it.
+"""
+
+# Typed array, or a memoryview over a mapped route snapshot
+Column = Union[array, memoryview]
+
+
+class RouteNames:
+    """
+    City and region names of every stop in one language, and the messages
+    built from them. Everything else about the route is shared by all
+    languages.
+    """
+
+    def __init__(
+        self,
+        locale: str,
+        cities: List[str],
+        regions: List[str],
+        messages: MessageCatalogue,
+        city_index: Optional[Dict[str, int]] = None,
+    ):
+        self.locale = locale
+        self.cities = cities
+        self.regions = regions
+        self.messages = messages
+        if city_index is None:
+            city_index = {city: i for i, city in enumerate(cities)}
+        self._city_index = city_index
+
+    def index_of_city(self, city: str) -> Optional[int]:
+        return self._city_index.get(city)
+
+
+class Route:
+    def __init__(
+        self,
+        ids: List[str],
+        cities: List[str],
+        regions: List[str],
+        lat: Column,
+        lng: Column,
+        arrival: Column,
+        departure: Column,
+        population: Column,
+        presents_delivered: Column,
+        details_loader: Optional[Callable[[int], Dict[str, Any]]] = None,
+    ):
+        self.ids = ids
+        self.cities = cities
+        self.regions = regions
+        self.lat = lat
+        self.lng = lng
+        self.arrival = arrival
+        self.departure = departure
+        self.population = population
+        self.presents_delivered = presents_delivered
+
+        self._details_loader = details_loader
+        self._details_cache: Dict[int, Dict[str, Any]] = {}
+        self._timeline: Optional[Timeline] = None
+        self._stop_index: Optional[SphereIndex] = None
+        self._segment_index: Optional[SphereIndex] = None
+        self._segments: Optional[SegmentTable] = None
+        self._messages: Optional[MessageCatalogue] = None
+
+        # Later stops win, like the old `{stop["city"]: stop}` lookup did
+        self._city_index = {city: i for i, city in enumerate(cities)}
+
+    @classmethod
+    def from_destinations(
+        cls,
+        destinations: List[Dict[str, Any]],
+        details_loader: Optional[Callable[[int], Dict[str, Any]]] = None,
+    ) -> "Route":
+        intern = sys.intern
+
+        return cls(
+            ids=[intern(stop["id"]) for stop in destinations],
+            cities=[intern(stop["city"]) for stop in destinations],
+            regions=[intern(stop["region"]) for stop in destinations],
+            lat=array("d", (stop["location"]["lat"] for stop in destinations)),
+            lng=array("d", (stop["location"]["lng"] for stop in destinations)),
+            arrival=array("q", (stop["arrival"] for stop in destinations)),
+            departure=array("q", (stop["departure"] for stop in destinations)),
+            population=array("q", (stop["population"] for stop in destinations)),
+            presents_delivered=array(
+                "q", (stop["presentsDelivered"] for stop in destinations)
+            ),
+            details_loader=details_loader,
+        )
+
+    def __len__(self) -> int:
+        return len(self.arrival)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        return self.stop(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.stop(i)
+
+    """
+    Builds a fresh dict for a single stop, shaped like the original JSON entry
+    (minus `details`). Callers are free to modify it, the route is untouched.
+    """
+
+    def stop(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("route index out of range")
+
+        return {
+            "index": index,
+            "id": self.ids[index],
+            "arrival": self.arrival[index],
+            "departure": self.departure[index],
+            "population": self.population[index],
+            "presentsDelivered": self.presents_delivered[index],
+            "city": self.cities[index],
+            "region": self.regions[index],
+            "location": {"lat": self.lat[index], "lng": self.lng[index]},
+        }
+
+    @property
+    def timeline(self) -> Timeline:
+        if self._timeline is None:
+            self._timeline = Timeline(self.arrival, self.departure)
+        return self._timeline
+
+    @property
+    def stop_index(self) -> SphereIndex:
+        if self._stop_index is None:
+            self._stop_index = SphereIndex.from_points(self.lat, self.lng)
+        return self._stop_index
+
+    """
+    Item `i` of the segment index is the flight from stop `i` to stop `i + 1`
+    """
+
+    @property
+    def segment_index(self) -> SphereIndex:
+        if self._segment_index is None:
+            self._segment_index = SphereIndex.from_arcs(self.lat, self.lng)
+        return self._segment_index
+
+    @property
+    def segments(self) -> SegmentTable:
+        if self._segments is None:
+            self._segments = SegmentTable(
+                self.lat, self.lng, self.arrival, self.departure
+            )
+        return self._segments
+
+    @property
+    def messages(self) -> MessageCatalogue:
+        if self._messages is None:
+            self._messages = MessageCatalogue(self.cities, self.regions, self.arrival)
+        return self._messages
+
+    """
+    The route's own names, in `locale`
+    """
+
+    def names(self, locale: str) -> RouteNames:
+        return RouteNames(
+            locale, self.cities, self.regions, self.messages, self._city_index
+        )
+
+    """
+    Names of the stops in another language, in route order
+    """
+
+    def localized(self, locale: str, cities: List[str], regions: List[str]):
+        messages = MessageCatalogue(cities, regions, self.arrival, self.messages)
+        return RouteNames(locale, cities, regions, messages)
+
+    """
+    Builds the derived indexes up front, so the first request does not pay
+    for them
+    """
+
+    def build_indexes(self):
+        _ = self.timeline
+        _ = self.stop_index
+        _ = self.segment_index
+        _ = self.segments
+        _ = self.messages
+
+    """
+    Drops the time based indexes. Must be called after the timestamp columns
+    are modified in place.
+    """
+
+    def invalidate(self):
+        self._timeline = None
+        self._segments = None
+        self._messages = None
+
+    def index_of_city(self, city: str) -> Optional[int]:
+        return self._city_index.get(city)
+
+    def details(self, index: int) -> Dict[str, Any]:
+        if index in self._details_cache:
+            return self._details_cache[index]
+
+        details = self._details_loader(index) if self._details_loader else {}
+        self._details_cache[index] = details
+        return details
+
+    def photo_url(self, index: int) -> Optional[str]:
+        photos = self.details(index).get("photos")
+        if photos:
+            return photos[0]["url"]
+        return None
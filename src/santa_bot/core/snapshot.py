@@ -0,0 +1,236 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.route import Route
+
+"""
+Binary snapshot of the route, compiled from the JSON data file.
+
+Layout (little endian, every section 8-byte aligned):
+
+    header      magic, version, stop count, source file size and mtime
+    sections    (offset, length) of each section below
+    lat, lng                    float64 per stop
+    arrival, departure          int64 per stop
+    population, presents        int64 per stop
+    ids, cities, regions        uint32 per stop, index into the string table
+    string offsets, strings     uint64 offsets into UTF-8 text
+    detail offsets, details     uint64 offsets into one JSON object per stop
+
+The file is memory-mapped copy-on-write: on little endian hosts the numeric
+columns are used as they are, without parsing, and can still be shifted in
+place to the current year. Big endian hosts byte-swap them when writing, and
+into copies when reading.
+Details (photos, attributions) are only decoded for the stops that ask.
+The recorded size and mtime of the JSON file tell when the snapshot is stale.
+"""
+
+MAGIC = b"SANTARTE"
+VERSION = 1
+
+# The file stores numbers little endian, like most hosts
+NATIVE = sys.byteorder == "little"
+
+HEADER = struct.Struct("<8sIIqq")
+SECTION = struct.Struct("<QQ")
+
+# (name, array typecode)
+SECTIONS: List[Tuple[str, str]] = [
+    ("lat", "d"),
+    ("lng", "d"),
+    ("arrival", "q"),
+    ("departure", "q"),
+    ("population", "q"),
+    ("presents_delivered", "q"),
+    ("ids", "I"),
+    ("cities", "I"),
+    ("regions", "I"),
+    ("string_offsets", "Q"),
+    ("strings", "B"),
+    ("detail_offsets", "Q"),
+    ("details", "B"),
+]
+# Sections with one value per stop
+STOP_COLUMNS = [name for name, _ in SECTIONS[:9]]
+# Where the header and the section table end
+TABLE_END = HEADER.size + SECTION.size * len(SECTIONS)
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is not one this version can read."""
+
+
+def _string_table(values: List[str]) -> Tuple[Dict[str, int], array, bytes]:
+    index: Dict[str, int] = {}
+    offsets = array("Q", [0])
+    blob = bytearray()
+
+    for value in values:
+        if value in index:
+            continue
+        index[value] = len(index)
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    return index, offsets, bytes(blob)
+
+
+"""
+Compiles the `destinations` of the JSON data file into a snapshot at `path`.
+The source file is identified by its size and mtime.
+"""
+
+
+def write_snapshot(
+    path: Path,
+    destinations: List[Dict[str, Any]],
+    source_size: int,
+    source_mtime_ns: int,
+):
+    ids = [stop["id"] for stop in destinations]
+    cities = [stop["city"] for stop in destinations]
+    regions = [stop["region"] for stop in destinations]
+    index, string_offsets, strings = _string_table(ids + cities + regions)
+
+    detail_offsets = array("Q", [0])
+    details = bytearray()
+    for stop in destinations:
+        details += json.dumps(
+            stop.get("details", {}), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        detail_offsets.append(len(details))
+
+    sections = {
+        "lat": array("d", (stop["location"]["lat"] for stop in destinations)),
+        "lng": array("d", (stop["location"]["lng"] for stop in destinations)),
+        "arrival": array("q", (stop["arrival"] for stop in destinations)),
+        "departure": array("q", (stop["departure"] for stop in destinations)),
+        "population": array("q", (stop["population"] for stop in destinations)),
+        "presents_delivered": array(
+            "q", (stop["presentsDelivered"] for stop in destinations)
+        ),
+        "ids": array("I", (index[value] for value in ids)),
+        "cities": array("I", (index[value] for value in cities)),
+        "regions": array("I", (index[value] for value in regions)),
+        "string_offsets": string_offsets,
+        "strings": strings,
+        "detail_offsets": detail_offsets,
+        "details": bytes(details),
+    }
+
+    offset = TABLE_END
+    table = []
+    payload = bytearray()
+    for name, _ in SECTIONS:
+        data = sections[name]
+        if isinstance(data, array):
+            if not NATIVE and data.itemsize > 1:
+                data = array(data.typecode, data)
+                data.byteswap()
+            raw = data.tobytes()
+        else:
+            raw = data
+
+        padding = -(offset + len(payload)) % 8
+        payload += b"\0" * padding
+        table.append((offset + len(payload), len(raw)))
+        payload += raw
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(
+            HEADER.pack(MAGIC, VERSION, len(destinations), source_size, source_mtime_ns)
+        )
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class RouteSnapshot:
+    def __init__(self, path: Path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < TABLE_END:
+                raise SnapshotError(f"{path} is too short")
+            # Copy-on-write: the timestamps can be shifted in memory only
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, version, self.stops, self.source_size, self.source_mtime_ns = (
+            HEADER.unpack_from(self._mmap)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"{path} is not a version {VERSION} route snapshot")
+
+        view = memoryview(self._mmap)
+        self._sections: Dict[str, memoryview] = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(
+                self._mmap, HEADER.size + i * SECTION.size
+            )
+            if offset + length > len(self._mmap):
+                raise SnapshotError(f"{path} is truncated")
+            if length % struct.calcsize(typecode):
+                raise SnapshotError(f"{path} has a corrupt {name} section")
+
+            section = view[offset : offset + length]
+            if NATIVE or typecode == "B":
+                self._sections[name] = section.cast(typecode)
+            else:
+                column = array(typecode, bytes(section))
+                column.byteswap()
+                self._sections[name] = memoryview(column)
+
+        for name in STOP_COLUMNS:
+            if len(self._sections[name]) != self.stops:
+                raise SnapshotError(f"{path} has a corrupt {name} section")
+
+        self._strings: Optional[List[str]] = None
+
+    def is_current(self, source: Path) -> bool:
+        stat = source.stat()
+        return (
+            stat.st_size == self.source_size
+            and stat.st_mtime_ns == self.source_mtime_ns
+        )
+
+    def _string(self, i: int) -> str:
+        offsets = self._sections["string_offsets"]
+        raw = self._sections["strings"][offsets[i] : offsets[i + 1]]
+        return sys.intern(bytes(raw).decode("utf-8"))
+
+    def _names(self, section: str) -> List[str]:
+        if self._strings is None:
+            count = len(self._sections["string_offsets"]) - 1
+            self._strings = [self._string(i) for i in range(count)]
+        strings = self._strings
+        return [strings[i] for i in self._sections[section]]
+
+    def details(self, index: int) -> Dict[str, Any]:
+        if not 0 <= index < self.stops:
+            return {}
+        offsets = self._sections["detail_offsets"]
+        raw = self._sections["details"][offsets[index] : offsets[index + 1]]
+        return json.loads(bytes(raw))
+
+    def route(self) -> Route:
+        sections = self._sections
+        return Route(
+            ids=self._names("ids"),
+            cities=self._names("cities"),
+            regions=self._names("regions"),
+            lat=sections["lat"],
+            lng=sections["lng"],
+            arrival=sections["arrival"],
+            departure=sections["departure"],
+            population=sections["population"],
+            presents_delivered=sections["presents_delivered"],
+            details_loader=self.details,
+        )
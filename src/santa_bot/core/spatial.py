@@ -0,0 +1,235 @@
+import heapq
+import math
+from array import array
+from typing import Callable, List, Sequence, Tuple
+
+"""
+Spatial index over the route, built once per route.
+
+Items are balls on the unit sphere: a centre (unit vector) and an angular
+radius. Stops are balls of radius 0, flight segments are the smallest ball
+around the great-circle arc between two stops. The balls are stored in a
+KD-tree over their 3D centres, and every node keeps the bounding box of its
+centres and the largest radius below it.
+
+Searches are branch and bound: the caller supplies a lower bound in terms of
+(angular distance to the centre, radius) and an exact evaluation for a
+single item. Only items whose bound can still beat the current best are
+evaluated, so results match a brute-force scan over every item.
+"""
+
+# Slack subtracted from every angular bound (radians, ~0.6 m on Earth) so
+# float error in the vector maths can never prune the real best item
+ANGLE_TOLERANCE = 1e-7
+
+LEAF_SIZE = 16
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    cos_lat = math.cos(lat_rad)
+    return (cos_lat * math.cos(lon_rad), cos_lat * math.sin(lon_rad), math.sin(lat_rad))
+
+
+def _chord_to_angle(chord: float) -> float:
+    return 2 * math.asin(min(1.0, chord / 2))
+
+
+class SphereIndex:
+    def __init__(
+        self,
+        x: Sequence[float],
+        y: Sequence[float],
+        z: Sequence[float],
+        radius: Sequence[float],
+    ):
+        self.x = array("d", x)
+        self.y = array("d", y)
+        self.z = array("d", z)
+        self.radius = array("d", radius)
+
+        # Node layout: (min xyz, max xyz, max radius, left, right, start, end)
+        self._nodes: List[tuple] = []
+        self._order = array("l", range(len(self.x)))
+        if len(self.x):
+            self._build(0, len(self.x))
+
+    @classmethod
+    def from_points(cls, lat: Sequence[float], lng: Sequence[float]) -> "SphereIndex":
+        vectors = [to_unit_vector(a, b) for a, b in zip(lat, lng)]
+        return cls(
+            [v[0] for v in vectors],
+            [v[1] for v in vectors],
+            [v[2] for v in vectors],
+            [0.0] * len(vectors),
+        )
+
+    """
+    One item per consecutive pair of points, covering the great-circle arc
+    between them
+    """
+
+    @classmethod
+    def from_arcs(cls, lat: Sequence[float], lng: Sequence[float]) -> "SphereIndex":
+        x, y, z, radius = [], [], [], []
+        vectors = [to_unit_vector(a, b) for a, b in zip(lat, lng)]
+
+        for a, b in zip(vectors, vectors[1:]):
+            mx, my, mz = a[0] + b[0], a[1] + b[1], a[2] + b[2]
+            norm = math.sqrt(mx * mx + my * my + mz * mz)
+
+            # Nearly antipodal endpoints have no stable midpoint
+            if norm < 1e-9:
+                centre = a
+            else:
+                centre = (mx / norm, my / norm, mz / norm)
+
+            reach = max(math.dist(centre, a), math.dist(centre, b))
+            x.append(centre[0])
+            y.append(centre[1])
+            z.append(centre[2])
+            radius.append(_chord_to_angle(reach) + ANGLE_TOLERANCE)
+
+        return cls(x, y, z, radius)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def _build(self, start: int, end: int) -> int:
+        order = self._order
+        items = order[start:end]
+        xs = [self.x[i] for i in items]
+        ys = [self.y[i] for i in items]
+        zs = [self.z[i] for i in items]
+        lo = (min(xs), min(ys), min(zs))
+        hi = (max(xs), max(ys), max(zs))
+        max_radius = max(self.radius[i] for i in items)
+
+        node_id = len(self._nodes)
+        self._nodes.append(())
+
+        left = right = -1
+        if end - start > LEAF_SIZE:
+            # Split on the widest axis at the median
+            spreads = [hi[axis] - lo[axis] for axis in range(3)]
+            axis = spreads.index(max(spreads))
+            column = (self.x, self.y, self.z)[axis]
+            order[start:end] = array("l", sorted(items, key=column.__getitem__))
+
+            middle = (start + end) // 2
+            left = self._build(start, middle)
+            right = self._build(middle, end)
+
+        self._nodes[node_id] = (lo, hi, max_radius, left, right, start, end)
+        return node_id
+
+    def _node_angle(self, node: tuple, q: Tuple[float, float, float]) -> float:
+        lo, hi = node[0], node[1]
+        chord_sq = 0.0
+        for axis in range(3):
+            if q[axis] < lo[axis]:
+                chord_sq += (lo[axis] - q[axis]) ** 2
+            elif q[axis] > hi[axis]:
+                chord_sq += (q[axis] - hi[axis]) ** 2
+        return _chord_to_angle(math.sqrt(chord_sq)) - ANGLE_TOLERANCE
+
+    def _item_angle(self, item: int, q: Tuple[float, float, float]) -> float:
+        chord = math.sqrt(
+            (self.x[item] - q[0]) ** 2
+            + (self.y[item] - q[1]) ** 2
+            + (self.z[item] - q[2]) ** 2
+        )
+        return _chord_to_angle(chord) - ANGLE_TOLERANCE
+
+    """
+    Returns the `k` smallest (value, item) pairs, ordered by value and then by
+    item, where value is `evaluate(item)`.
+    `lower_bound(angle, radius)` must never exceed `evaluate` for an item at
+    that angular distance with that radius, and must not grow with the radius.
+    """
+
+    def branch_and_bound(
+        self,
+        lat: float,
+        lon: float,
+        lower_bound: Callable[[float, float], float],
+        evaluate: Callable[[int], float],
+        k: int = 1,
+    ) -> List[Tuple[float, int]]:
+        if not self._nodes or k <= 0:
+            return []
+
+        q = to_unit_vector(lat, lon)
+        nodes = self._nodes
+
+        # Max-heap of the k best items so far, as (-value, -item)
+        best: List[Tuple[float, int]] = []
+        worst = math.inf
+
+        root = nodes[0]
+        queue = [(lower_bound(self._node_angle(root, q), root[2]), 0)]
+
+        while queue:
+            bound, node_id = heapq.heappop(queue)
+            if bound > worst:
+                break
+
+            _, _, _, left, right, start, end = nodes[node_id]
+
+            if left == -1:
+                for item in self._order[start:end]:
+                    item_bound = lower_bound(
+                        self._item_angle(item, q), self.radius[item]
+                    )
+                    if item_bound > worst:
+                        continue
+
+                    value = evaluate(item)
+                    entry = (-value, -item)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+                    else:
+                        continue
+
+                    if len(best) == k:
+                        worst = -best[0][0]
+                continue
+
+            for child_id in (left, right):
+                child = nodes[child_id]
+                child_bound = lower_bound(self._node_angle(child, q), child[2])
+                if child_bound <= worst:
+                    heapq.heappush(queue, (child_bound, child_id))
+
+        return sorted((-value, -item) for value, item in best)
+
+    """
+    Items whose ball comes within `max_angle` radians of the point. This is a
+    superset of the items that are actually that close.
+    """
+
+    def within(self, lat: float, lon: float, max_angle: float) -> List[int]:
+        if not self._nodes:
+            return []
+
+        q = to_unit_vector(lat, lon)
+        found = []
+        stack = [0]
+
+        while stack:
+            lo, hi, max_radius, left, right, start, end = self._nodes[stack.pop()]
+            if self._node_angle((lo, hi), q) - max_radius > max_angle:
+                continue
+
+            if left == -1:
+                for item in self._order[start:end]:
+                    if self._item_angle(item, q) - self.radius[item] <= max_angle:
+                        found.append(item)
+            else:
+                stack.append(left)
+                stack.append(right)
+
+        return sorted(found)
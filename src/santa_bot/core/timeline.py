@@ -0,0 +1,87 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+"""
+Time index over the route, built once per route.
+
+Stops are visited in order, so arrivals are sorted. Departures are made
+monotonic with a running maximum, which lets a single bisect find the first
+stop Santa has not yet left. That is exactly where the old linear scan in
+`get_santa_status` stopped.
+"""
+
+# Phases returned by `Timeline.locate`
+PRE_FLIGHT = "pre_flight"
+VISITING = "visiting"
+IN_FLIGHT = "in_flight"
+FINISHED = "finished"
+
+
+class Timeline:
+    def __init__(self, arrival: array, departure: array):
+        self.arrival = arrival
+        self.departure = departure
+        self._departure_max = array("q", accumulate(departure, max))
+
+    def __len__(self) -> int:
+        return len(self.arrival)
+
+    """
+    Returns (phase, current index, next index) for the given time.
+    Indexes are None when there is no such stop.
+    """
+
+    def locate(self, t_ms: float) -> Tuple[str, Optional[int], Optional[int]]:
+        n = len(self.arrival)
+
+        if t_ms < self.departure[0]:
+            return PRE_FLIGHT, 0, 1 if n > 1 else None
+
+        if t_ms > self.arrival[-1]:
+            return FINISHED, 0, None
+
+        # First stop whose departure has not passed yet
+        i = bisect_left(self._departure_max, t_ms)
+        if i == n:
+            return FINISHED, None, None
+
+        if self.arrival[i] <= t_ms:
+            return VISITING, i, i + 1 if i + 1 < n else None
+
+        return IN_FLIGHT, i - 1 if i > 0 else None, i
+
+    """
+    Returns the timestamp of the next arrival or departure after `t_ms`,
+    i.e. the next moment `locate` can change its answer.
+    """
+
+    def next_change(self, t_ms: float) -> Optional[int]:
+        i = bisect_right(self.arrival, t_ms)
+        j = bisect_right(self._departure_max, t_ms)
+
+        candidates = []
+        if i < len(self.arrival):
+            candidates.append(self.arrival[i])
+        if j < len(self._departure_max):
+            candidates.append(self._departure_max[j])
+
+        return min(candidates) if candidates else None
+
+    """
+    Indexes of the next `count` stops Santa will arrive at after `t_ms`
+    """
+
+    def upcoming(self, t_ms: float, count: int) -> List[int]:
+        start = bisect_right(self.arrival, t_ms)
+        return list(range(start, min(start + count, len(self.arrival))))
+
+    """
+    Indexes of the stops with an arrival inside [t0_ms, t1_ms]
+    """
+
+    def window(self, t0_ms: float, t1_ms: float) -> List[int]:
+        start = bisect_left(self.arrival, t0_ms)
+        end = bisect_right(self.arrival, t1_ms)
+        return list(range(start, end))
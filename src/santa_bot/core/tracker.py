@@ -2,6 +2,12 @@ import math
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from core.messages import FINISHED_TEXT, RESTING_TEXT, MessageCatalogue
+from core.route import Route
+from core.segments import SegmentMatch
+from core.spatial import to_unit_vector
+from core.timeline import IN_FLIGHT, VISITING
+
 """
 Find distance between two points using Haversine Formula:
     hav(theta) = hav(delta(phi)) + cos(phi1)cos(phi2)hav(delta(lambda))
@@ -43,164 +49,144 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return distance
 
 
-def find_nearest_stop(
-    user_lat: float, user_lon: float, route: List[Dict[str, Any]]
-) -> Optional[Dict[str, Any]]:
-    if not route:
-        return None
-
-    nearest_stop = None
-    min_distance = float("inf")
+"""
+Returns the `k` stops closest to the user, nearest first.
+Ties are broken by route order, like a plain scan over every stop.
+"""
 
-    for stop in route:
-        stop_lat = stop["location"]["lat"]
-        stop_lon = stop["location"]["lng"]
-        distance = calculate_distance(user_lat, user_lon, stop_lat, stop_lon)
 
-        if distance < min_distance:
-            min_distance = distance
-            nearest_stop = stop
-            nearest_stop["distance_from_user_km"] = round(distance, 2)
+def find_nearest_stops(
+    user_lat: float, user_lon: float, route: Route, k: int = 1
+) -> List[Dict[str, Any]]:
+    lats, lngs = route.lat, route.lng
 
-    return nearest_stop
+    found = route.stop_index.branch_and_bound(
+        user_lat,
+        user_lon,
+        lower_bound=lambda angle, radius: EARTH_RADIUS * angle,
+        evaluate=lambda i: calculate_distance(user_lat, user_lon, lats[i], lngs[i]),
+        k=k,
+    )
 
+    nearest_stops = []
+    for distance, i in found:
+        # `stop` returns a fresh dict, so the route itself is never modified
+        stop = route.stop(i)
+        stop["distance_from_user_km"] = round(distance, 2)
+        nearest_stops.append(stop)
 
-"""
-Pretty print minutes
-"""
+    return nearest_stops
 
 
-def prettify(minutes: int) -> str:
-    if minutes < 60:
-        return f"{minutes} minutes"
+def find_nearest_stop(
+    user_lat: float, user_lon: float, route: Route
+) -> Optional[Dict[str, Any]]:
+    nearest_stops = find_nearest_stops(user_lat, user_lon, route, k=1)
+    return nearest_stops[0] if nearest_stops else None
 
-    hours = minutes // 60
-    minutes = minutes % 60
 
-    if hours < 24:
-        return f"{hours}h {minutes}"
+"""
+Returns the indexes of the flight segments (stop i -> stop i + 1) that may
+pass within `max_km` of the user. Candidates are a superset of the segments
+that actually do.
+"""
 
-    days = hours // 24
-    hours = hours % 24
 
-    return f"{days}d {hours}h {minutes}m"
+def segments_within(
+    user_lat: float, user_lon: float, route: Route, max_km: float
+) -> List[int]:
+    return route.segment_index.within(user_lat, user_lon, max_km / EARTH_RADIUS)
 
 
 """
 Determines Santa's status based on a specific time.
+The stop is found with a bisect on the route's timeline index. The text
+comes from `messages`, the route's own catalogue by default.
 """
 
 
 def get_santa_status(
-    route: List[Dict[str, Any]], current_time_ms: Optional[float] = None
+    route: Route,
+    current_time_ms: Optional[float] = None,
+    messages: Optional[MessageCatalogue] = None,
 ) -> Tuple[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     if current_time_ms is None:
         current_time_ms = time.time() * 1000
-
-    msg = ""
+    if messages is None:
+        messages = route.messages
 
     # Find current status
-    start_point = route[0]
-    end_point = route[-1]
+    start_departure = route.departure[0]
+    end_arrival = route.arrival[-1]
 
     # Before Christmas
-    if current_time_ms < start_point["departure"]:
-        time_diff = start_point["departure"] - current_time_ms
+    if current_time_ms < start_departure:
+        time_diff = start_departure - current_time_ms
         minutes_left = int(time_diff / 1000 / 60)
-        time_str = prettify(minutes_left)  # TODO: pretty print this
-
-        msg = (
-            f"🎅🏻 **Santa is at the North Pole!** 🏠\n\n"
-            f"He is currently preparing the sleigh and feeding the reindeer.\n"
-            f"🚀 **Takeoff in:** {time_str}"
-        )
-        return msg, start_point, route[1]
+        return messages.pre_flight(minutes_left), route.stop(0), route.stop(1)
 
     # After Christmas
-    if current_time_ms > end_point["arrival"]:
-        msg = "🎅🏻**Santa has returned to the North Pole!** 😴\n\nChristmas is over for this year. See you next time!"
-        return msg, start_point, None
+    if current_time_ms > end_arrival:
+        return FINISHED_TEXT, route.stop(0), None
 
     # Active Scenario
-    current_stop = None
-    next_stop = None
-    for i, stop in enumerate(route):
-        arrival = stop["arrival"]
-        departure = stop["departure"]
-
-        # Santa is AT this stop
-        if arrival <= current_time_ms <= departure:
-            current_stop = stop
-            next_stop = route[i + 1] if i + 1 < len(route) else None
-            # Build message
-            msg = (
-                f"🎅🏻 **Santa is currently visiting {current_stop['city']}!** \n\n"
-                f"He is delivering presents right now in {current_stop['region']}. 🎁"
-            )
-            return msg, current_stop, next_stop
-        # Santa has passed, but has not reached the next
-        if current_time_ms < arrival:
-            next_stop = stop
-            current_stop = route[i - 1] if i > 0 else None
-
-            minutes_left = int((next_stop["arrival"] - current_time_ms) / 1000 / 60)
-
-            # Edge case: in the air before the first stop
-            origin = current_stop["city"] if current_stop else "the North Pole"
-
-            # Build message
-            msg = (
-                f"🎅🏻 **Santa is in the air!** 🛷\n\n"
-                f"He has just left **{origin}**.\n"
-                f"He is heading to **{next_stop['city']}** and will land in {minutes_left} minutes!"
-            )
-            return msg, current_stop, next_stop
-
-    return "Santa is currently resting at the North Pole! ❄️", None, None
+    phase, current_index, next_index = route.timeline.locate(current_time_ms)
+    current_stop = route.stop(current_index) if current_index is not None else None
+    next_stop = route.stop(next_index) if next_index is not None else None
 
+    # Santa is AT this stop
+    if phase == VISITING and current_stop:
+        return messages.visiting(current_index), current_stop, next_stop
 
-"""
-Returns the arrival time in a custom city.
-If the city is in the dataset, return the timestamp from the dataset,
-else, use interpolate previous and next stop
-"""
+    # Santa has passed, but has not reached the next
+    if phase == IN_FLIGHT and next_stop:
+        minutes_left = int((next_stop["arrival"] - current_time_ms) / 1000 / 60)
+        msg = messages.in_flight(next_index, minutes_left)
+        return msg, current_stop, next_stop
 
+    return RESTING_TEXT, None, None
 
-def calculate_arrival_time(
-    user_lat: float, user_lon: float, route: List[Dict[str, Any]]
-) -> Optional[float]:
-    if not route or len(route) < 2:
-        return None
 
-    best_arrival_time = None
-    min_detour = float("inf")  # for the cities that are not in the dataset
+"""
+Finds the flight segment Santa passes closest to the user, measured as the
+detour needed to fly over them, and where along it he passes them.
+Only the segments the spatial index cannot rule out are evaluated.
+"""
 
-    # Iterate through all segments
-    for i in range(len(route) - 1):
-        stop_a = route[i]
-        stop_b = route[i + 1]
 
-        # Coordinates
-        lat_a, lon_a = stop_a["location"]["lat"], stop_a["location"]["lng"]
-        lat_b, lon_b = stop_b["location"]["lat"], stop_b["location"]["lng"]
+def match_segment(
+    user_lat: float, user_lon: float, route: Route
+) -> Optional[SegmentMatch]:
+    if len(route) < 2:
+        return None
 
-        # Distances
-        dist_a_b = calculate_distance(lat_a, lon_a, lat_b, lon_b)
-        dist_a_user = calculate_distance(lat_a, lon_a, user_lat, user_lon)
-        dist_user_b = calculate_distance(user_lat, user_lon, lat_b, lon_b)
+    table = route.segments
+    user = to_unit_vector(user_lat, user_lon)
+    distances: Dict[int, float] = {}
+
+    # The user is at least `angle` from the centre of a segment whose ends are
+    # at most `radius` from it, so the detour is at least 2 * (angle - 2 * radius)
+    found = route.segment_index.branch_and_bound(
+        user_lat,
+        user_lon,
+        lower_bound=lambda angle, radius: 2 * EARTH_RADIUS * (angle - 2 * radius),
+        evaluate=lambda i: table.detour(i, user, distances),
+    )
+    if not found:
+        return None
 
-        # Detour is how much extra distance is added by visiting the user
-        detour = (dist_a_user + dist_user_b) - dist_a_b
+    return table.match(found[0][1], user, distances)
 
-        if detour < min_detour:
-            min_detour = detour
 
-            # Assuming constant velocity
-            fraction = dist_a_user / (dist_a_user + dist_user_b)
-            dep_a = stop_a["departure"]
-            arr_b = stop_b["arrival"]
-            duration = arr_b - dep_a
+"""
+Returns the arrival time in a custom city.
+If the city is in the dataset, return the timestamp from the dataset,
+else, use interpolate previous and next stop
+"""
 
-            best_arrival_time = dep_a + (duration * fraction)
 
-    return best_arrival_time
+def calculate_arrival_time(
+    user_lat: float, user_lon: float, route: Route
+) -> Optional[float]:
+    match = match_segment(user_lat, user_lon, route)
+    return match.eta_ms if match else None
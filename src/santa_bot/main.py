@@ -1,9 +1,67 @@
-from services.telegram import run_bot
+import argparse
+
+from services.dispatcher import run_dispatcher
+from services.santa_api import SantaAPI
+from settings import BOT_MODE
+
+api = SantaAPI()
+
+
+def build_raster(resolution: float):
+    print(f"Building ETA raster at {resolution} degrees...")
+    raster = api.build_eta_raster(resolution)
+    print(f"Saved {api.raster_path}")
+
+    report = raster.error_report(api.get_route())
+    print(
+        f"Max error: {report['max_error_s']:.1f}s, "
+        f"p99: {report['p99_error_s']:.1f}s, "
+        f"mean: {report['mean_error_s']:.1f}s, "
+        f"exact fallback on {report['fallback_rate']:.1%} of {report['samples']} points"
+    )
+
+
+def compile_route():
+    stops = api.compile_route()
+    print(f"Compiled {stops} stops into {api.snapshot_path}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Santa Tracker Telegram Bot")
+    subparsers = parser.add_subparsers(dest="command")
+
+    raster_parser = subparsers.add_parser(
+        "build-raster", help="Precompute the ETA raster next to the route data"
+    )
+    raster_parser.add_argument(
+        "--resolution", type=float, default=0.25, help="Grid step in degrees"
+    )
+
+    subparsers.add_parser(
+        "compile-route",
+        help="Compile the route data into the binary snapshot loaded at startup",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "build-raster":
+        build_raster(args.resolution)
+        return
+
+    if args.command == "compile-route":
+        compile_route()
+        return
+
+    if BOT_MODE == "dispatcher":
+        run = run_dispatcher
+    else:
+        # Opens the databases, which the dispatcher does not use
+        from services.telegram import run_bot
+
+        run = run_bot
+
     try:
-        run_bot()
+        run()
     except KeyboardInterrupt:
         print("\nBot stopped by user.")
     except Exception as e:
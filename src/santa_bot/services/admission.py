@@ -0,0 +1,201 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+
+from .ratelimit import TokenBucket
+
+"""
+Admission control in front of the handlers.
+
+Before a handler runs, its update goes through three checks, cheapest first:
+
+- The same message from the same user in the same chat, while the first one
+  is still being handled or within `duplicate_seconds` after, is dropped: the
+  user already has, or is about to get, that answer. This catches impatient
+  double presses of the keyboard buttons.
+- Every chat has a token bucket. A chat flooding the bot has its extra
+  updates dropped, so a single user or group chat cannot take the handler
+  slots of everyone else.
+- At most `max_concurrent` handlers run at once. HIGH priority updates
+  (status requests, subscriptions) wait up to `wait` seconds for a slot.
+  LOW priority commands only get `low_share` of the slots and are shed
+  right away once those are taken, so under overload they go first.
+
+A chat whose updates are dropped by the first two checks is told to slow down,
+at most once every `notice_seconds`, so nobody is left without an answer.
+"""
+
+# Handler priorities, lower is admitted first
+HIGH = 0
+LOW = 1
+
+Handler = Callable[[Update, Any], Awaitable[Any]]
+
+
+class Admission:
+    # Idle chat buckets and old duplicates are dropped every this many seconds
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        max_concurrent: int = 48,
+        low_share: float = 0.5,
+        wait: float = 5.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 5.0,
+        duplicate_seconds: float = 2.0,
+        notice_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrent = max_concurrent
+        self.low_limit = max(1, int(max_concurrent * low_share))
+        self.wait = wait
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.duplicate_seconds = duplicate_seconds
+        self.notice_seconds = notice_seconds
+        self._clock = clock
+
+        self.running = 0
+        self._released = asyncio.Condition()
+        self._chats: Dict[int, TokenBucket] = {}
+        # (chat id, user id, message text) -> duplicates are dropped until then
+        self._recent: Dict[Tuple[int, int, str], float] = {}
+        # Chat id -> no other slow down notice is sent until then
+        self._noticed: Dict[int, float] = {}
+        self._last_prune = clock()
+
+        self.admitted = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self.notices = 0
+        self.shed = {HIGH: 0, LOW: 0}
+
+    """
+    Wraps a handler. `on_shed` is awaited for updates shed for lack of slots,
+    e.g. to tell the user to try again. `on_dropped` is awaited for the first
+    duplicate or throttled update of a chat in every notice window, e.g. to
+    tell the user to slow down.
+    """
+
+    def guard(
+        self,
+        priority: int,
+        handler: Handler,
+        on_shed: Optional[Callable[[Update], Awaitable[Any]]] = None,
+        on_dropped: Optional[Callable[[Update], Awaitable[Any]]] = None,
+    ) -> Handler:
+        async def run(update: Update, context: Any):
+            chat = update.effective_chat
+            if chat is None:
+                return await handler(update, context)
+
+            message = update.effective_message
+            user = update.effective_user
+            key = (
+                chat.id,
+                user.id if user else 0,
+                message.text if message and message.text else "",
+            )
+            now = self._clock()
+            self._prune(now)
+
+            until = self._recent.get(key)
+            if until is not None and now < until:
+                self.duplicates += 1
+                return await self._notice(chat.id, now, update, on_dropped)
+
+            if not self._chat_bucket(chat.id).try_acquire():
+                self.throttled += 1
+                return await self._notice(chat.id, now, update, on_dropped)
+
+            self._recent[key] = math.inf
+            if not await self._enter(priority):
+                # Not handled, so trying again right away is not a duplicate
+                self._recent.pop(key, None)
+                self.shed[priority] += 1
+                if on_shed is not None:
+                    await on_shed(update)
+                return
+
+            self.admitted += 1
+            try:
+                return await handler(update, context)
+            finally:
+                self._recent[key] = self._clock() + self.duplicate_seconds
+                await self._leave()
+
+        return run
+
+    async def _notice(
+        self,
+        chat_id: int,
+        now: float,
+        update: Update,
+        on_dropped: Optional[Callable[[Update], Awaitable[Any]]],
+    ):
+        if on_dropped is None or now < self._noticed.get(chat_id, -math.inf):
+            return
+        self._noticed[chat_id] = now + self.notice_seconds
+        self.notices += 1
+        await on_dropped(update)
+
+    async def _enter(self, priority: int) -> bool:
+        limit = self.max_concurrent if priority == HIGH else self.low_limit
+        if self.running < limit:
+            self.running += 1
+            return True
+        if priority != HIGH:
+            return False
+
+        async with self._released:
+            try:
+                await asyncio.wait_for(
+                    self._released.wait_for(lambda: self.running < self.max_concurrent),
+                    self.wait,
+                )
+            except asyncio.TimeoutError:
+                return False
+            self.running += 1
+            return True
+
+    async def _leave(self):
+        self.running -= 1
+        async with self._released:
+            self._released.notify()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(
+                self.chat_rate, capacity=self.chat_burst, clock=self._clock
+            )
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < self.PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.idle]:
+            del self._chats[chat_id]
+        for key in [k for k, until in self._recent.items() if until <= now]:
+            del self._recent[key]
+        for chat_id in [c for c, until in self._noticed.items() if until <= now]:
+            del self._noticed[chat_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "admitted": self.admitted,
+            "duplicates": self.duplicates,
+            "throttled": self.throttled,
+            "notices": self.notices,
+            "shed_high": self.shed[HIGH],
+            "shed_low": self.shed[LOW],
+            "chats": len(self._chats),
+        }
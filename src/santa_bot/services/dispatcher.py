@@ -0,0 +1,282 @@
+import asyncio
+import os
+import secrets
+import signal
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from telegram import Bot, Update
+from telegram.error import TelegramError
+
+from settings import (
+    BOT_TOKEN,
+    GEOCODE_RATE_PER_SECOND,
+    METRICS_PORT,
+    OUTBOX_GLOBAL_RATE,
+    SUBSCRIPTIONS_SYNC_SECONDS,
+    TELEGRAM_BASE_URL,
+    UPDATE_QUEUE_SIZE,
+    WORKER_BASE_PORT,
+    WORKER_HOST,
+    WORKER_SECRET,
+    WORKERS,
+)
+
+from .receiver import SECRET_HEADER
+
+"""
+Dispatcher mode: one process receives the updates and a pool of worker
+processes handles them.
+
+The dispatcher long-polls getUpdates and forwards each update to the worker
+picked by its chat id, so a chat always lands on the same worker and its
+updates stay in order. Every worker has its own queue and forwarding task:
+a slow worker only holds back its own chats, and polling once its queue is
+full.
+
+The workers are bot processes started in worker mode. They share the
+subscriptions database and pick up each other's changes, elect one of them
+to send the city alerts, and each get an equal share of the Telegram and
+Nominatim rate limits. A worker that exits is started again.
+"""
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / "main.py"
+
+POLL_TIMEOUT_SECONDS = 30
+STARTUP_TIMEOUT_SECONDS = 60.0
+RETRY_DELAY_SECONDS = 0.5
+RESTART_DELAY_SECONDS = 1.0
+DRAIN_SECONDS = 10.0
+
+
+class Worker:
+    def __init__(self, index: int, port: int, env: Dict[str, str]):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.url = f"http://{WORKER_HOST}:{port}"
+        self.queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+        self.forwarded = 0
+        self.restarts = 0
+
+    async def spawn(self):
+        # Own session: Ctrl+C reaches the dispatcher only, which stops the
+        # workers once everything fetched was forwarded
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, str(MAIN_PATH), env=self.env, start_new_session=True
+        )
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+
+class Dispatcher:
+    def __init__(self, bot: Bot, workers: int, base_port: int):
+        self.bot = bot
+        # Shared with the workers only, through their environment
+        self.secret = WORKER_SECRET or secrets.token_urlsafe(32)
+        self.workers = [
+            Worker(i, base_port + i, self._worker_env(i, base_port + i, workers))
+            for i in range(workers)
+        ]
+        self._offset: Optional[int] = None
+
+    def _worker_env(self, index: int, port: int, workers: int) -> Dict[str, str]:
+        return dict(
+            os.environ,
+            BOT_MODE="worker",
+            WORKER_PORT=str(port),
+            WORKER_SECRET=self.secret,
+            OUTBOX_GLOBAL_RATE=str(OUTBOX_GLOBAL_RATE / workers),
+            GEOCODE_RATE_PER_SECOND=str(GEOCODE_RATE_PER_SECOND / workers),
+            SUBSCRIPTIONS_SYNC_SECONDS=str(SUBSCRIPTIONS_SYNC_SECONDS or 1),
+            METRICS_PORT=str(METRICS_PORT + index if METRICS_PORT else 0),
+        )
+
+    def worker_for(self, update: Update) -> Worker:
+        if update.effective_chat:
+            key = update.effective_chat.id
+        elif update.effective_user:
+            key = update.effective_user.id
+        else:
+            key = update.update_id
+        return self.workers[key % len(self.workers)]
+
+    async def _wait_ready(self, client: httpx.AsyncClient, worker: Worker):
+        deadline = asyncio.get_running_loop().time() + STARTUP_TIMEOUT_SECONDS
+        while True:
+            if not worker.running:
+                raise RuntimeError(f"Worker {worker.index} exited during startup")
+            try:
+                response = await client.get(worker.url + "/health")
+                if response.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Worker {worker.index} did not start")
+            await asyncio.sleep(0.1)
+
+    async def _poll(self):
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self._offset,
+                    timeout=POLL_TIMEOUT_SECONDS,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            except TelegramError as e:
+                print(f"Error fetching updates: {e}")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+
+            for update in updates:
+                # Waits when the worker is behind, which pauses polling
+                await self.worker_for(update).queue.put(update)
+                self._offset = update.update_id + 1
+
+    """
+    Posts the worker's updates one by one, in order. Failed posts are retried
+    until the worker answers, e.g. while it is being restarted.
+    """
+
+    async def _forward(self, client: httpx.AsyncClient, worker: Worker):
+        headers = {SECRET_HEADER: self.secret, "Content-Type": "application/json"}
+        while True:
+            update = await worker.queue.get()
+            body = update.to_json()
+
+            while True:
+                try:
+                    response = await client.post(
+                        worker.url + "/update", content=body, headers=headers
+                    )
+                    if response.status_code == 200:
+                        break
+                    if response.status_code < 500:
+                        print(
+                            f"Worker {worker.index} rejected update "
+                            f"{update.update_id}: {response.status_code}"
+                        )
+                        break
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+            worker.forwarded += 1
+            worker.queue.task_done()
+
+    async def _supervise(self, worker: Worker):
+        while True:
+            code = await worker.process.wait()
+            print(f"Worker {worker.index} exited with {code}, restarting")
+            worker.restarts += 1
+            await asyncio.sleep(RESTART_DELAY_SECONDS)
+            await worker.spawn()
+
+    async def run(self, stop: asyncio.Event):
+        # Long enough for a worker busy with a full update queue
+        timeout = httpx.Timeout(60, connect=5)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            for worker in self.workers:
+                await worker.spawn()
+
+            tasks: List[asyncio.Task] = []
+            try:
+                await asyncio.gather(
+                    *(self._wait_ready(client, worker) for worker in self.workers)
+                )
+                print(f"Dispatching to {len(self.workers)} workers...")
+
+                tasks = [
+                    asyncio.create_task(self._forward(client, worker))
+                    for worker in self.workers
+                ]
+                tasks += [
+                    asyncio.create_task(self._supervise(worker))
+                    for worker in self.workers
+                ]
+                poller = asyncio.create_task(self._poll())
+
+                await stop.wait()
+                poller.cancel()
+                await asyncio.gather(poller, return_exceptions=True)
+
+                # Everything already fetched is handed over before the workers stop
+                try:
+                    await asyncio.wait_for(
+                        asyncio.gather(*(w.queue.join() for w in self.workers)),
+                        DRAIN_SECONDS,
+                    )
+                except asyncio.TimeoutError:
+                    print("Some fetched updates were not forwarded")
+
+                if self._offset is not None:
+                    # Confirms the forwarded updates, so they are not fetched again
+                    try:
+                        await self.bot.get_updates(offset=self._offset, timeout=0)
+                    except TelegramError as e:
+                        print(f"Error confirming updates: {e}")
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await self._stop_workers()
+
+    async def _stop_workers(self):
+        for worker in self.workers:
+            if worker.running:
+                worker.process.send_signal(signal.SIGTERM)
+        await asyncio.gather(
+            *(w.process.wait() for w in self.workers if w.process is not None)
+        )
+
+    def metrics(self):
+        return {
+            "workers": [
+                {
+                    "forwarded": worker.forwarded,
+                    "queued": worker.queue.qsize(),
+                    "restarts": worker.restarts,
+                }
+                for worker in self.workers
+            ]
+        }
+
+
+def run_dispatcher():
+    """Entry point of the dispatcher process."""
+    if not BOT_TOKEN:
+        print("Error: BOT_TOKEN is missing in settings.py or .env")
+        return
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        if TELEGRAM_BASE_URL:
+            bot = Bot(BOT_TOKEN, base_url=TELEGRAM_BASE_URL)
+        else:
+            bot = Bot(BOT_TOKEN)
+
+        async with bot:
+            # getUpdates does not work while a webhook is set
+            await bot.delete_webhook()
+            dispatcher = Dispatcher(bot, WORKERS, WORKER_BASE_PORT)
+            await dispatcher.run(stop)
+
+        for i, worker in enumerate(dispatcher.metrics()["workers"]):
+            print(
+                f"Worker {i}: {worker['forwarded']} updates forwarded, "
+                f"{worker['restarts']} restarts"
+            )
+
+    print(f"Santa Bot is running (dispatcher, {WORKERS} workers)...")
+    asyncio.run(main())
@@ -0,0 +1,254 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .metrics import Histogram
+from .ratelimit import TokenBucket
+from .singleflight import SingleFlight
+
+"""
+Geocoding for cities that are not on Santa's route.
+
+Lookups go through two cache tiers, an in-memory LRU and a SQLite file, before
+reaching the upstream geocoder. Cities that could not be found are cached
+too, for a shorter time. Identical queries that arrive while one lookup is
+already in flight wait for that lookup instead of going upstream again.
+
+Upstream calls go through GeocodingService, which owns its own threads and
+queue and respects Nominatim's 1 request/second usage policy.
+"""
+
+Coordinates = Tuple[float, float]
+
+# (coordinates or None when not found, expiry timestamp or None for never)
+CacheEntry = Tuple[Optional[Coordinates], Optional[float]]
+
+
+class GeocoderBusy(Exception):
+    """Raised when the geocoding queue is full."""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class GeocodingService:
+    def __init__(
+        self,
+        geocode: Callable[[str], Optional[Coordinates]],
+        rate: float = 1.0,
+        workers: int = 1,
+        queue_size: int = 100,
+        timeout: float = 15.0,
+    ):
+        self._geocode = geocode
+        self.timeout = timeout
+        self.workers = workers
+
+        self._bucket = TokenBucket(rate, capacity=1)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="geocoder"
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._tasks = []
+
+        self.served = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # Upstream call latency, rate limiting excluded
+        self.latency = Histogram()
+
+    def _start(self):
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    """
+    Queues a lookup and waits for its result.
+    Raises GeocoderBusy when the queue is full and TimeoutError when the
+    answer takes longer than `timeout` (queueing included).
+    """
+
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        if self._queue is None:
+            self._start()
+        assert self._queue is not None
+
+        future = asyncio.get_running_loop().create_future()
+        item = (query, future, time.monotonic())
+
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise GeocoderBusy(f"Geocoding queue is full ({self._queue.maxsize})")
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _worker(self):
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+
+        while True:
+            query, future, enqueued_at = await self._queue.get()
+
+            # The caller gave up while the request was queued
+            if future.done():
+                continue
+
+            await self._bucket.acquire()
+
+            wait = time.monotonic() - enqueued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, self._geocode, query
+                )
+            except Exception as e:
+                self.latency.observe(time.perf_counter() - started)
+                self.errors += 1
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            self.latency.observe(time.perf_counter() - started)
+            self.served += 1
+            if not future.done():
+                future.set_result(result)
+
+    def metrics(self) -> Dict[str, Any]:
+        started = self.served + self.errors
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "served": self.served,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "avg_wait_s": self.total_wait / started if started else 0.0,
+            "max_wait_s": self.max_wait,
+        }
+
+
+class GeocodeCache:
+    def __init__(
+        self,
+        upstream: GeocodingService,
+        db_path: Path,
+        max_entries: int = 1024,
+        negative_ttl: float = 3600,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.upstream = upstream
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+
+        self._memory: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._flight = SingleFlight()
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL)"
+        )
+        self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def lookup(self, query: str) -> Optional[Coordinates]:
+        key = normalize_query(query)
+
+        entry = self._memory.get(key)
+        if entry is not None and not self._expired(entry[1]):
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry[0]
+
+        return await self._flight.run(key, lambda: self._resolve(key, query))
+
+    async def _resolve(self, key: str, query: str) -> Optional[Coordinates]:
+        entry = await asyncio.to_thread(self._read, key)
+        if entry is not None and not self._expired(entry[1]):
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry[0]
+
+        self.misses += 1
+        # Errors, including a full queue, propagate and are not cached
+        result = await self.upstream.geocode(query)
+
+        expires_at = None if result else self._clock() + self.negative_ttl
+        entry = (result, expires_at)
+        self._remember(key, entry)
+        await asyncio.to_thread(self._write, key, entry)
+
+        return result
+
+    def _remember(self, key: str, entry: CacheEntry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _expired(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at <= self._clock()
+
+    def _read(self, key: str) -> Optional[CacheEntry]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT lat, lon, expires_at FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        lat, lon, expires_at = row
+        coordinates = (lat, lon) if lat is not None else None
+        return coordinates, expires_at
+
+    def _write(self, key: str, entry: CacheEntry):
+        coordinates, expires_at = entry
+        lat, lon = coordinates if coordinates else (None, None)
+
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, lat, lon, expires_at),
+            )
+            self._db.commit()
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+            "entries": len(self._memory),
+        }
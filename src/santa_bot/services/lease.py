@@ -0,0 +1,142 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+"""
+Leader election between the bot processes of one machine.
+
+The leader holds a lease, a row in a SQLite table with the holder and an
+expiry time. It renews the lease well before it expires. The other processes
+keep trying to take it, which only works once it has expired. Every attempt
+runs in an IMMEDIATE transaction, so two processes can never both see the
+lease as free.
+
+A holder that cannot renew in time (e.g. the process was stopped) considers
+itself deposed on its own clock, before the lease expires for the others.
+"""
+
+
+def default_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    def __init__(
+        self,
+        db_path: Path,
+        name: str,
+        holder: Optional[str] = None,
+        ttl: float = 15.0,
+    ):
+        self.db_path = db_path
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl
+
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        db = sqlite3.connect(db_path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.commit()
+        db.close()
+
+    """
+    Takes or renews the lease. Blocking, returns True when it is held.
+    """
+
+    def acquire(self) -> bool:
+        started = time.monotonic()
+        now = time.time()
+
+        db = sqlite3.connect(self.db_path, timeout=self.ttl / 3, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)
+            ).fetchone()
+
+            if row is not None and row[0] != self.holder and row[1] > now:
+                db.execute("ROLLBACK")
+                self._valid_until = 0.0
+                return False
+
+            db.execute(
+                "INSERT OR REPLACE INTO leases (name, holder, expires_at)"
+                " VALUES (?, ?, ?)",
+                (self.name, self.holder, now + self.ttl),
+            )
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Error acquiring lease {self.name}: {e}")
+            self._valid_until = 0.0
+            return False
+        finally:
+            db.close()
+
+        # Measured from before the write, so we give up before the others take over
+        self._valid_until = started + self.ttl
+        return True
+
+    def release(self):
+        self._valid_until = 0.0
+        db = sqlite3.connect(self.db_path, timeout=self.ttl / 3)
+        try:
+            with db:
+                db.execute(
+                    "DELETE FROM leases WHERE name = ? AND holder = ?",
+                    (self.name, self.holder),
+                )
+        except sqlite3.Error as e:
+            print(f"Error releasing lease {self.name}: {e}")
+        finally:
+            db.close()
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    """
+    Keeps trying to hold the lease. `on_elected` runs when this process
+    becomes the leader and `on_deposed` when it stops being it.
+    """
+
+    def start(
+        self,
+        on_elected: Callable[[], Awaitable[None]],
+        on_deposed: Callable[[], Awaitable[None]],
+    ):
+        async def run():
+            leader = False
+            try:
+                while True:
+                    held = await asyncio.to_thread(self.acquire)
+                    if held and not leader:
+                        leader = True
+                        await on_elected()
+                    elif not held and leader:
+                        leader = False
+                        await on_deposed()
+
+                    await asyncio.sleep(self.ttl / 3)
+            finally:
+                if leader:
+                    await on_deposed()
+
+        self._task = asyncio.create_task(run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.to_thread(self.release)
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.route import Route, RouteNames
+
+from .santa_api import SantaAPI
+from .singleflight import SingleFlight
+
+"""
+Stop names in the users' languages.
+
+A language is available when a data file in the same format as the main one
+sits next to it, e.g. data/santa_de.json next to data/santa_en.json. Only its
+city and region names are kept, matched to the route's stops by id. The
+route itself, with its coordinates, timestamps, indexes and photos, is
+shared by all languages.
+
+A language is loaded the first time a user who speaks it asks for something,
+off the event loop, and again after every route reload.
+"""
+
+FILE_PREFIX = "santa_"
+
+
+class LocaleRegistry:
+    def __init__(self, api: SantaAPI, default: str = "en"):
+        self.api = api
+        self.default = default
+        self.data_dir = api.data_path.parent
+        self.available = {
+            path.stem[len(FILE_PREFIX) :].lower()
+            for path in self.data_dir.glob(f"{FILE_PREFIX}*.json")
+        }
+
+        # Names of `_route`, by locale, and the loads in flight for it
+        self._names: Dict[str, RouteNames] = {}
+        self._route: Optional[Route] = None
+        self._loading = SingleFlight()
+
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.errors = 0
+
+    """
+    The available locale closest to a Telegram language_code: "pt-br" falls
+    back to "pt", and anything unknown to the default
+    """
+
+    def locale_of(self, language_code: Optional[str]) -> str:
+        if not language_code:
+            return self.default
+        code = language_code.lower().replace("_", "-")
+        if code in self.available:
+            return code
+        primary = code.split("-", 1)[0]
+        if primary in self.available:
+            return primary
+        return self.default
+
+    """
+    Names of the current route in the closest available language. Names
+    loaded for a route that was replaced meanwhile are not returned.
+    """
+
+    async def names(self, language_code: Optional[str]) -> RouteNames:
+        locale = self.locale_of(language_code)
+
+        while True:
+            route = self.api.get_route()
+            if route is not self._route:
+                # Names and loads of the previous route are not used again
+                self._names = {}
+                self._loading = SingleFlight()
+                self._route = route
+
+            names = self._names.get(locale)
+            if names is not None:
+                return names
+            if locale == self.default:
+                names = self._names[locale] = route.names(locale)
+                return names
+
+            names = await self._loading.run(locale, lambda: self._read(route, locale))
+            if self.api.get_route() is route:
+                return names
+
+    async def _read(self, route: Route, locale: str) -> RouteNames:
+        try:
+            names = await asyncio.to_thread(self._load, route, locale)
+        except Exception as e:
+            print(f"Error loading the {locale} names: {e}")
+            self.errors += 1
+            names = route.names(self.default)
+
+        # Only kept if the route was not reloaded meanwhile
+        if self._route is route:
+            self._names[locale] = names
+        return names
+
+    """
+    Reads a language's names. Blocking, run it in a thread. Stops missing
+    from its file keep their default names.
+    """
+
+    def _load(self, route: Route, locale: str) -> RouteNames:
+        started = time.perf_counter()
+        path = self.data_dir / f"{FILE_PREFIX}{locale}.json"
+        with open(path, "r", encoding="utf-8") as f:
+            destinations: List[Dict[str, Any]] = json.load(f).get("destinations", [])
+
+        intern = sys.intern
+        by_id: Dict[str, Tuple[str, str]] = {
+            stop["id"]: (stop["city"], stop["region"]) for stop in destinations
+        }
+        cities = list(route.cities)
+        regions = list(route.regions)
+        for i, stop_id in enumerate(route.ids):
+            found = by_id.get(stop_id)
+            if found is not None:
+                cities[i] = intern(found[0])
+                regions[i] = intern(found[1])
+
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - started
+        return route.localized(locale, cities, regions)
+
+    def loaded(self) -> List[str]:
+        return sorted(self._names)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "available": len(self.available),
+            "loaded": len(self._names),
+            "loads": self.loads,
+            "load_seconds": self.load_seconds,
+            "errors": self.errors,
+        }
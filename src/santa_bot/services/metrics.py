@@ -0,0 +1,232 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+"""
+Metrics in the Prometheus text format, served on a local port.
+
+Latencies are recorded in Histograms with fixed buckets: observing a value is
+a bisect and two additions, cheap enough for every update and every Bot API
+call. Everything else (queue depths, cache hits, subscription counts) is
+already counted by the services, and is only read from their metrics() when
+/metrics is scraped.
+"""
+
+# Seconds, from a fast handler to a Bot API call that needed retries
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# A label value, or a tuple of them for several labels
+Labels = Union[str, Tuple[str, ...]]
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> [count of each bucket, sum]
+        self._series: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, labels: Labels = ""):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, labels: Labels = "") -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def series(self):
+        for labels, (counts, total) in list(self._series.items()):
+            yield labels, counts, total
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    if isinstance(values, str):
+        values = (values,)
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        # Renders the lines of one metric family
+        self._families: List[Callable[[], List[str]]] = []
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        histogram: Histogram,
+        labels: Tuple[str, ...] = (),
+    ):
+        def render() -> List[str]:
+            lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for values, counts, total in histogram.series():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, counts):
+                    cumulative += count
+                    le = _labels(labels, values, f'le="{_number(bound)}"')
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                label_text = _labels(labels, values)
+                lines.append(f"{name}_sum{label_text} {_number(total)}")
+                lines.append(f"{name}_count{label_text} {cumulative}")
+            return lines
+
+        self._families.append(render)
+
+    """
+    A value read when scraped. `read` returns a number, or a dict of label
+    values to numbers when `labels` are given.
+    """
+
+    def value(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], Any],
+        kind: str = "gauge",
+        labels: Tuple[str, ...] = (),
+    ):
+        def render() -> List[str]:
+            lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            values = read()
+            if not labels:
+                values = {"": values}
+            for label_values, number in values.items():
+                lines.append(f"{name}{_labels(labels, label_values)} {_number(number)}")
+            return lines
+
+        self._families.append(render)
+
+    """
+    Every numeric entry of a service's metrics() as `{prefix}_{key}`
+    """
+
+    def source(self, prefix: str, metrics: Callable[[], Dict[str, Any]]):
+        def render() -> List[str]:
+            lines = []
+            for key, number in metrics().items():
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    name = f"{prefix}_{key}"
+                    lines.append(f"# TYPE {name} untyped")
+                    lines.append(f"{name} {_number(number)}")
+            return lines
+
+        self._families.append(render)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in self._families:
+            try:
+                lines.extend(family())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps `interval`.
+    A blocked loop delays every update, so this is the first thing to check.
+    """
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.lag = Histogram()
+        self.last = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        async def run():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.perf_counter() - start - self.interval)
+                self.lag.observe(lag)
+                self.last = lag
+                self.max = max(self.max, lag)
+
+        self._task = asyncio.create_task(run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+class MetricsServer:
+    """Answers GET /metrics with the registry, every other path with 404."""
+
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self._server: Optional[asyncio.Server] = None
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # The headers are not needed
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status = "200 OK"
+                body = self.registry.render().encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,395 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from .metrics import Histogram
+from .ratelimit import TokenBucket
+
+"""
+Outbound Bot API calls.
+
+Every message the bot sends goes through the Outbox instead of calling the
+Bot directly. A single dispatcher task takes requests in priority order and
+spends one token from the global bucket (Telegram allows ~30 messages/second)
+and one from the bucket of the receiving chat (~1 message/second, with a small
+burst) for each of them. A request whose chat is out of tokens waits aside until
+that chat is ready again. It does not hold up messages for other chats.
+
+Each chat has at most one request being delivered, retries included, so the
+messages of a chat arrive in the order they were sent. Only an interactive
+reply can pass the chat's bulk alerts that are still queued.
+
+Interactive replies always go before bulk alerts. Queued requests are bounded:
+bulk producers wait for room, and interactive sends fail fast with OutboxFull.
+
+Flood control errors (RetryAfter) pause the whole outbox for the time Telegram
+asks for. Network errors are retried with exponential backoff and jitter.
+Requests Telegram rejects (bad request, blocked bot) are not retried.
+"""
+
+# Send priorities, lower is served first
+INTERACTIVE = 0
+BULK = 1
+
+
+class OutboxFull(Exception):
+    """Raised when an interactive send finds the queue full."""
+
+
+class SendRequest:
+    __slots__ = ("method", "chat_id", "kwargs", "priority", "future", "attempt")
+
+    def __init__(
+        self,
+        method: str,
+        chat_id: int,
+        kwargs: Dict[str, Any],
+        priority: int,
+        future: Optional[asyncio.Future],
+    ):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempt = 0
+
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class Outbox:
+    # Idle chat buckets are dropped every this many seconds
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        queue_size: int = 10_000,
+        concurrency: int = 16,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._clock = clock
+
+        self._bot: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self._global = TokenBucket(global_rate, capacity=1, clock=clock)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._last_prune = clock()
+
+        # (priority, sequence, enqueued at, request)
+        self._queue: List[Tuple[int, int, float, SendRequest]] = []
+        # (ready at, priority, sequence, enqueued at, request)
+        self._delayed: List[Tuple[float, int, int, float, SendRequest]] = []
+        self._sequence = itertools.count()
+        self._pending = {INTERACTIVE: 0, BULK: 0}
+        self._in_flight: Dict[asyncio.Task, SendRequest] = {}
+        # Request being delivered to each chat, and the chat's next ones
+        self._active: Dict[int, SendRequest] = {}
+        self._held: Dict[int, List[Tuple[int, int, float, SendRequest]]] = {}
+
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Condition()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.dispatched = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        # Bot API call latency by method, failed calls by (method, error)
+        self.latency = Histogram()
+        self.errors: Dict[Tuple[str, str], int] = {}
+        # Called with (method, seconds) after every call while profiling
+        self.trace: Optional[Callable[[str, float], None]] = None
+
+    def start(self, bot):
+        self._bot = bot
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._dispatch())
+
+    """
+    Stops the dispatcher. Sends still queued or in flight are cancelled.
+    """
+
+    async def stop(self):
+        if self._task is None:
+            return
+        tasks = [self._task, *self._in_flight]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+        requests = [entry[-1] for entry in self._queue + self._delayed]
+        requests.extend(self._in_flight.values())
+        for held in self._held.values():
+            requests.extend(entry[-1] for entry in held)
+        for request in requests:
+            if request.future and not request.future.done():
+                request.future.cancel()
+        self._in_flight.clear()
+        self._queue.clear()
+        self._delayed.clear()
+        self._active.clear()
+        self._held.clear()
+        self._pending = {INTERACTIVE: 0, BULK: 0}
+
+    """
+    Waits up to `timeout` seconds for the queued sends to go out
+    """
+
+    async def drain(self, timeout: float):
+        async with self._room:
+            try:
+                await asyncio.wait_for(
+                    self._room.wait_for(lambda: not any(self._pending.values())),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                print(f"Outbox not drained after {timeout}s: {self.metrics()}")
+
+    """
+    Sends and waits for Telegram's answer, which is returned.
+    Errors are raised to the caller once retries are exhausted.
+    """
+
+    async def send(
+        self, method: str, chat_id: int, priority: int = INTERACTIVE, **kwargs
+    ) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._put(SendRequest(method, chat_id, kwargs, priority, future))
+        return await future
+
+    """
+    Queues a send without waiting for it to be delivered, only for room in
+    the queue. Failures are printed.
+    """
+
+    async def post(self, method: str, chat_id: int, priority: int = BULK, **kwargs):
+        await self._put(SendRequest(method, chat_id, kwargs, priority, None))
+
+    async def send_message(self, chat_id: int, **kwargs) -> Any:
+        return await self.send("send_message", chat_id, **kwargs)
+
+    async def send_photo(self, chat_id: int, **kwargs) -> Any:
+        return await self.send("send_photo", chat_id, **kwargs)
+
+    async def _put(self, request: SendRequest):
+        if self._pending[request.priority] >= self.queue_size:
+            if request.priority == INTERACTIVE:
+                self.rejected += 1
+                raise OutboxFull(f"Outbox queue is full ({self.queue_size})")
+
+            async with self._room:
+                await self._room.wait_for(
+                    lambda: self._pending[request.priority] < self.queue_size
+                )
+
+        self._pending[request.priority] += 1
+        heapq.heappush(
+            self._queue,
+            (request.priority, next(self._sequence), self._clock(), request),
+        )
+        self._wakeup.set()
+
+    async def _done(self, request: SendRequest):
+        # The chat's next request can go
+        del self._active[request.chat_id]
+        held = self._held.get(request.chat_id)
+        if held:
+            heapq.heappush(self._queue, heapq.heappop(held))
+            self._wakeup.set()
+        if held is not None and not held:
+            del self._held[request.chat_id]
+
+        self._pending[request.priority] -= 1
+        async with self._room:
+            self._room.notify_all()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(
+                self.chat_rate, capacity=self.chat_burst, clock=self._clock
+            )
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < self.PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+
+        waiting = self._active.keys()
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.idle]:
+            if chat_id not in waiting:
+                del self._chats[chat_id]
+
+    async def _dispatch(self):
+        assert self._slots is not None
+
+        while True:
+            now = self._clock()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, sequence, enqueued_at, request = heapq.heappop(
+                    self._delayed
+                )
+                heapq.heappush(self._queue, (priority, sequence, enqueued_at, request))
+            self._prune(now)
+
+            if not self._queue:
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Re-check the queue afterwards, a more urgent send may have arrived
+            wait = self._global.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            await self._slots.acquire()
+            now = self._clock()
+
+            entry = heapq.heappop(self._queue)
+            priority, sequence, enqueued_at, request = entry
+
+            active = self._active.setdefault(request.chat_id, request)
+            if active is not request:
+                # Waits for the chat's earlier request to be delivered
+                self._slots.release()
+                heapq.heappush(self._held.setdefault(request.chat_id, []), entry)
+                continue
+
+            bucket = self._chat_bucket(request.chat_id)
+            if not bucket.try_acquire():
+                self._slots.release()
+                heapq.heappush(
+                    self._delayed,
+                    (now + bucket.delay(), priority, sequence, enqueued_at, request),
+                )
+                continue
+
+            self._global.try_acquire()
+
+            lag = now - enqueued_at
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            self.dispatched += 1
+
+            task = asyncio.create_task(self._deliver(request, sequence, enqueued_at))
+            self._in_flight[task] = request
+            task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task):
+        self._in_flight.pop(task, None)
+
+    async def _deliver(self, request: SendRequest, sequence: int, enqueued_at: float):
+        assert self._slots is not None
+
+        retry_in = None
+        started = time.perf_counter()
+        try:
+            result = await getattr(self._bot, request.method)(
+                chat_id=request.chat_id, **request.kwargs
+            )
+        except RetryAfter as e:
+            self.rate_limited += 1
+            retry_in = _seconds(e.retry_after)
+            # Flood control may be global, hold every chat back
+            self._global.pause(retry_in)
+            self._chat_bucket(request.chat_id).pause(retry_in)
+            error: Exception = e
+        except (BadRequest, Forbidden) as e:
+            error = e
+        except NetworkError as e:
+            error = e
+            if request.attempt < self.max_retries:
+                retry_in = self.backoff * 2**request.attempt * random.uniform(0.5, 1.5)
+        except Exception as e:
+            error = e
+        else:
+            self.sent += 1
+            if request.future and not request.future.done():
+                request.future.set_result(result)
+            await self._done(request)
+            return
+        finally:
+            self._slots.release()
+            elapsed = time.perf_counter() - started
+            self.latency.observe(elapsed, request.method)
+            if self.trace is not None:
+                self.trace(request.method, elapsed)
+
+        key = (request.method, type(error).__name__)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+        if retry_in is not None and request.attempt < self.max_retries:
+            request.attempt += 1
+            self.retried += 1
+            heapq.heappush(
+                self._delayed,
+                (
+                    self._clock() + retry_in,
+                    request.priority,
+                    sequence,
+                    enqueued_at,
+                    request,
+                ),
+            )
+            self._wakeup.set()
+            return
+
+        self.failed += 1
+        if request.future is None:
+            print(f"Error sending {request.method} to {request.chat_id}: {error}")
+        elif not request.future.done():
+            request.future.set_exception(error)
+        await self._done(request)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queued_interactive": self._pending[INTERACTIVE],
+            "queued_bulk": self._pending[BULK],
+            "delayed": len(self._delayed),
+            "held": sum(len(held) for held in self._held.values()),
+            "in_flight": len(self._in_flight),
+            "chat_buckets": len(self._chats),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+            "avg_lag_s": self.total_lag / self.dispatched if self.dispatched else 0.0,
+            "max_lag_s": self.max_lag,
+            "last_lag_s": self.last_lag,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.error import TelegramError
+
+from .outbox import BULK, Outbox
+
+"""
+Telegram file_id cache for the stop photos.
+
+The route only has remote photo URLs, and sending one makes Telegram download
+the image again every time. After the first successful upload, Telegram
+returns a file_id. Sending that file_id instead is fast and does not depend on
+the remote host. The URL -> file_id map is kept in a table of the shared
+subscriptions database, so it survives restarts and every worker process sees
+the photos the others uploaded.
+
+URLs that keep failing are skipped and the caller sends text only. A cached
+file_id that stops working is forgotten, so the URL is uploaded again next time.
+
+With a prewarm chat configured (e.g. a private channel of the bot), photos of
+the upcoming stops are uploaded there ahead of Santa's arrival, so users get
+the cached file_id.
+"""
+
+
+class PhotoCache:
+    def __init__(self, db_path: Path, max_failures: int = 3):
+        self.max_failures = max_failures
+
+        self._file_ids: Dict[str, str] = {}
+        self._failures: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.uploads = 0
+        self.skipped = 0
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS photo_cache ("
+            " url TEXT PRIMARY KEY, file_id TEXT, failures INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+        for url, file_id, failures in self._db.execute(
+            "SELECT url, file_id, failures FROM photo_cache"
+        ):
+            if file_id is not None:
+                self._file_ids[url] = file_id
+            if failures:
+                self._failures[url] = failures
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
+
+    def _read(self, url: str) -> Optional[Tuple[Optional[str], int]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT file_id, failures FROM photo_cache WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _write(self, url: str, file_id: Optional[str], failures: int):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO photo_cache (url, file_id, failures)"
+                " VALUES (?, ?, ?)",
+                (url, file_id, failures),
+            )
+            self._db.commit()
+
+    """
+    Picks up what other workers stored for `url` since this one last looked
+    """
+
+    async def refresh(self, url: str):
+        row = await asyncio.to_thread(self._read, url)
+        if row is None:
+            return
+        file_id, failures = row
+        if file_id is not None:
+            self._file_ids[url] = file_id
+            self._failures.pop(url, None)
+        elif failures > self._failures.get(url, 0):
+            self._failures[url] = failures
+
+    """
+    What to pass to send_photo for `url`: the cached file_id, the URL itself,
+    or None when the URL failed too many times and should not be sent
+    """
+
+    def resolve(self, url: str) -> Optional[str]:
+        file_id = self._file_ids.get(url)
+        if file_id is not None:
+            self.hits += 1
+            return file_id
+
+        if self._given_up(url):
+            return None
+
+        return url
+
+    def cached(self, url: str) -> bool:
+        return url in self._file_ids
+
+    def _given_up(self, url: str) -> bool:
+        return self._failures.get(url, 0) >= self.max_failures
+
+    def usable(self, url: str) -> bool:
+        if self._given_up(url):
+            self.skipped += 1
+            return False
+        return True
+
+    """
+    Records the file_id of the message returned by a successful send_photo
+    """
+
+    async def uploaded(self, url: str, message: Any):
+        photo = getattr(message, "photo", None)
+        if not photo or url in self._file_ids:
+            return
+
+        # The largest size is last, Telegram picks the right one for each client
+        file_id = photo[-1].file_id
+        self._file_ids[url] = file_id
+        self._failures.pop(url, None)
+        self.uploads += 1
+        await asyncio.to_thread(self._write, url, file_id, 0)
+
+    async def failed(self, url: str):
+        if self._file_ids.pop(url, None) is None:
+            self._failures[url] = self._failures.get(url, 0) + 1
+        await asyncio.to_thread(self._write, url, None, self._failures.get(url, 0))
+
+    """
+    Sends `url` to `chat_id` and returns the resulting message. Cache hits,
+    uploads and failures are recorded. Raises if the photo could not be sent.
+    """
+
+    async def send(
+        self, outbox: Outbox, chat_id: int, url: str, priority: int, **kwargs
+    ) -> Any:
+        if not self.cached(url):
+            # Another worker may have uploaded it in the meantime
+            await self.refresh(url)
+
+        photo = self.resolve(url)
+        if photo is None:
+            raise ValueError(f"Photo {url} failed {self.max_failures} times")
+
+        try:
+            message = await outbox.send(
+                "send_photo", chat_id, priority, photo=photo, **kwargs
+            )
+        except TelegramError:
+            await self.failed(url)
+            raise
+
+        await self.uploaded(url, message)
+        return message
+
+    async def prewarm(self, outbox: Outbox, chat_id: int, urls: List[str]):
+        for url in urls:
+            if self.cached(url) or self._given_up(url):
+                continue
+
+            try:
+                message = await self.send(
+                    outbox, chat_id, url, BULK, disable_notification=True
+                )
+                await outbox.send(
+                    "delete_message", chat_id, BULK, message_id=message.message_id
+                )
+            except Exception as e:
+                print(f"Error prewarming photo {url}: {e}")
+
+    """
+    Uploads the photos returned by `upcoming_urls` every `interval` seconds
+    """
+
+    def start_prewarm(
+        self,
+        outbox: Outbox,
+        chat_id: int,
+        upcoming_urls: Callable[[], List[str]],
+        interval: float = 300,
+    ):
+        async def run():
+            while True:
+                await self.prewarm(outbox, chat_id, upcoming_urls())
+                await asyncio.sleep(interval)
+
+        self._task = asyncio.create_task(run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "file_ids": len(self._file_ids),
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "skipped": self.skipped,
+            "failing_urls": len(self._failures),
+        }
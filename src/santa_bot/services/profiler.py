@@ -0,0 +1,231 @@
+import asyncio
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+"""
+On-demand profiling of the running bot, started with /profile or SIGUSR1.
+
+A "cpu" profile runs cProfile: every Python call is counted and timed, and
+the result is written as a .pstats file (python -m pstats, snakeviz). A
+"sample" profile looks at the event loop thread's stack every
+SAMPLE_INTERVAL_SECONDS from a background thread, which costs far less, and
+writes the stacks as a .folded file (flamegraph.pl, speedscope).
+
+With traces, slow handlers, core.tracker calls and Bot API calls are logged
+while the profile runs. The core.tracker functions are only wrapped for that
+time, so when nothing is profiled no call pays anything for it.
+"""
+
+MODES = {"cpu": "pstats", "sample": "folded"}
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# (kind, name, seconds)
+SlowCall = Tuple[str, str, float]
+# Called with the file written, or with the error
+OnDone = Callable[[Optional[Path], Optional[Exception]], Awaitable[None]]
+
+
+class Profiler:
+    def __init__(self, output_dir: Path, slow: Dict[str, float]):
+        self.output_dir = output_dir
+        # Seconds after which a call of each kind ("handler", "tracker",
+        # "bot_api") is reported
+        self.slow = slow
+
+        self.running = False
+        self.tracing = False
+        self.slow_calls: List[SlowCall] = []
+        # Attributes set to a trace callback while tracing: (object, attribute, kind)
+        self._hooks: List[Tuple[Any, str, str]] = []
+        self._wrapped: List[Tuple[Any, str, Callable]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    """
+    `target.attribute` is set to a callback taking (name, seconds) while
+    tracing, and to None otherwise
+    """
+
+    def hook(self, target: Any, attribute: str, kind: str):
+        self._hooks.append((target, attribute, kind))
+        setattr(target, attribute, None)
+
+    def trace(self, kind: str, name: str, seconds: float):
+        if seconds >= self.slow.get(kind, 0.0):
+            self.slow_calls.append((kind, name, seconds))
+            logging.warning(f"Slow {kind} {name}: {seconds * 1000:.1f} ms")
+
+    """
+    Profiles for `seconds` and returns the file written. Only one profile
+    runs at a time.
+    """
+
+    async def run(self, seconds: float, mode: str = "cpu", traces: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}")
+        if self.running:
+            raise RuntimeError("A profile is already running")
+
+        self.running = True
+        self.slow_calls = []
+        if traces:
+            self._start_traces()
+        try:
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = self.output_dir / f"profile-{stamp}-{os.getpid()}.{MODES[mode]}"
+            if mode == "cpu":
+                await self._cpu(seconds, path)
+            else:
+                await self._sample(seconds, path)
+            return path
+        finally:
+            self._stop_traces()
+            self.running = False
+
+    """
+    Profiles in the background, for /profile and SIGUSR1. Returns False when a
+    profile is already running.
+    """
+
+    def start(self, seconds: float, mode: str, traces: bool, on_done: OnDone) -> bool:
+        if self._task is not None and not self._task.done():
+            return False
+
+        async def run():
+            try:
+                path = await self.run(seconds, mode, traces)
+            except Exception as e:
+                await on_done(None, e)
+            else:
+                await on_done(path, None)
+
+        self._task = asyncio.create_task(run())
+        return True
+
+    """
+    Cancels a running profile, nothing is written
+    """
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _cpu(self, seconds: float, path: Path):
+        profile = cProfile.Profile()
+        # Fails when another profiler is active, e.g. the process runs under one
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        await asyncio.to_thread(self._write_stats, profile, path)
+
+    def _write_stats(self, profile: cProfile.Profile, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(path))
+
+    async def _sample(self, seconds: float, path: Path):
+        loop_thread = threading.get_ident()
+        stacks: Counter = Counter()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(SAMPLE_INTERVAL_SECONDS):
+                frame = sys._current_frames().get(loop_thread)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = Path(code.co_filename).name
+                    names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+
+        sampler = threading.Thread(target=sample, name="profile-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            done.set()
+            await asyncio.to_thread(sampler.join)
+        await asyncio.to_thread(self._write_stacks, stacks, path)
+
+    def _write_stacks(self, stacks: Counter, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _start_traces(self):
+        self.tracing = True
+        for target, attribute, kind in self._hooks:
+            setattr(target, attribute, functools.partial(self.trace, kind))
+
+        # The bot's modules call core.tracker through names they imported
+        for module in list(sys.modules.values()):
+            if not getattr(module, "__name__", "").startswith("services."):
+                continue
+            for name, value in list(vars(module).items()):
+                if inspect.isfunction(value) and value.__module__ == "core.tracker":
+                    setattr(module, name, self._traced(value))
+                    self._wrapped.append((module, name, value))
+
+    def _stop_traces(self):
+        for module, name, value in self._wrapped:
+            setattr(module, name, value)
+        self._wrapped.clear()
+        for target, attribute, _ in self._hooks:
+            setattr(target, attribute, None)
+        self.tracing = False
+
+    def _traced(self, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.trace("tracker", function.__name__, time.perf_counter() - started)
+
+        return run
+
+    """
+    The functions that took the most time in a written profile, one per line
+    """
+
+    def summary(self, path: Path, top: int = 10) -> str:
+        if path.suffix == ".pstats":
+            stats = pstats.Stats(str(path))
+            lines = []
+            for (filename, line, name), row in stats.stats.items():
+                own_seconds, total_seconds = row[2], row[3]
+                where = f"{name} ({Path(filename).name}:{line})"
+                lines.append((own_seconds, total_seconds, where))
+            lines.sort(reverse=True)
+            return "\n".join(
+                f"{own * 1000:9.1f} ms own {total * 1000:9.1f} ms total  {where}"
+                for own, total, where in lines[:top]
+            )
+
+        # Samples where each function was the one running
+        own: Counter = Counter()
+        samples = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                stack, count = line.rsplit(" ", 1)
+                own[stack.rsplit(";", 1)[-1]] += int(count)
+                samples += int(count)
+        return "\n".join(
+            f"{count / samples:6.1%}  {where}" for where, count in own.most_common(top)
+        )
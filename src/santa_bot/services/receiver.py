@@ -0,0 +1,110 @@
+import asyncio
+import hmac
+import json
+from typing import Optional, Set
+
+from telegram import Update
+from telegram.ext import Application
+
+"""
+Minimal HTTP server a worker receives its updates on.
+
+The dispatcher posts every update as JSON to /update over keep-alive
+connections, with the shared secret in the same header Telegram uses for
+webhooks. The update goes to the application's update queue, which applies
+backpressure: the response is only sent once the queue took the update.
+GET /health answers 200 once the worker is ready.
+"""
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+}
+
+
+class UpdateReceiver:
+    def __init__(self, application: Application, secret_token: str):
+        self.application = application
+        self.secret_token = secret_token
+
+        self._server: Optional[asyncio.Server] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self.received = 0
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    """
+    Stops accepting updates. Updates already in the queue are still handled.
+    """
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        # Keep-alive connections would otherwise hold wait_closed() forever
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status = await self._handle(method, target, headers, body)
+
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Length: 0\r\n\r\n".encode("latin-1")
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _handle(self, method: str, target: str, headers, body: bytes) -> int:
+        if target == "/health":
+            return 200
+        if target != "/update":
+            return 404
+        if method != "POST":
+            return 405
+
+        token = headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            return 403
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Error decoding a forwarded update: {e}")
+            return 400
+
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return 200
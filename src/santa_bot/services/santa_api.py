@@ -1,65 +1,304 @@
+import asyncio
 import datetime
 import json
-from typing import Any, Dict, List
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
+from core.route import Route
+from core.segments import SegmentMatch
+from core.snapshot import RouteSnapshot, SnapshotError, write_snapshot
+from core.spatial import to_unit_vector
+from core.tracker import match_segment
 from settings import BASE_DIR
 
+# The year shift of a timestamp only changes at local midnight or when the
+# UTC offset changes, both on 15 minute boundaries
+SHIFT_BUCKET_MS = 15 * 60 * 1000
+
+# (data file size, data file mtime, snapshot mtime, target year)
+RouteKey = Tuple[int, int, Optional[int], int]
+
+
+"""
+The route is versioned by epochs. A new epoch starts when the data file or
+its snapshot changes, or when the year rolls over after Christmas. The new
+route is built off the event loop and swapped in with a single assignment, so
+readers see either the old route or the new one, never a mix.
+"""
+
 
 class SantaAPI:
     def __init__(self, data_file_name: str = "santa_en.json"):
-        self._route_cache = None
+        self._route_cache: Optional[Route] = None
+        self._route_key: Optional[RouteKey] = None
+        self._details_cache: Optional[List[Dict[str, Any]]] = None
         self.data_path = BASE_DIR / "data" / data_file_name
+        self.raster_path = self.data_path.with_suffix(".eta.npy")
+        self.snapshot_path = self.data_path.with_suffix(".route")
+        self._raster = None
+        self._raster_checked = False
+
+        self.epoch = 0
+        # Seconds the last route load took
+        self.load_seconds = 0.0
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[asyncio.Task] = None
 
     """
-    Loads the route data from the specified file and normalises the timestamps
+    Returns the route of the current epoch, loading it the first time
     """
 
-    def get_route(self) -> List[Dict[str, Any]]:
-        if self._route_cache:
+    def get_route(self) -> Route:
+        route = self._route_cache
+        if route is not None:
+            return route
+
+        with self._reload_lock:
+            if self._route_cache is None:
+                self._swap(self._route_source_key())
+            assert self._route_cache is not None
             return self._route_cache
 
+    """
+    Starts a new epoch if the data changed or the year rolled over.
+    Blocking, run it in a thread. Returns True when the route was replaced.
+    Raises when the new data can't be loaded, the current route stays.
+    """
+
+    def refresh(self) -> bool:
+        with self._reload_lock:
+            key = self._route_source_key()
+            if key == self._route_key:
+                return False
+            self._swap(key)
+            return True
+
+    def _route_source_key(self) -> RouteKey:
+        stat = self.data_path.stat()
+        snapshot_mtime = (
+            self.snapshot_path.stat().st_mtime_ns
+            if self.snapshot_path.exists()
+            else None
+        )
+        return stat.st_size, stat.st_mtime_ns, snapshot_mtime, self._target_year()
+
+    def _swap(self, key: RouteKey):
+        # Raises before anything is replaced, so a failed load keeps the
+        # current route and key, and the next refresh tries again
+        started = time.perf_counter()
+        route = self._load_route(key[3])
+        self.load_seconds = time.perf_counter() - started
+
+        # Details of the previous file must not be mixed with the new route
+        self._details_cache = None
+        self._route_cache = route
+        self._route_key = key
+        self._raster = None
+        self._raster_checked = False
+        self.epoch += 1
+
+    """
+    Calls `on_reload` with the new route on the event loop every time
+    `refresh` replaces it. Checks every `interval` seconds.
+    """
+
+    def start_watching(
+        self, interval: float, on_reload: Callable[[Route], Awaitable[None]]
+    ):
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    reloaded = await asyncio.to_thread(self.refresh)
+                except Exception as e:
+                    print(f"Error reloading the route: {e}")
+                    continue
+                if not reloaded:
+                    continue
+                try:
+                    await on_reload(self.get_route())
+                except Exception as e:
+                    print(f"Error applying the reloaded route: {e}")
+
+        self._watcher = asyncio.create_task(run())
+
+    async def stop(self):
+        if self._watcher is None:
+            return
+        self._watcher.cancel()
+        await asyncio.gather(self._watcher, return_exceptions=True)
+        self._watcher = None
+
+    """
+    Loads the route data and normalises the timestamps. The compiled snapshot
+    is used when it is up to date, the JSON file otherwise.
+    """
+
+    def _load_route(self, target_year: int) -> Route:
         if not self.data_path.exists():
             raise FileNotFoundError(
                 f"Could not find any Santa Data at {self.data_path}"
             )
 
+        route = self._load_snapshot()
+        if route is None:
+            try:
+                with open(self.data_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except json.JSONDecodeError as e:
+                # E.g. a file still being written, the current route is kept
+                raise ValueError(
+                    f"Could not parse JSON data from {self.data_path}: {e}"
+                ) from e
+
+            raw_destinations = data.get("destinations", [])
+            if not raw_destinations:
+                raise ValueError(f"No destinations in {self.data_path}")
+            route = Route.from_destinations(
+                raw_destinations, details_loader=self._load_details
+            )
+
+        route = self._normalize_timestamps(route, target_year)
+        route.build_indexes()
+
+        return route
+
+    def _load_snapshot(self) -> Optional[Route]:
+        if not self.snapshot_path.exists():
+            return None
+
         try:
+            snapshot = RouteSnapshot(self.snapshot_path)
+        except (OSError, SnapshotError) as e:
+            print(f"Ignoring route snapshot: {e}")
+            return None
+
+        if not snapshot.is_current(self.data_path):
+            print(f"Ignoring stale route snapshot {self.snapshot_path}")
+            return None
+
+        return snapshot.route()
+
+    """
+    Compiles the JSON data file into the binary snapshot read at startup
+    """
+
+    def compile_route(self) -> int:
+        with open(self.data_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        destinations = data.get("destinations", [])
+        stat = self.data_path.stat()
+        write_snapshot(self.snapshot_path, destinations, stat.st_size, stat.st_mtime_ns)
+        return len(destinations)
+
+    """
+    Photos and attributions make up most of the data file, so they are only
+    read back from disk the first time a stop's details are requested
+    """
+
+    def _load_details(self, index: int) -> Dict[str, Any]:
+        if self._details_cache is None:
             with open(self.data_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
 
-            raw_destinations = data.get("destinations", [])
-            self._route_cache = self._normalize_timestamps(raw_destinations)
+            self._details_cache = [
+                stop.get("details", {}) for stop in data.get("destinations", [])
+            ]
 
-            return self._route_cache
+        if index >= len(self._details_cache):
+            return {}
+        return self._details_cache[index]
+
+    """
+    Returns the precomputed ETA raster, or None when it has not been built
+    for the current data file or NumPy is not installed
+    """
 
-        except json.JSONDecodeError:
-            print(f"Error: Could not parse JSON data from {self.data_path}")
-            return []
+    def get_eta_raster(self):
+        if self._raster_checked:
+            return self._raster
+        self._raster_checked = True
 
-    def _normalize_timestamps(
-        self, destinations: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
-        first_stop_ts = destinations[0]["departure"] / 1000
-        source_year = datetime.datetime.fromtimestamp(first_stop_ts).year
+        if not self.raster_path.exists():
+            return None
+        if self.raster_path.stat().st_mtime < self.data_path.stat().st_mtime:
+            print(f"Ignoring stale ETA raster {self.raster_path}")
+            return None
+
+        try:
+            from core.raster import EtaRaster
+        except ImportError:
+            return None
 
+        self._raster = EtaRaster.load(self.raster_path)
+        return self._raster
+
+    def build_eta_raster(self, resolution: float = 0.25):
+        from core.raster import EtaRaster
+
+        raster = EtaRaster.build(self.get_route(), resolution)
+        raster.save(self.raster_path)
+
+        self._raster = raster
+        self._raster_checked = True
+        return raster
+
+    """
+    Finds where Santa passes the user. The raster, when available, tells which
+    segment to use, and only that segment is evaluated. Near segment
+    boundaries the full search is used.
+    """
+
+    def match_segment(
+        self, lat: float, lon: float, route: Optional[Route] = None
+    ) -> Optional[SegmentMatch]:
+        if route is None:
+            route = self.get_route()
+        raster = self.get_eta_raster()
+
+        found = raster.lookup(lat, lon, route) if raster is not None else None
+        if found is not None:
+            return route.segments.match(found[1], to_unit_vector(lat, lon), {})
+
+        return match_segment(lat, lon, route)
+
+    def _target_year(self) -> int:
         now = datetime.datetime.now()
         if now.month == 12 and now.day > 25:
-            target_year = now.year + 1
-        else:
-            target_year = now.year
+            return now.year + 1
+        return now.year
+
+    def _normalize_timestamps(self, route: Route, target_year: int) -> Route:
+        if len(route) == 0:
+            return route
+
+        first_stop_ts = route.departure[0] / 1000
+        source_year = datetime.datetime.fromtimestamp(first_stop_ts).year
 
         year_offset = target_year - source_year
+        if year_offset == 0:
+            return route
 
-        normalized_data = []
-        for stop in destinations:
-            new_stop = stop.copy()
-            new_stop["arrival"] = self._shift_timestamp(stop["arrival"], year_offset)
-            new_stop["departure"] = self._shift_timestamp(
-                stop["departure"], year_offset
-            )
-            normalized_data.append(new_stop)
+        # One datetime conversion per 15 minutes of route, not per timestamp.
+        # The columns belong to this route only, so they are shifted in place.
+        deltas: Dict[int, int] = {}
+        for column in (route.arrival, route.departure):
+            for i, ts_ms in enumerate(column):
+                if ts_ms <= 0:
+                    continue
+
+                bucket = ts_ms // SHIFT_BUCKET_MS
+                delta = deltas.get(bucket)
+                if delta is None:
+                    start = bucket * SHIFT_BUCKET_MS
+                    delta = self._shift_timestamp(start, year_offset) - start
+                    deltas[bucket] = delta
+                column[i] = ts_ms + delta
 
-        return normalized_data
+        route.invalidate()
+        return route
 
     def _shift_timestamp(self, ts_ms: int, year_offset: int) -> int:
         if ts_ms <= 0:
@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .metrics import Histogram
+from .subscriptions import Subscription, SubscriptionStore
+
+"""
+One timer for every city alert.
+
+Every subscriber of a city shares the same ETA (the stop arrival, or the ETA
+of the geocoded city), so the scheduler keeps a single heap entry per city
+instead of one job per subscriber. The task sleeps until the earliest due
+city, then fans out to all of that city's current subscribers in one batch.
+
+When several processes share the subscriptions, `claim` decides whether this
+process sends a due alert, so every alert goes out once.
+"""
+
+# (city, subscriber ids, True when the city is a stop on the route)
+AlertSender = Callable[[str, Set[int], bool], Awaitable[None]]
+# (city, ETA in ms) -> True if this process sends the alert, called in a thread
+AlertClaim = Callable[[str, float], bool]
+# City -> (ETA in ms or None when off the route, True when a stop on the route)
+Plan = Dict[str, Tuple[Optional[float], bool]]
+
+# Stale heap entries tolerated on top of two per live city before the heap is
+# rebuilt
+COMPACT_SLACK = 1024
+
+
+class NotificationScheduler:
+    def __init__(
+        self,
+        store: SubscriptionStore,
+        clock: Callable[[], float] = time.time,
+        claim: Optional[AlertClaim] = None,
+    ):
+        self.store = store
+        self._clock = clock
+        self._claim = claim
+        self._send_alerts: Optional[AlertSender] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._on_route: Dict[str, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._replanning = asyncio.Lock()
+
+        self.fired = 0
+        self.claimed_elsewhere = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        # Seconds between an alert's ETA and when it fired
+        self.lag = Histogram()
+
+    def _now_ms(self) -> float:
+        return self._clock() * 1000
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    """
+    Plans the city alert at `eta_ms`. Scheduling a city again moves it, old
+    heap entries are skipped when they come up. ETAs in the past are ignored.
+    """
+
+    def schedule(self, city: str, eta_ms: float, on_route: bool) -> bool:
+        if eta_ms <= self._now_ms():
+            return False
+        if self._due.get(city) == eta_ms:
+            return True
+
+        self._due[city] = eta_ms
+        self._on_route[city] = on_route
+        heapq.heappush(self._heap, (eta_ms, city))
+
+        # Cities moved again and again, or cancelled, leave stale entries
+        # behind until they reach the top, so they are dropped from time to time
+        if len(self._heap) > 2 * len(self._due) + COMPACT_SLACK:
+            self._compact()
+
+        # Let the task re-check its timer if this is now the earliest entry
+        if self._heap[0][1] == city:
+            self._wakeup.set()
+        return True
+
+    def _compact(self):
+        self._heap = [(eta_ms, city) for city, eta_ms in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def cancel(self, city: str):
+        self._due.pop(city, None)
+        self._on_route.pop(city, None)
+
+    def due_at(self, city: str) -> Optional[float]:
+        return self._due.get(city)
+
+    """
+    Rebuilds the timers from the stored subscriptions, e.g. at startup or
+    when this process becomes the leader. Alerts already in the past are not
+    sent again.
+    """
+
+    async def rebuild(self, eta_for: Callable[[Subscription], Optional[float]]):
+        await self.replan(eta_for)
+        self._compact()
+
+    """
+    Brings the timers in line with new ETAs, e.g. after the route changed.
+    The ETAs are computed in a thread, then only the cities whose ETA moved
+    are touched on the event loop. Returns how many changed.
+    """
+
+    async def replan(self, eta_for: Callable[[Subscription], Optional[float]]) -> int:
+        # A replan started later sees a newer route, it must be applied last
+        async with self._replanning:
+            plan = await asyncio.to_thread(self.plan, eta_for)
+            return self.apply(plan)
+
+    """
+    The ETA and on-route flag of every subscribed city. Blocking, run it in
+    a thread: it walks every subscription.
+    """
+
+    def plan(self, eta_for: Callable[[Subscription], Optional[float]]) -> Plan:
+        planned: Plan = {}
+        for subscription in self.store:
+            city = subscription.city
+            if city not in planned:
+                planned[city] = (eta_for(subscription), subscription.lat is None)
+        return planned
+
+    def apply(self, plan: Plan) -> int:
+        changed = 0
+        for city, (eta_ms, on_route) in plan.items():
+            before = self._due.get(city)
+            if eta_ms is None or not self.schedule(city, eta_ms, on_route):
+                self.cancel(city)
+            changed += self._due.get(city) != before
+
+        # Cities subscribed while the plan was computed keep their alert
+        for city in [city for city in self._due if city not in plan]:
+            if not self.store.subscriber_count(city):
+                self.cancel(city)
+                changed += 1
+
+        return changed
+
+    def _pop_due(self, now: float) -> List[Tuple[float, str]]:
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            eta_ms, city = heapq.heappop(self._heap)
+            if self._due.get(city) == eta_ms:
+                ready.append((eta_ms, city))
+        return ready
+
+    def start(self, send_alerts: AlertSender):
+        self._send_alerts = send_alerts
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def run(self):
+        while True:
+            # Skip entries that were moved or cancelled
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if self._heap:
+                delay = (self._heap[0][0] - self._now_ms()) / 1000
+            else:
+                delay = None
+
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.fire_due()
+
+    """
+    Sends every alert that is due. Each city is one batch to all its subscribers.
+    """
+
+    async def fire_due(self):
+        now = self._now_ms()
+        for eta_ms, city in self._pop_due(now):
+            on_route = self._on_route.pop(city, True)
+            del self._due[city]
+
+            lag_ms = now - eta_ms
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self.lag.observe(lag_ms / 1000)
+            self.fired += 1
+
+            subscribers = self.store.subscribers(city)
+            if not subscribers or self._send_alerts is None:
+                continue
+            # Claims are written to the shared database, off the event loop
+            if self._claim is not None and not await asyncio.to_thread(
+                self._claim, city, eta_ms
+            ):
+                self.claimed_elsewhere += 1
+                continue
+
+            try:
+                await self._send_alerts(city, subscribers, on_route)
+            except Exception as e:
+                print(f"Error sending alerts for {city}: {e}")
+
+    def metrics(self):
+        return {
+            "scheduled_cities": len(self._due),
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "claimed_elsewhere": self.claimed_elsewhere,
+            "last_lag_ms": self.last_lag_ms,
+            "max_lag_ms": self.max_lag_ms,
+        }
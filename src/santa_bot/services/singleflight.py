@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+"""
+One computation per key at a time.
+
+The first caller for a key runs the computation. Callers that arrive while it
+is in flight wait for its result, or its error, instead of starting their own.
+If the computation is cancelled (e.g. its caller timed out) the waiters are
+not: one of them starts it again.
+"""
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only the computation was cancelled, this caller tries again
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+
+        try:
+            result = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters see the error, this keeps it from being reported as unretrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if not future.done():
+                # Cancelled, e.g. at shutdown
+                future.cancel()
@@ -0,0 +1,91 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .singleflight import SingleFlight
+
+"""
+Shared "Where is Santa now?" answer.
+
+Every chat asking within the same time bucket gets the same rendered
+snapshot. Misses for the same bucket are coalesced so a single computation
+serves everybody waiting on it.
+"""
+
+
+class StatusSnapshot:
+    def __init__(
+        self,
+        status: tuple,
+        caption: str,
+        photo_url: Optional[str],
+        expires_at_ms: float,
+    ):
+        self.status = status
+        self.caption = caption
+        self.photo_url = photo_url
+        self.expires_at_ms = expires_at_ms
+
+
+class StatusSnapshotCache:
+    def __init__(
+        self,
+        compute: Callable[[float], Awaitable[StatusSnapshot]],
+        bucket_seconds: float = 15,
+    ):
+        self._compute = compute
+        self.bucket_ms = bucket_seconds * 1000
+
+        self._bucket: Optional[int] = None
+        self._snapshot: Optional[StatusSnapshot] = None
+        self._flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    """
+    Returns the snapshot for the current bucket. A snapshot is never served
+    past its own expiry, which the compute function sets to the next arrival
+    or departure, so nobody sees a city Santa has already left.
+    """
+
+    async def get(self, now_ms: Optional[float] = None) -> StatusSnapshot:
+        if now_ms is None:
+            now_ms = time.time() * 1000
+
+        bucket = int(now_ms // self.bucket_ms)
+
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and self._bucket == bucket
+            and now_ms < snapshot.expires_at_ms
+        ):
+            self.hits += 1
+            return snapshot
+
+        # A single computation at a time, whatever the bucket
+        return await self._flight.run(None, lambda: self._refresh(now_ms, bucket))
+
+    async def _refresh(self, now_ms: float, bucket: int) -> StatusSnapshot:
+        self.misses += 1
+        snapshot = await self._compute(now_ms)
+
+        # Expire at the bucket boundary at the latest
+        snapshot.expires_at_ms = min(
+            snapshot.expires_at_ms, (bucket + 1) * self.bucket_ms
+        )
+
+        self._bucket = bucket
+        self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        self._bucket = None
+        self._snapshot = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+        }
@@ -0,0 +1,681 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+"""
+City notification subscriptions.
+
+Stores keep two indexes with set semantics: city -> users and user -> cities.
+Membership checks, /list and /unsubscribe are O(1) or O(user's cities). Each
+subscription also carries the geocoded coordinates (for cities that are not
+on the route) and the ETA, so alerts can be rescheduled after a restart.
+
+The numbers shown by /stats are kept up to date on every add and remove by
+CityStats, so answering /stats never scans all the subscriptions.
+
+Several bot processes can share one SQLite store: each one logs its changes,
+and applies the others' changes to its memory with sync().
+"""
+
+
+class Subscription(NamedTuple):
+    user_id: int
+    city: str
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    eta_ms: Optional[float] = None
+
+
+# (subscription, True if added or False if removed)
+Change = Tuple[Subscription, bool]
+
+
+class CityStats:
+    """
+    Subscriber count of every city, plus the cities grouped by count so the
+    most popular ones are found without sorting. Updates are O(1).
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._counts: Dict[str, int] = {}
+        self._by_count: Dict[int, Set[str]] = {}
+        self._max = 0
+
+    def added(self, city: str):
+        count = self._counts.get(city, 0)
+        if count:
+            self._by_count[count].discard(city)
+        self._counts[city] = count + 1
+        self._by_count.setdefault(count + 1, set()).add(city)
+
+        self._max = max(self._max, count + 1)
+        self.total += 1
+
+    def removed(self, city: str):
+        count = self._counts[city]
+        self._by_count[count].discard(city)
+        if count == 1:
+            del self._counts[city]
+        else:
+            self._counts[city] = count - 1
+            self._by_count[count - 1].add(city)
+
+        # The city moved down by one, so count - 1 is the new max if needed
+        if count == self._max and not self._by_count[count]:
+            self._max -= 1
+        self.total -= 1
+
+    def count(self, city: str) -> int:
+        return self._counts.get(city, 0)
+
+    def counts(self) -> Iterator[Tuple[str, int]]:
+        return iter(list(self._counts.items()))
+
+    @property
+    def cities(self) -> int:
+        return len(self._counts)
+
+    """
+    The highest subscriber count and every city that has it
+    """
+
+    def top(self) -> Tuple[int, Set[str]]:
+        if not self._max:
+            return 0, set()
+        return self._max, set(self._by_count[self._max])
+
+    def top_k(self, k: int) -> List[Tuple[str, int]]:
+        result: List[Tuple[str, int]] = []
+        count = self._max
+        while count > 0 and len(result) < k:
+            for city in sorted(self._by_count.get(count, ())):
+                result.append((city, count))
+            count -= 1
+        return result[:k]
+
+
+class SubscriptionStore(ABC):
+    """Interface every subscription backend implements."""
+
+    stats: CityStats
+
+    @abstractmethod
+    def add(self, subscription: Subscription) -> bool:
+        """Adds the subscription, returns False if the user already had it."""
+
+    @abstractmethod
+    def remove(self, user_id: int, city: str) -> bool:
+        """Removes the subscription, returns False if there was none."""
+
+    @abstractmethod
+    def get(self, user_id: int, city: str) -> Optional[Subscription]: ...
+
+    @abstractmethod
+    def is_subscribed(self, user_id: int, city: str) -> bool: ...
+
+    @abstractmethod
+    def subscribers(self, city: str) -> Set[int]: ...
+
+    @abstractmethod
+    def subscriber_count(self, city: str) -> int: ...
+
+    @abstractmethod
+    def cities_of(self, user_id: int) -> Set[str]: ...
+
+    @abstractmethod
+    def city_counts(self) -> Iterator[Tuple[str, int]]: ...
+
+    @abstractmethod
+    def city_total(self) -> int:
+        """Number of cities with at least one subscriber."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of subscriptions."""
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Subscription]: ...
+
+    @abstractmethod
+    def remember_user(self, user_id: int) -> bool:
+        """Records a user of the bot, returns False if it was already known."""
+
+    @abstractmethod
+    def user_count(self) -> int: ...
+
+    @abstractmethod
+    def claim_alert(self, city: str, eta_ms: float) -> bool:
+        """True the first time the alert for the city at this ETA is claimed."""
+
+    """
+    Applies the changes other processes made to a shared store and returns
+    them, or None when everything was reloaded.
+    """
+
+    def sync(self) -> Optional[List[Change]]:
+        return []
+
+    def close(self):
+        pass
+
+
+class MemorySubscriptionStore(SubscriptionStore):
+    def __init__(self):
+        self.stats = CityStats()
+        self._by_city: Dict[str, Set[int]] = {}
+        self._by_user: Dict[int, Set[str]] = {}
+        self._details: Dict[Tuple[int, str], Subscription] = {}
+        self._users: Set[int] = set()
+        self._claimed: Set[Tuple[str, float]] = set()
+        # Keeps the indexes and the stats consistent when threads share the store
+        self._lock = threading.Lock()
+
+    def add(self, subscription: Subscription) -> bool:
+        key = (subscription.user_id, subscription.city)
+        with self._lock:
+            if key in self._details:
+                return False
+
+            self._details[key] = subscription
+            self._by_city.setdefault(subscription.city, set()).add(subscription.user_id)
+            self._by_user.setdefault(subscription.user_id, set()).add(subscription.city)
+            self.stats.added(subscription.city)
+        return True
+
+    def remove(self, user_id: int, city: str) -> bool:
+        with self._lock:
+            if self._details.pop((user_id, city), None) is None:
+                return False
+
+            users = self._by_city[city]
+            users.discard(user_id)
+            if not users:
+                del self._by_city[city]
+
+            cities = self._by_user[user_id]
+            cities.discard(city)
+            if not cities:
+                del self._by_user[user_id]
+
+            self.stats.removed(city)
+        return True
+
+    def get(self, user_id: int, city: str) -> Optional[Subscription]:
+        return self._details.get((user_id, city))
+
+    def is_subscribed(self, user_id: int, city: str) -> bool:
+        return (user_id, city) in self._details
+
+    def subscribers(self, city: str) -> Set[int]:
+        with self._lock:
+            return set(self._by_city.get(city, ()))
+
+    def subscriber_count(self, city: str) -> int:
+        return self.stats.count(city)
+
+    def cities_of(self, user_id: int) -> Set[str]:
+        with self._lock:
+            return set(self._by_user.get(user_id, ()))
+
+    def city_counts(self) -> Iterator[Tuple[str, int]]:
+        with self._lock:
+            return self.stats.counts()
+
+    def city_total(self) -> int:
+        return self.stats.cities
+
+    def __len__(self) -> int:
+        return self.stats.total
+
+    def __iter__(self) -> Iterator[Subscription]:
+        with self._lock:
+            return iter(list(self._details.values()))
+
+    def remember_user(self, user_id: int) -> bool:
+        with self._lock:
+            if user_id in self._users:
+                return False
+            self._users.add(user_id)
+        return True
+
+    def user_count(self) -> int:
+        return len(self._users)
+
+    def claim_alert(self, city: str, eta_ms: float) -> bool:
+        with self._lock:
+            if (city, eta_ms) in self._claimed:
+                return False
+            self._claimed.add((city, eta_ms))
+        return True
+
+    """
+    Takes over the contents of `other`, e.g. a store loaded in a thread
+    """
+
+    def _replace(self, other: "MemorySubscriptionStore"):
+        with self._lock:
+            self.stats = other.stats
+            self._by_city = other._by_city
+            self._by_user = other._by_user
+            self._details = other._details
+            self._users = other._users
+
+
+class SQLiteSubscriptionStore(MemorySubscriptionStore):
+    """
+    Memory store backed by a SQLite database in WAL mode.
+    Reads are served from memory. Writes are applied in memory right away and
+    persisted in batches by a background thread, so handlers never wait on disk.
+    A batch the database fails to take is retried with backoff until it does.
+
+    Every write is also appended to a change log, tagged with the process that
+    made it. sync() replays the other processes' entries since the last sync.
+    A process that fell behind the log retention reloads everything instead.
+    """
+
+    BATCH_SIZE = 1000
+    LOG_RETENTION_SECONDS = 3600.0
+    PRUNE_INTERVAL_SECONDS = 60.0
+    # Wait before retrying a batch that failed, doubled after each failure
+    RETRY_SECONDS = 0.1
+    MAX_RETRY_SECONDS = 5.0
+
+    # Change log operations
+    ADDED = "A"
+    REMOVED = "R"
+    USER = "U"
+
+    def __init__(self, db_path: Path):
+        super().__init__()
+        self.db_path = db_path
+        # Tells this process's entries in the change log from the others'
+        self.origin = uuid.uuid4().hex
+        self._synced_seq = 0
+        self._sync_task: Optional[asyncio.Task] = None
+        # Changes made while a reload runs, replayed on top of what it read
+        self._replay: Optional[List[Tuple[str, Subscription]]] = None
+
+        # Reads and claims, the writer thread has its own connection
+        self._db = sqlite3.connect(
+            db_path, isolation_level=None, check_same_thread=False, timeout=5
+        )
+        self._db_lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            " user_id INTEGER NOT NULL,"
+            " city TEXT NOT NULL,"
+            " lat REAL,"
+            " lon REAL,"
+            " eta_ms REAL,"
+            " PRIMARY KEY (user_id, city))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS subscriptions_city ON subscriptions (city)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscription_log ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT NOT NULL,"
+            " op TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " city TEXT,"
+            " lat REAL,"
+            " lon REAL,"
+            " eta_ms REAL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fired_alerts ("
+            " city TEXT NOT NULL,"
+            " eta_ms REAL NOT NULL,"
+            " origin TEXT NOT NULL,"
+            " fired_at REAL NOT NULL,"
+            " PRIMARY KEY (city, eta_ms))"
+        )
+        self._swap(*self._read_all())
+
+        self.write_errors = 0
+        # Writes of the batch that failed, until it goes through
+        self.retrying_writes = 0
+        # Writes given up on at close() because the database kept failing
+        self.lost_writes = 0
+        self._closing = threading.Event()
+
+        # SQL writes, flush() markers, and None to stop
+        self._writes: "queue.Queue[Union[tuple, threading.Event, None]]" = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="subscriptions-writer", daemon=True
+        )
+        self._writer.start()
+
+    """
+    Reads the tables into a new memory store, together with the log position
+    they match. Does not touch this store, so it can run in a thread.
+    """
+
+    def _read_all(self) -> Tuple[MemorySubscriptionStore, int]:
+        fresh = MemorySubscriptionStore()
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                seq = self._last_seq()
+                for row in self._db.execute(
+                    "SELECT user_id, city, lat, lon, eta_ms FROM subscriptions"
+                ):
+                    fresh.add(Subscription(*row))
+                users = self._db.execute("SELECT user_id FROM users")
+                fresh._users.update(user_id for (user_id,) in users)
+            finally:
+                self._db.execute("COMMIT")
+        return fresh, seq
+
+    """
+    Switches to a store returned by _read_all, after replaying on it the
+    changes made since it was read
+    """
+
+    def _swap(
+        self,
+        fresh: MemorySubscriptionStore,
+        seq: int,
+        replay: Sequence[Tuple[str, Subscription]] = (),
+    ):
+        for op, subscription in replay:
+            if op == self.ADDED:
+                fresh.add(subscription)
+            elif op == self.REMOVED:
+                fresh.remove(subscription.user_id, subscription.city)
+            elif op == self.USER:
+                fresh.remember_user(subscription.user_id)
+
+        self._replace(fresh)
+        self._synced_seq = seq
+
+    def _last_seq(self) -> int:
+        row = self._db.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'subscription_log'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _log(self, op: str, subscription: Subscription):
+        if self._replay is not None:
+            self._replay.append((op, subscription))
+        self._writes.put(
+            (
+                "INSERT INTO subscription_log"
+                " (origin, op, user_id, city, lat, lon, eta_ms, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.origin, op, *subscription, time.time()),
+            )
+        )
+
+    def add(self, subscription: Subscription) -> bool:
+        if not super().add(subscription):
+            return False
+        self._writes.put(
+            (
+                "INSERT OR REPLACE INTO subscriptions"
+                " (user_id, city, lat, lon, eta_ms) VALUES (?, ?, ?, ?, ?)",
+                tuple(subscription),
+            )
+        )
+        self._log(self.ADDED, subscription)
+        return True
+
+    def remove(self, user_id: int, city: str) -> bool:
+        if not super().remove(user_id, city):
+            return False
+        self._writes.put(
+            (
+                "DELETE FROM subscriptions WHERE user_id = ? AND city = ?",
+                (user_id, city),
+            )
+        )
+        self._log(self.REMOVED, Subscription(user_id, city))
+        return True
+
+    def remember_user(self, user_id: int) -> bool:
+        if not super().remember_user(user_id):
+            return False
+        self._writes.put(
+            ("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+        )
+        self._log(self.USER, Subscription(user_id, None))
+        return True
+
+    """
+    The alert is claimed in the database, so only one process sends it, and
+    not again after a restart
+    """
+
+    def claim_alert(self, city: str, eta_ms: float) -> bool:
+        if not super().claim_alert(city, eta_ms):
+            return False
+        with self._db_lock:
+            try:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO fired_alerts (city, eta_ms, origin, fired_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (city, eta_ms, self.origin, time.time()),
+                )
+            except sqlite3.Error as e:
+                print(f"Error claiming the alert for {city}: {e}")
+                return False
+        return cursor.rowcount == 1
+
+    """
+    The log entries since the last sync, or None if some of them were
+    already pruned
+    """
+
+    def _read_log(self) -> Optional[List[tuple]]:
+        with self._db_lock:
+            if self._last_seq() == self._synced_seq:
+                return []
+
+            first = self._db.execute("SELECT MIN(seq) FROM subscription_log")
+            first = first.fetchone()[0]
+            if first is None or first > self._synced_seq + 1:
+                return None
+
+            return self._db.execute(
+                "SELECT seq, origin, op, user_id, city, lat, lon, eta_ms"
+                " FROM subscription_log WHERE seq > ? ORDER BY seq",
+                (self._synced_seq,),
+            ).fetchall()
+
+    def _apply_log(self, entries: List[tuple]) -> List[Change]:
+        changes: List[Change] = []
+        for seq, origin, op, user_id, city, lat, lon, eta_ms in entries:
+            self._synced_seq = seq
+            if origin == self.origin:
+                continue
+
+            if op == self.USER:
+                MemorySubscriptionStore.remember_user(self, user_id)
+            elif op == self.ADDED:
+                subscription = Subscription(user_id, city, lat, lon, eta_ms)
+                if MemorySubscriptionStore.add(self, subscription):
+                    changes.append((subscription, True))
+            elif op == self.REMOVED:
+                subscription = self.get(user_id, city)
+                if MemorySubscriptionStore.remove(self, user_id, city):
+                    changes.append((subscription, False))
+        return changes
+
+    def _read_flushed(self) -> Tuple[MemorySubscriptionStore, int]:
+        # Our own queued writes must be in the tables before they are reread
+        self.flush()
+        return self._read_all()
+
+    def sync(self) -> Optional[List[Change]]:
+        entries = self._read_log()
+        if entries is None:
+            self._swap(*self._read_flushed())
+            return None
+        return self._apply_log(entries)
+
+    """
+    Rereads everything in a thread while the event loop keeps serving, then
+    swaps it in on the loop. Writes made meanwhile are replayed on top.
+    """
+
+    async def _reload(self):
+        self._replay = []
+        try:
+            fresh, seq = await asyncio.to_thread(self._read_flushed)
+            replay = self._replay
+        finally:
+            self._replay = None
+        self._swap(fresh, seq, replay)
+
+    """
+    Syncs every `interval` seconds and passes the changes, if any, to
+    `on_changes`. The database is read in a thread, the changes are applied on
+    the event loop like every other write.
+    """
+
+    def start_sync(
+        self,
+        interval: float,
+        on_changes: Callable[[Optional[List[Change]]], Awaitable[None]],
+    ):
+        async def run():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    entries = await asyncio.to_thread(self._read_log)
+                    if entries is None:
+                        print("Subscriptions fell behind the change log, reloading")
+                        await self._reload()
+                        await on_changes(None)
+                        continue
+                except sqlite3.Error as e:
+                    print(f"Error syncing subscriptions: {e}")
+                    continue
+
+                changes = self._apply_log(entries)
+                if changes:
+                    await on_changes(changes)
+
+        self._sync_task = asyncio.create_task(run())
+
+    async def stop_sync(self):
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        await asyncio.gather(self._sync_task, return_exceptions=True)
+        self._sync_task = None
+
+    def _write_loop(self):
+        db = sqlite3.connect(self.db_path)
+        db.execute("PRAGMA synchronous=NORMAL")
+        pruned_at = 0.0
+
+        running = True
+        while running:
+            batch = [self._writes.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            # A failed batch is kept and tried again, flush() waits until it is in
+            delay = self.RETRY_SECONDS
+            while True:
+                flushed = []
+                try:
+                    with db:
+                        for write in batch:
+                            if write is None:
+                                running = False
+                                continue
+                            if isinstance(write, threading.Event):
+                                flushed.append(write)
+                                continue
+                            db.execute(*write)
+
+                        now = time.time()
+                        if now - pruned_at > self.PRUNE_INTERVAL_SECONDS:
+                            pruned_at = now
+                            db.execute(
+                                "DELETE FROM subscription_log WHERE created_at < ?",
+                                (now - self.LOG_RETENTION_SECONDS,),
+                            )
+                    self.retrying_writes = 0
+                    break
+                except sqlite3.Error as e:
+                    self.write_errors += 1
+                    self.retrying_writes = sum(isinstance(w, tuple) for w in batch)
+                    if self._closing.is_set():
+                        lost, self.retrying_writes = self.retrying_writes, 0
+                        self.lost_writes += lost
+                        print(
+                            f"Error persisting subscriptions, {lost} writes lost: {e}"
+                        )
+                        break
+                    print(f"Error persisting subscriptions, retrying in {delay}s: {e}")
+                    # Cut short by close()
+                    self._closing.wait(delay)
+                    delay = min(delay * 2, self.MAX_RETRY_SECONDS)
+
+            for written in flushed:
+                written.set()
+            for _ in batch:
+                self._writes.task_done()
+
+        db.close()
+
+    """
+    Blocks until every write queued so far is on disk. Writes queued meanwhile
+    are not waited for, so a busy store cannot keep it blocked.
+    """
+
+    def flush(self):
+        if not self._writer.is_alive():
+            return
+        written = threading.Event()
+        self._writes.put(written)
+        written.wait()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending_writes": self._writes.qsize(),
+            "retrying_writes": self.retrying_writes,
+            "write_errors": self.write_errors,
+            "lost_writes": self.lost_writes,
+        }
+
+    def close(self):
+        if self._writer.is_alive():
+            # A batch still failing now is tried once more, then given up
+            self._closing.set()
+            self._writes.put(None)
+            self._writer.join()
+        with self._db_lock:
+            self._db.close()
@@ -1,18 +1,77 @@
 import asyncio
 import logging
+import signal
 import time
 import urllib.parse
-from datetime import datetime
-from typing import Any, Dict, Optional, cast
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, cast
 
-from core.tracker import calculate_arrival_time, get_santa_status
+from core.messages import city_alert, escape_markdown, format_arrival
+from core.route import Route
+from core.tracker import get_santa_status
 
 # Geopy
 from geopy.geocoders import Nominatim
 from geopy.location import Location
 
 # Settings
-from settings import BOT_TOKEN
+from settings import (
+    ADMIN_CHAT_IDS,
+    ADMISSION_CHAT_BURST,
+    ADMISSION_CHAT_RATE,
+    ADMISSION_DUPLICATE_SECONDS,
+    ADMISSION_LOW_SHARE,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_NOTICE_SECONDS,
+    ADMISSION_WAIT_SECONDS,
+    BOT_MODE,
+    BOT_TOKEN,
+    CONCURRENT_UPDATES,
+    DEFAULT_LOCALE,
+    GEOCODE_CACHE_PATH,
+    GEOCODE_NEGATIVE_TTL_SECONDS,
+    GEOCODE_QUEUE_SIZE,
+    GEOCODE_RATE_PER_SECOND,
+    GEOCODE_TIMEOUT_SECONDS,
+    LEASE_TTL_SECONDS,
+    METRICS_HOST,
+    METRICS_PORT,
+    NOMINATIM_DOMAIN,
+    NOMINATIM_SCHEME,
+    OUTBOX_CHAT_BURST,
+    OUTBOX_CHAT_RATE,
+    OUTBOX_CONCURRENCY,
+    OUTBOX_DRAIN_SECONDS,
+    OUTBOX_GLOBAL_RATE,
+    OUTBOX_MAX_RETRIES,
+    OUTBOX_QUEUE_SIZE,
+    PHOTO_MAX_FAILURES,
+    PHOTO_PREWARM_CHAT_ID,
+    PHOTO_PREWARM_INTERVAL_SECONDS,
+    PHOTO_PREWARM_STOPS,
+    PROFILE_DIR,
+    PROFILE_SIGNAL_MODE,
+    PROFILE_SIGNAL_SECONDS,
+    ROUTE_RELOAD_INTERVAL_SECONDS,
+    SLOW_BOT_API_MS,
+    SLOW_HANDLER_MS,
+    SLOW_TRACKER_MS,
+    STATUS_CACHE_SECONDS,
+    SUBSCRIPTIONS_DB_PATH,
+    SUBSCRIPTIONS_SYNC_SECONDS,
+    TELEGRAM_BASE_URL,
+    UPDATE_QUEUE_SIZE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_URL,
+    WORKER_HOST,
+    WORKER_PORT,
+    WORKER_SECRET,
+)
 
 # Telegram library components
 from telegram import (
@@ -23,19 +82,60 @@ from telegram import (
     ReplyKeyboardMarkup,
     Update,
 )
-from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    ContextTypes,
+    MessageHandler,
+    filters,
+)
 from telegram.ext._handlers.commandhandler import CommandHandler
 
 # SantaBot components
+from .admission import HIGH, LOW, Admission
+from .geocoding import GeocodeCache, GeocoderBusy, GeocodingService
+from .lease import Lease
+from .locales import LocaleRegistry
+from .metrics import Histogram, LoopLagMonitor, MetricsServer, Registry
+from .outbox import BULK, INTERACTIVE, Outbox
+from .photos import PhotoCache
+from .profiler import MODES, Profiler
+from .receiver import UpdateReceiver
 from .santa_api import SantaAPI
+from .scheduler import NotificationScheduler
+from .status_cache import StatusSnapshot, StatusSnapshotCache
+from .subscriptions import Change, SQLiteSubscriptionStore, Subscription
 
 """
 Project configuration
 """
+# The route is loaded in post_init, not at import time
 api = SantaAPI()
-route_data = api.get_route()
-geolocator = Nominatim(user_agent="whereissanta")
-seen_users = set()
+# Stop names in the users' languages, loaded on first use
+locales = LocaleRegistry(api, DEFAULT_LOCALE)
+geolocator = Nominatim(
+    user_agent="whereissanta", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME
+)
+
+
+def nominatim_lookup(query: str) -> Optional[Tuple[float, float]]:
+    location = cast(Optional[Location], geolocator.geocode(query))
+    if location is None:
+        return None
+    return location.latitude, location.longitude
+
+
+geocoding_service = GeocodingService(
+    nominatim_lookup,
+    rate=GEOCODE_RATE_PER_SECOND,
+    queue_size=GEOCODE_QUEUE_SIZE,
+    timeout=GEOCODE_TIMEOUT_SECONDS,
+)
+geocoder = GeocodeCache(
+    geocoding_service,
+    GEOCODE_CACHE_PATH,
+    negative_ttl=GEOCODE_NEGATIVE_TTL_SECONDS,
+)
 
 """
 Logger configuration
@@ -44,10 +144,107 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
-# Map to keep track of the cities used by users
-# Since the user base is pretty small, a hashmap is enough
+# Users and the cities each one watches, persisted so a restart keeps them
+subscriptions = SQLiteSubscriptionStore(SUBSCRIPTIONS_DB_PATH)
+
+# Held by the one process that sends the city alerts
+scheduler_lease = Lease(SUBSCRIPTIONS_DB_PATH, "scheduler", ttl=LEASE_TTL_SECONDS)
+
+# Every outgoing message, rate limited for Telegram
+outbox = Outbox(
+    global_rate=OUTBOX_GLOBAL_RATE,
+    chat_rate=OUTBOX_CHAT_RATE,
+    chat_burst=OUTBOX_CHAT_BURST,
+    queue_size=OUTBOX_QUEUE_SIZE,
+    concurrency=OUTBOX_CONCURRENCY,
+    max_retries=OUTBOX_MAX_RETRIES,
+)
+
+# Telegram file_ids of the stop photos already uploaded
+photos = PhotoCache(SUBSCRIPTIONS_DB_PATH, max_failures=PHOTO_MAX_FAILURES)
+
+
+# Sends an alert only while leading, and only if no other process sent it
+def claim_alert(city: str, eta_ms: float) -> bool:
+    return scheduler_lease.held and subscriptions.claim_alert(city, eta_ms)
+
+
+# One timer per watched city, fanning out to all its subscribers
+scheduler = NotificationScheduler(subscriptions, claim=claim_alert)
+
+# /profile and SIGUSR1, reporting slow calls while tracing
+profiler = Profiler(
+    PROFILE_DIR,
+    {
+        "handler": SLOW_HANDLER_MS / 1000,
+        "tracker": SLOW_TRACKER_MS / 1000,
+        "bot_api": SLOW_BOT_API_MS / 1000,
+    },
+)
+profiler.hook(outbox, "trace", "bot_api")
+
+# Time spent handling each update and handler errors, by handler
+handler_latency = Histogram()
+handler_errors: Dict[str, int] = {}
+
+
+def timed(name: str, callback):
+    async def run(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = time.perf_counter()
+        try:
+            await callback(update, context)
+        except Exception:
+            handler_errors[name] = handler_errors.get(name, 0) + 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            handler_latency.observe(elapsed, name)
+            if profiler.tracing:
+                profiler.trace("handler", name, elapsed)
+
+    return run
+
+
+# Per chat limits and a cap on the handlers running at once
+admission = Admission(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    low_share=ADMISSION_LOW_SHARE,
+    wait=ADMISSION_WAIT_SECONDS,
+    chat_rate=ADMISSION_CHAT_RATE,
+    chat_burst=ADMISSION_CHAT_BURST,
+    duplicate_seconds=ADMISSION_DUPLICATE_SECONDS,
+    notice_seconds=ADMISSION_NOTICE_SECONDS,
+)
+
+
+async def answer_busy(update: Update):
+    try:
+        await outbox.send_message(
+            chat_id=update.effective_chat.id,
+            text="🎅🏻 The elves are very busy right now, please try again in a moment!",
+        )
+    except Exception as e:
+        print(f"Error sending busy answer: {e}")
+
+
+async def answer_slow_down(update: Update):
+    try:
+        await outbox.send_message(
+            chat_id=update.effective_chat.id,
+            text="🎅🏻 Ho ho, slow down! I'm still answering your last messages.",
+        )
+    except Exception as e:
+        print(f"Error sending slow down answer: {e}")
+
+
+def guarded(name: str, callback, priority: int = HIGH):
+    return admission.guard(
+        priority,
+        timed(name, callback),
+        on_shed=answer_busy,
+        on_dropped=answer_slow_down,
+    )
 
-notification_sub = {}  # Format: { "city" : [user_id] }
 
 # When pressed, sends Santa current location
 santa_location_btn = "🎅🏻 Where is Santa now?"
@@ -62,8 +259,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_name = update.effective_user.first_name
     user_id = update.effective_user.id
 
-    if user_id not in seen_users:
-        seen_users.add(user_id)
+    if subscriptions.remember_user(user_id):
         logging.info(f"New user: {user_name} ({user_id})")
 
     status_btn = KeyboardButton(santa_location_btn)
@@ -76,71 +272,198 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     if update.effective_chat:
-        await context.bot.send_message(
+        await outbox.send_message(
             chat_id=update.effective_chat.id,
             text=f"🎅🏻 Ho Ho Ho, {user_name}!\n\nI can tell you where's Santa, and I can even notify you when's near you!\nYou can also set custom notifications for specific cities!\nTo get started press one of the buttons below!",
             reply_markup=reply_markup,
         )
 
 
-# Handle Santa's current location
-async def handle_santa_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def language_of(update: Update) -> Optional[str]:
+    return update.effective_user.language_code if update.effective_user else None
+
+
+async def render_status(locale: str, now_ms: float) -> StatusSnapshot:
+    names = await locales.names(locale)
     route = api.get_route()
-    msg, current, next_stop = get_santa_status(route)
+    msg, current, next_stop = get_santa_status(route, now_ms, names.messages)
 
     photo_url = None
 
     # If Santa's at the city, use the city photo
-    if current and "details" in current and current["details"]["photos"]:
-        photo_url = current["details"]["photos"][0]["url"]
+    if current:
+        photo_url = route.photo_url(current["index"])
 
     # If it's flying return the destination photo
-    elif next_stop and "details" in next_stop and next_stop["details"]["photos"]:
-        photo_url = next_stop["details"]["photos"][0]["url"]
+    if not photo_url and next_stop:
+        photo_url = route.photo_url(next_stop["index"])
+
+    # Santa moves on at the next arrival or departure
+    expires_at = route.timeline.next_change(now_ms) if len(route) else None
+    if expires_at is None:
+        expires_at = float("inf")
+
+    return StatusSnapshot((msg, current, next_stop), msg, photo_url, expires_at)
+
+
+# One shared answer per language
+status_caches: Dict[str, StatusSnapshotCache] = {}
+
+
+def status_cache_for(locale: str) -> StatusSnapshotCache:
+    cache = status_caches.get(locale)
+    if cache is None:
+        cache = status_caches[locale] = StatusSnapshotCache(
+            partial(render_status, locale), bucket_seconds=STATUS_CACHE_SECONDS
+        )
+    return cache
+
+
+def status_cache_metrics() -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for cache in list(status_caches.values()):
+        for key, value in cache.metrics().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+# Handle Santa's current location
+async def handle_santa_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    locale = locales.locale_of(language_of(update))
+    snapshot = await status_cache_for(locale).get()
+    msg = snapshot.caption
+    photo_url = snapshot.photo_url
 
     if not update.effective_chat:
         return
 
-    if photo_url:
+    if photo_url and photos.usable(photo_url):
         try:
-            await context.bot.send_photo(
-                chat_id=update.effective_chat.id,
-                photo=photo_url,
+            await photos.send(
+                outbox,
+                update.effective_chat.id,
+                photo_url,
+                INTERACTIVE,
                 caption=msg,
                 parse_mode="Markdown",
             )
         except Exception as e:
             print(f"Error sending photo {e}")
             # Fallback to default
-            await context.bot.send_message(
+            await outbox.send_message(
                 chat_id=update.effective_chat.id, text=msg, parse_mode="Markdown"
             )
     else:
-        # No photo found, just send text
-        await context.bot.send_message(
+        # No photo found, or it keeps failing, just send text
+        await outbox.send_message(
             chat_id=update.effective_chat.id, text=msg, parse_mode="Markdown"
         )
 
 
-# Alert for cities not present in data
-async def send_custom_alert(context: ContextTypes.DEFAULT_TYPE):
-    job = context.job
+# List the next stops on Santa's route
+async def upcoming_stops(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_chat:
+        return
+
+    count = 5
+    if context.args and context.args[0].isdigit():
+        count = max(1, min(int(context.args[0]), 20))
 
-    if not job or not job.data:
+    names = await locales.names(language_of(update))
+    route = api.get_route()
+    upcoming = route.timeline.upcoming(time.time() * 1000, count)
+
+    if not upcoming:
+        await outbox.send_message(
+            chat_id=update.effective_chat.id,
+            text="🎅🏻 Santa has no more stops this year. See you next Christmas!",
+        )
         return
 
-    job_data = cast(Dict[str, Any], job.data)  # needs to be explicitly casted!
+    lines = []
+    for i in upcoming:
+        time_str = names.messages.arrival_text(i)
+        lines.append(f"- {names.cities[i]}, {names.regions[i]} ({time_str})")
+
+    await outbox.send_message(
+        chat_id=update.effective_chat.id,
+        text="🛷 Santa's next stops:\n" + "\n".join(lines),
+    )
 
-    user_id = job_data["user_id"]
-    city_name = job_data["city"]
 
-    await context.bot.send_message(
-        chat_id=user_id,
-        text=f"🚨 **SANTA ALERT!** 🚨\n\nSanta is estimated to be flying near **{city_name}** right now! 👀 Look up!",
-        parse_mode="Markdown",
+# Photos of the next stops, uploaded ahead of Santa's arrival
+def upcoming_photo_urls() -> List[str]:
+    route = api.get_route()
+    urls = []
+    for i in route.timeline.upcoming(time.time() * 1000, PHOTO_PREWARM_STOPS):
+        url = route.photo_url(i)
+        if url:
+            urls.append(url)
+    return urls
+
+
+# Alert for cities not present in data
+async def send_city_alerts(city: str, user_ids: Set[int], on_route: bool):
+    text = city_alert(city, on_route)
+
+    # Waits only when the outbox is full, failures are reported by the outbox
+    for user_id in user_ids:
+        await outbox.post(
+            "send_message", user_id, BULK, text=text, parse_mode="Markdown"
+        )
+
+
+# ETA of a stored subscription on the current route, at startup or after a reload
+def subscription_eta(subscription: Subscription) -> Optional[float]:
+    route = api.get_route()
+
+    if subscription.lat is not None and subscription.lon is not None:
+        match = api.match_segment(subscription.lat, subscription.lon, route)
+        return match.eta_ms if match else None
+
+    stop_index = route.index_of_city(subscription.city)
+    return route.arrival[stop_index] if stop_index is not None else None
+
+
+# A new data file was swapped in, or the year rolled over
+async def on_route_reload(route: Route):
+    for cache in status_caches.values():
+        cache.invalidate()
+    changed = await scheduler.replan(subscription_eta)
+    logging.info(
+        f"Route reloaded (epoch {api.epoch}, {len(route)} stops), "
+        f"{changed} city alerts replanned"
     )
 
 
+# Subscriptions made through the other processes
+async def on_subscriptions_synced(changes: Optional[List[Change]]):
+    if changes is None:
+        await scheduler.replan(subscription_eta)
+        return
+
+    for subscription, added in changes:
+        if not added:
+            # The alert goes to the subscribers left when it is due
+            continue
+        eta_ms = subscription_eta(subscription)
+        if eta_ms is not None:
+            on_route = subscription.lat is None
+            scheduler.schedule(subscription.city, eta_ms, on_route)
+
+
+async def on_elected():
+    logging.info("Elected to send the city alerts")
+    # Catches up with what the previous leader had planned
+    await scheduler.rebuild(subscription_eta)
+    scheduler.start(send_city_alerts)
+
+
+async def on_deposed():
+    logging.info("No longer sending the city alerts")
+    await scheduler.stop()
+
+
 # Set custom city notification
 async def set_notification(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_chat:
@@ -150,7 +473,7 @@ async def set_notification(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check if the user asked for a city
     if context.args is None or len(context.args) == 0:
-        await context.bot.send_message(
+        await outbox.send_message(
             chat_id=user_id,
             text="Ho Ho Ho! You forgot to tell me the city!\nUsage: `/notify <city_name>`",
             parse_mode="Markdown",
@@ -158,96 +481,93 @@ async def set_notification(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     target_city = " ".join(context.args).title()
+    names = await locales.names(language_of(update))
     route = api.get_route()
-    valid_cities = {stop["city"]: stop for stop in route}
+    stop_index = names.index_of_city(target_city)
+    if stop_index is None:
+        stop_index = route.index_of_city(target_city)
 
     # Exact Match
-    if target_city in valid_cities:
-        if target_city not in notification_sub:
-            notification_sub[target_city] = []
-
-        if user_id not in notification_sub[target_city]:
-            notification_sub[target_city].append(user_id)
-
-            stop_data = valid_cities[target_city]
+    if stop_index is not None:
+        # Stored and scheduled under the route's own name, whatever the language
+        target_city = route.cities[stop_index]
+        subscription = Subscription(
+            user_id, target_city, eta_ms=route.arrival[stop_index]
+        )
+        if subscriptions.add(subscription):
+            scheduler.schedule(target_city, route.arrival[stop_index], on_route=True)
 
-            arrival_ts = stop_data["arrival"] / 1000
-            dt_object = datetime.fromtimestamp(arrival_ts)
-            time_str = dt_object.strftime("%d %B at %H:%M")
+            city = names.messages.city(stop_index)
+            time_str = names.messages.arrival_text(stop_index)
 
-            await context.bot.send_message(
+            await outbox.send_message(
                 chat_id=user_id,
-                text=f"✅ All set! I'll send you a message when Santa arrives in {target_city}!\n"
-                + f"He should be passing over **{target_city}** around **{time_str}**.\n\n",
+                text=f"✅ All set! I'll send you a message when Santa arrives in {city}!\n"
+                + f"He should be passing over **{city}** around **{time_str}**.\n\n",
                 parse_mode="Markdown",
             )
         else:
-            await context.bot.send_message(
+            await outbox.send_message(
                 chat_id=user_id,
-                text=f"‼️ You are already watching {target_city}!",
+                text=f"‼️ You are already watching {names.cities[stop_index]}!",
             )
         return
 
     # Geocode Fallback
-    await context.bot.send_message(
+    await outbox.send_message(
         chat_id=user_id,
         text=f"🔍 '{target_city}' isn't on the main route. Checking for the closest stop...",
     )
 
     try:
-        loop = asyncio.get_running_loop()
-
-        raw_result = await loop.run_in_executor(
-            None, lambda: geolocator.geocode(target_city)
-        )
-
-        location = cast(Optional[Location], raw_result)
+        try:
+            location = await geocoder.lookup(target_city)
+        except (GeocoderBusy, TimeoutError):
+            await outbox.send_message(
+                chat_id=user_id,
+                text="🦌 The reindeer are a bit busy right now. Please try again shortly!",
+            )
+            return
 
         if location is None:
-            await context.bot.send_message(
+            await outbox.send_message(
                 chat_id=user_id,
                 text=f"I could not find {target_city}. Are you sure of the spelling?",
             )
             return
 
-        lat = location.latitude
-        lon = location.longitude
+        lat, lon = location
 
-        eta_ms = calculate_arrival_time(lat, lon, route)
-        if eta_ms:
+        match = api.match_segment(lat, lon, route)
+        if match:
             # convert to seconds (for JobQueue)
-            eta_s = eta_ms / 1000
+            eta_s = match.eta_ms / 1000
             current_time_s = time.time()
             delay = eta_s - current_time_s
 
-            if target_city not in notification_sub:
-                notification_sub[target_city] = []
-            if user_id not in notification_sub[target_city]:
-                notification_sub[target_city].append(user_id)
+            subscriptions.add(
+                Subscription(user_id, target_city, lat, lon, match.eta_ms)
+            )
 
-            if delay > 0 and context.job_queue:
+            if delay > 0:
                 # Schedule the alert
-                context.job_queue.run_once(
-                    send_custom_alert,
-                    when=delay,
-                    data={"user_id": user_id, "city": target_city},
-                )
+                scheduler.schedule(target_city, match.eta_ms, on_route=False)
 
                 # Pretty print the time
-                dt_object = datetime.fromtimestamp(eta_s)
-                time_str = dt_object.strftime("%d %B at %H:%M:%S")
-                await context.bot.send_message(
+                time_str = format_arrival(match.eta_ms, seconds=True)
+                await outbox.send_message(
                     chat_id=user_id,
                     text=(
                         f"🎅🏻 I've calculated Santa's flight path!\n"
-                        f"He should be passing over **{target_city}** around **{time_str}**.\n\n"
+                        f"He should be passing over **{escape_markdown(target_city)}** around **{time_str}**, "
+                        f"between **{names.messages.city(match.segment)}** and **{names.messages.city(match.segment + 1)}**.\n\n"
                         f"✅ I've set a custom alarm for you at that exact time!"
                     ),
                     parse_mode="Markdown",
                 )
                 return
             else:
-                await context.bot.send_message(
+                await outbox.send_message(
                     chat_id=user_id,
                     text=f"🎅🏻 Santa has already passed {target_city} this year!",
                 )
@@ -264,10 +584,10 @@ async def list_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = update.effective_chat.id
 
     # List subscriptions for the user
-    user_subs = [city for city, sub in notification_sub.items() if user_id in sub]
+    user_subs = list(subscriptions.cities_of(user_id))
 
     if not user_subs:
-        await context.bot.send_message(
+        await outbox.send_message(
             chat_id=user_id,
             text="🔕 You have no active subscriptions.\nUse `/notify <city>` to add one!",
             parse_mode="Markdown",
@@ -277,9 +597,9 @@ async def list_subscriptions(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_subs.sort()
 
     msg = "🔔 Your active subscriptions:\n"
-    msg += "\n".join(f"- {city}" for city in user_subs)
+    msg += "\n".join(f"- {escape_markdown(city)}" for city in user_subs)
 
-    await context.bot.send_message(
+    await outbox.send_message(
         chat_id=user_id,
         text=msg,
         parse_mode="Markdown",
@@ -293,7 +613,7 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_chat.id
 
     if context.args is None or len(context.args) == 0:
-        await context.bot.send_message(
+        await outbox.send_message(
             chat_id=user_id,
             text="You need to specify a city to unsubscribe from.\nUsage: `/unsubscribe <city>`",
             parse_mode="Markdown",
@@ -301,21 +621,22 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     target_city = " ".join(context.args).title()
-
-    if target_city in notification_sub and user_id in notification_sub[target_city]:
-        notification_sub[target_city].remove(user_id)
-        if not notification_sub[target_city]:
-            del notification_sub[target_city]
-
-        await context.bot.send_message(
+    # Route cities are stored under the route's own name
+    names = await locales.names(language_of(update))
+    stop_index = names.index_of_city(target_city)
+    if stop_index is not None:
+        target_city = api.get_route().cities[stop_index]
+
+    if subscriptions.remove(user_id, target_city):
+        await outbox.send_message(
             chat_id=user_id,
-            text=f"✅ You have unsubscribed from **{target_city}**.",
+            text=f"✅ You have unsubscribed from **{escape_markdown(target_city)}**.",
             parse_mode="Markdown",
         )
     else:
-        await context.bot.send_message(
+        await outbox.send_message(
             chat_id=user_id,
-            text=f"You are not subscribed to **{target_city}**.",
+            text=f"You are not subscribed to **{escape_markdown(target_city)}**.",
             parse_mode="Markdown",
         )
 
@@ -328,36 +649,31 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_chat.id
 
     # Global stats (user count, most popular city and total alerts)
-    user_count = len(seen_users)
-    total_alerts = len(notification_sub)
-    total_active_alerts = sum(len(users) for users in notification_sub.values())
+    user_count = subscriptions.user_count()
+    total_alerts = subscriptions.city_total()
+    total_active_alerts = len(subscriptions)
 
     # most popular city
-    if notification_sub:
-        top_count = max(len(users) for users in notification_sub.values())
-
-        most_popular_cities = [
-            city for city, users in notification_sub.items() if len(users) == top_count
-        ]
+    if total_alerts:
+        top_count, most_popular_cities = subscriptions.stats.top()
 
         label = "Top Cities" if len(most_popular_cities) > 1 else "Top City"
-        most_popular_city = f"🏆 **{label}:** {', '.join(sorted(most_popular_cities))} ({top_count} users)"
+        most_popular_city = f"🏆 **{label}:** {', '.join(escape_markdown(c) for c in sorted(most_popular_cities))} ({top_count} users)"
     else:
         most_popular_city = "🏆 **Top City:** None yet!"
 
     # User specific stats (cities subscribed, active alerts)
-    user_city = [
-        city for city, subscribers in notification_sub.items() if user_id in subscribers
-    ]
+    user_city = sorted(subscriptions.cities_of(user_id))
 
     social_msg = ""
     if user_city:
         for city in user_city:
-            others_count = len(notification_sub[city]) - 1
+            others_count = subscriptions.subscriber_count(city) - 1
+            name = escape_markdown(city)
             if others_count > 0:
-                social_msg += f"\n🎅🏻 Oh! Oh! Oh! Looks like **you and {others_count} others** are interested in Santa's path to **{city}**!"
+                social_msg += f"\n🎅🏻 Oh! Oh! Oh! Looks like **you and {others_count} others** are interested in Santa's path to **{name}**!"
             else:
-                social_msg += f"\n🎅🏻 You are the **first one** waiting for Santa in **{city}**! Tell your friends!"
+                social_msg += f"\n🎅🏻 You are the **first one** waiting for Santa in **{name}**! Tell your friends!"
     else:
         social_msg = "\nYou aren't tracking any specific cities yet. Use `/notify <city>` to join!\n"
 
@@ -372,7 +688,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"{social_msg}"
     )
 
-    await context.bot.send_message(chat_id=user_id, text=report, parse_mode="Markdown")
+    await outbox.send_message(chat_id=user_id, text=report, parse_mode="Markdown")
     return
 
 
@@ -394,7 +710,7 @@ async def share_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     inline_btn = InlineKeyboardButton("📤 Send to Contacts", url=telegram_share_link)
     reply_markup = InlineKeyboardMarkup([[inline_btn]])
 
-    await context.bot.send_message(
+    await outbox.send_message(
         chat_id=update.effective_chat.id,
         text="Spread the holiday cheer! 🎄\nClick the button below to share the bot with your friends and family.",
         reply_markup=reply_markup,
@@ -414,23 +730,121 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🎄Oh Oh Oh! Here are the available commands:\n\n"
         "/start - Start the bot\n"
         "/list - List of the cities you're tracking\n"
+        "/upcoming - Show Santa's next stops\n"
         "/stats - Show statistics\n"
         "/notify - Set notification for a specific city\n"
         "/unsubscribe - Unsubscribe from a city\n"
         "/help - Show help (this menu)"
         "/share - Share the bot with your friends and family"
     )
-    await context.bot.send_message(
+    await outbox.send_message(
         chat_id=update.effective_chat.id,
         text=help_text,
         parse_mode="HTML",
     )
 
 
+# Reports a finished profile to `chat_id` or, from SIGUSR1, to the log
+async def report_profile(
+    chat_id: Optional[int], path: Optional[Path], error: Optional[Exception]
+):
+    if error is not None:
+        report = f"Profiling failed: {error}"
+    else:
+        report = f"Profile written to {path}\n\n{profiler.summary(path)}"
+        if profiler.slow_calls:
+            report += f"\n\n{len(profiler.slow_calls)} slow calls, see the log"
+
+    if chat_id is None:
+        logging.info(report)
+        return
+    await outbox.send_message(chat_id=chat_id, text=report[:4000])
+
+
+# Admin only: /profile [seconds] [cpu|sample] [trace]
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_chat:
+        return
+
+    seconds, mode, traces = 10.0, "cpu", False
+    for arg in context.args or []:
+        if arg.isdigit():
+            seconds = max(1, min(int(arg), 300))
+        elif arg in MODES:
+            mode = arg
+        elif arg == "trace":
+            traces = True
+
+    # In the background, the handler's concurrency slot is not held meanwhile
+    if profiler.start(
+        seconds, mode, traces, partial(report_profile, update.effective_chat.id)
+    ):
+        text = f"Profiling ({mode}) for {seconds:.0f}s..."
+    else:
+        text = "A profile is already running."
+    await outbox.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+# Everything /metrics exposes
+loop_lag = LoopLagMonitor()
+metrics = Registry()
+metrics.histogram(
+    "santa_handler_seconds", "Time to handle an update", handler_latency, ("handler",)
+)
+metrics.value(
+    "santa_handler_errors_total",
+    "Updates whose handler raised",
+    lambda: handler_errors,
+    "counter",
+    ("handler",),
+)
+metrics.histogram(
+    "santa_bot_api_seconds", "Bot API call latency", outbox.latency, ("method",)
+)
+metrics.value(
+    "santa_bot_api_errors_total",
+    "Failed Bot API calls",
+    lambda: outbox.errors,
+    "counter",
+    ("method", "error"),
+)
+metrics.histogram(
+    "santa_geocoder_seconds", "Nominatim lookup latency", geocoding_service.latency
+)
+metrics.value(
+    "santa_route_load_seconds",
+    "Time the last route load took",
+    lambda: api.load_seconds,
+)
+metrics.value("santa_route_epoch", "Route loads since start", lambda: api.epoch)
+metrics.value("santa_subscriptions", "Active subscriptions", lambda: len(subscriptions))
+metrics.value(
+    "santa_subscribed_cities", "Cities with subscribers", subscriptions.city_total
+)
+metrics.value("santa_users", "Users who started the bot", subscriptions.user_count)
+metrics.histogram(
+    "santa_scheduler_lag_seconds", "Delay of city alerts past their ETA", scheduler.lag
+)
+metrics.histogram(
+    "santa_event_loop_lag_seconds", "Event loop wake-up delay", loop_lag.lag
+)
+metrics.source("santa_outbox", outbox.metrics)
+metrics.source("santa_scheduler", scheduler.metrics)
+metrics.source("santa_geocoder", geocoding_service.metrics)
+metrics.source("santa_geocode_cache", geocoder.metrics)
+metrics.source("santa_photos", photos.metrics)
+metrics.source("santa_status_cache", status_cache_metrics)
+metrics.source("santa_locales", locales.metrics)
+metrics.source("santa_admission", admission.metrics)
+metrics.source("santa_subscription_store", subscriptions.metrics)
+metrics_server = MetricsServer(metrics)
+
+
 async def post_init(application):
     commands = [
         BotCommand("start", "Start the bot"),
         BotCommand("list", "List subscriptions"),
+        BotCommand("upcoming", "Show Santa's next stops"),
         BotCommand("stats", "Show statistics"),
         BotCommand("notify", "Set notification"),
         BotCommand("unsubscribe", "Unsubscribe from a city"),
@@ -440,6 +854,58 @@ async def post_init(application):
 
     await application.bot.set_my_commands(commands)
 
+    loop_lag.start()
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1,
+            profiler.start,
+            PROFILE_SIGNAL_SECONDS,
+            PROFILE_SIGNAL_MODE,
+            True,
+            partial(report_profile, None),
+        )
+    if METRICS_PORT:
+        await metrics_server.start(METRICS_HOST, METRICS_PORT)
+
+    # Ready before the first update, without blocking the event loop
+    await asyncio.to_thread(api.get_route)
+
+    outbox.start(application.bot)
+    scheduler_lease.start(on_elected, on_deposed)
+    if SUBSCRIPTIONS_SYNC_SECONDS:
+        subscriptions.start_sync(SUBSCRIPTIONS_SYNC_SECONDS, on_subscriptions_synced)
+    api.start_watching(ROUTE_RELOAD_INTERVAL_SECONDS, on_route_reload)
+
+    if PHOTO_PREWARM_CHAT_ID:
+        photos.start_prewarm(
+            outbox,
+            PHOTO_PREWARM_CHAT_ID,
+            upcoming_photo_urls,
+            PHOTO_PREWARM_INTERVAL_SECONDS,
+        )
+
+
+# Runs once the handlers are drained, while the bot can still send
+async def post_stop(application):
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+    await profiler.stop()
+    await api.stop()
+    await subscriptions.stop_sync()
+    # Stops the scheduler and lets another process take over right away
+    await scheduler_lease.stop()
+    await photos.stop()
+    await outbox.drain(OUTBOX_DRAIN_SECONDS)
+    await outbox.stop()
+    await loop_lag.stop()
+
+
+async def post_shutdown(application):
+    await metrics_server.stop()
+    await geocoding_service.stop()
+    photos.close()
+    subscriptions.close()
+
 
 def run_bot():
     """Entry point to start the bot."""
@@ -447,20 +913,110 @@ def run_bot():
         print("Error: BOT_TOKEN is missing in settings.py or .env")
         return
 
-    application = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).build()
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        print("Error: WEBHOOK_URL is required in webhook mode")
+        return
+
+    if BOT_MODE == "worker" and not WORKER_SECRET:
+        print("Error: WORKER_SECRET is required in worker mode")
+        return
 
-    application.add_handler(CommandHandler("start", start))
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(CONCURRENT_UPDATES)
+        # One connection per concurrent outbox send, the default is a single one
+        .connection_pool_size(OUTBOX_CONCURRENCY)
+    )
+    if TELEGRAM_BASE_URL:
+        # e.g. a local Bot API server or a fake one for load tests
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    if BOT_MODE == "worker":
+        # Updates come from the dispatcher
+        builder = builder.updater(None)
+
+    application = (
+        builder.post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    application.add_handler(CommandHandler("start", guarded("start", start)))
+    application.add_handler(
+        MessageHandler(
+            filters.Text([santa_location_btn]),
+            guarded("santa_location", handle_santa_location),
+        )
+    )
+    application.add_handler(
+        CommandHandler("notify", guarded("notify", set_notification))
+    )
+    application.add_handler(
+        CommandHandler("unsubscribe", guarded("unsubscribe", unsubscribe))
+    )
     application.add_handler(
-        MessageHandler(filters.Text([santa_location_btn]), handle_santa_location)
+        CommandHandler("list", guarded("list", list_subscriptions, LOW))
     )
-    application.add_handler(CommandHandler("notify", set_notification))
-    application.add_handler(CommandHandler("unsubscribe", unsubscribe))
-    application.add_handler(CommandHandler("list", list_subscriptions))
-    application.add_handler(CommandHandler("stats", stats))
     application.add_handler(
-        MessageHandler(filters.Regex(f"^{share_btn_text}$"), share_bot)
+        CommandHandler("upcoming", guarded("upcoming", upcoming_stops, LOW))
     )
-    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("stats", guarded("stats", stats, LOW)))
+    application.add_handler(
+        MessageHandler(
+            filters.Regex(f"^{share_btn_text}$"), guarded("share", share_bot, LOW)
+        )
+    )
+    application.add_handler(CommandHandler("help", guarded("help", help_command, LOW)))
+    if ADMIN_CHAT_IDS:
+        application.add_handler(
+            CommandHandler(
+                "profile",
+                timed("profile", profile_command),
+                filters=filters.Chat(chat_id=ADMIN_CHAT_IDS),
+            )
+        )
 
-    print("Santa Bot is running...")
-    application.run_polling()
+    print(f"Santa Bot is running ({BOT_MODE})...")
+
+    # All stop on SIGINT/SIGTERM after the running handlers have finished
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_SECRET_TOKEN:
+            print("Warning: WEBHOOK_SECRET_TOKEN is not set, updates are not verified")
+
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    elif BOT_MODE == "worker":
+        asyncio.run(run_worker(application))
+    else:
+        application.run_polling()
+
+
+# What run_polling does, with updates received from the dispatcher
+async def run_worker(application: Application):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    receiver = UpdateReceiver(application, WORKER_SECRET)
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    await receiver.start(WORKER_HOST, WORKER_PORT)
+
+    await stop.wait()
+
+    await receiver.stop()
+    # Handles the updates already received before stopping
+    await application.stop()
+    await post_stop(application)
+    await application.shutdown()
+    await post_shutdown(application)
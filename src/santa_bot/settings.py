@@ -7,7 +7,132 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 ENV_PATH = BASE_DIR / ".env"
 
 load_dotenv(dotenv_path=ENV_PATH)
+# Only needed to run the bot: offline commands like compile-route work without
+# it, and run_bot/run_dispatcher refuse to start when it is missing
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
-if not BOT_TOKEN:
-    raise ValueError("No BOT_TOKEN found! Please set it in your .env file.")
+# How often the route data is checked for changes and for the year rollover
+ROUTE_RELOAD_INTERVAL_SECONDS = float(os.getenv("ROUTE_RELOAD_INTERVAL_SECONDS", "60"))
+
+# Every "Where is Santa now?" request inside the same bucket shares one answer
+STATUS_CACHE_SECONDS = float(os.getenv("STATUS_CACHE_SECONDS", "15"))
+
+# Language of the main data file, used when a user's language has no data
+# file of its own (data/santa_<language>.json)
+DEFAULT_LOCALE = os.getenv("DEFAULT_LOCALE", "en")
+
+# Geocoding results for cities that are not on the route
+GEOCODE_CACHE_PATH = Path(
+    os.getenv("GEOCODE_CACHE_PATH", BASE_DIR / "data" / "geocode_cache.sqlite3")
+)
+GEOCODE_NEGATIVE_TTL_SECONDS = float(os.getenv("GEOCODE_NEGATIVE_TTL_SECONDS", "3600"))
+
+# Nominatim server, e.g. a self-hosted one or a fake one for load tests
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
+
+# Nominatim allows at most 1 request per second
+GEOCODE_RATE_PER_SECOND = float(os.getenv("GEOCODE_RATE_PER_SECOND", "1"))
+GEOCODE_QUEUE_SIZE = int(os.getenv("GEOCODE_QUEUE_SIZE", "100"))
+GEOCODE_TIMEOUT_SECONDS = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "15"))
+
+# City subscriptions, kept across restarts
+SUBSCRIPTIONS_DB_PATH = Path(
+    os.getenv("SUBSCRIPTIONS_DB_PATH", BASE_DIR / "data" / "subscriptions.sqlite3")
+)
+
+# Outgoing messages: Telegram allows ~30 messages/second overall and
+# ~1 message/second to the same chat
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = float(os.getenv("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_QUEUE_SIZE = int(os.getenv("OUTBOX_QUEUE_SIZE", "10000"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "16"))
+OUTBOX_MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", "3"))
+
+# Sends of a stop photo that may fail before it is skipped. The file_ids of the
+# photos are kept in the subscriptions database, so each is uploaded only once.
+PHOTO_MAX_FAILURES = int(os.getenv("PHOTO_MAX_FAILURES", "3"))
+
+# Chat the photos of the next stops are uploaded to ahead of time, e.g. a
+# private channel of the bot. Prewarming is off when it is not set.
+PHOTO_PREWARM_CHAT_ID = int(os.getenv("PHOTO_PREWARM_CHAT_ID", "0"))
+PHOTO_PREWARM_STOPS = int(os.getenv("PHOTO_PREWARM_STOPS", "10"))
+PHOTO_PREWARM_INTERVAL_SECONDS = float(
+    os.getenv("PHOTO_PREWARM_INTERVAL_SECONDS", "300")
+)
+OUTBOX_DRAIN_SECONDS = float(os.getenv("OUTBOX_DRAIN_SECONDS", "10"))
+
+# Bot API base URL the token is appended to, e.g. http://localhost:8081/bot
+# Empty for api.telegram.org
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "")
+
+# How updates are received: "polling", "webhook", or "dispatcher" (one process
+# polls and forwards to WORKERS bot processes, started in "worker" mode)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Webhook mode: the embedded server listens on WEBHOOK_LISTEN:WEBHOOK_PORT at
+# WEBHOOK_PATH, and Telegram is told to post updates to WEBHOOK_URL, the
+# public address (e.g. https://example.com/telegram behind a reverse proxy)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, off when 0.
+# With several workers, worker i uses METRICS_PORT + i.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# /profile is only answered in these chats (comma separated ids), and is off
+# when there are none. Profiles are written to PROFILE_DIR.
+ADMIN_CHAT_IDS = [
+    int(chat_id) for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id
+]
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "data" / "profiles"))
+# SIGUSR1 profiles for this long, "cpu" or "sample", with traces
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+PROFILE_SIGNAL_MODE = os.getenv("PROFILE_SIGNAL_MODE", "sample")
+# Calls logged as slow while tracing
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "500"))
+SLOW_TRACKER_MS = float(os.getenv("SLOW_TRACKER_MS", "20"))
+SLOW_BOT_API_MS = float(os.getenv("SLOW_BOT_API_MS", "1000"))
+
+# Updates waiting to be handled. When full, new updates wait before they are
+# accepted, so Telegram slows down instead of the bot running out of memory.
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+# Updates handled at the same time
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+
+# Admission control: at most ADMISSION_MAX_CONCURRENT handlers run at once, and
+# low priority commands (/stats, /list...) only up to ADMISSION_LOW_SHARE of
+# them. Status requests wait up to ADMISSION_WAIT_SECONDS for a free slot.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "48"))
+ADMISSION_LOW_SHARE = float(os.getenv("ADMISSION_LOW_SHARE", "0.5"))
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "5"))
+# Updates each chat can send per second, and in a burst, before they are dropped
+ADMISSION_CHAT_RATE = float(os.getenv("ADMISSION_CHAT_RATE", "1"))
+ADMISSION_CHAT_BURST = float(os.getenv("ADMISSION_CHAT_BURST", "5"))
+# The same message from the same user in a chat is ignored for this long after
+# the first
+ADMISSION_DUPLICATE_SECONDS = float(os.getenv("ADMISSION_DUPLICATE_SECONDS", "2"))
+# Chats whose updates are dropped are told to slow down at most this often
+ADMISSION_NOTICE_SECONDS = float(os.getenv("ADMISSION_NOTICE_SECONDS", "30"))
+
+# Dispatcher mode: worker i listens on WORKER_HOST:WORKER_BASE_PORT + i
+WORKERS = int(os.getenv("WORKERS", "4"))
+WORKER_HOST = os.getenv("WORKER_HOST", "127.0.0.1")
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8600"))
+# Worker mode, set by the dispatcher: this worker's port and the token every
+# forwarded update carries (random for each run when empty)
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8600"))
+WORKER_SECRET = os.getenv("WORKER_SECRET", "")
+
+# Only the process holding the lease sends the city alerts. A stopped leader
+# is replaced after at most this long.
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", "15"))
+# How often changes other processes made to the subscriptions are picked up,
+# 0 when a single process uses the database
+SUBSCRIPTIONS_SYNC_SECONDS = float(os.getenv("SUBSCRIPTIONS_SYNC_SECONDS", "0"))
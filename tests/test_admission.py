@@ -0,0 +1,238 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import pytest
+
+from services.admission import HIGH, LOW, Admission
+
+"""
+Synthetic floods against the admission layer. Handlers are fakes that count
+what they handle, and can be held until the test releases them.
+"""
+
+STATUS = "🎅🏻 Where is Santa now?"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Flood:
+    def __init__(self, admission: Admission):
+        self.admission = admission
+        self.handled: Dict[int, int] = {}
+        self.started: List[int] = []
+        self.busy: List[int] = []
+        self.slowed: List[int] = []
+        self.running = 0
+        self.peak = 0
+        # Handlers wait for this while set to an unset event
+        self.hold: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._handlers = {}
+
+    async def _handle(self, update, context):
+        self.started.append(update.effective_chat.id)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            if self.hold is not None:
+                await self.hold.wait()
+            await asyncio.sleep(0)
+        finally:
+            self.running -= 1
+        chat_id = update.effective_chat.id
+        self.handled[chat_id] = self.handled.get(chat_id, 0) + 1
+
+    async def _busy(self, update):
+        self.busy.append(update.effective_chat.id)
+
+    async def _slow_down(self, update):
+        self.slowed.append(update.effective_chat.id)
+
+    def send(
+        self,
+        chat_id: int,
+        text: str = STATUS,
+        priority: int = HIGH,
+        user_id: Optional[int] = None,
+    ):
+        if priority not in self._handlers:
+            self._handlers[priority] = self.admission.guard(
+                priority, self._handle, on_shed=self._busy, on_dropped=self._slow_down
+            )
+        update = SimpleNamespace(
+            effective_chat=SimpleNamespace(id=chat_id),
+            effective_user=SimpleNamespace(id=chat_id if user_id is None else user_id),
+            effective_message=SimpleNamespace(text=text),
+        )
+        self._tasks.append(asyncio.create_task(self._handlers[priority](update, None)))
+
+    async def settle(self):
+        # Lets every started update reach its handler, or be turned away
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def finish(self):
+        if self.hold is not None:
+            self.hold.set()
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+async def test_spammer_is_held_to_its_bucket(clock):
+    admission = Admission(chat_rate=1.0, chat_burst=5.0, clock=clock)
+    flood = Flood(admission)
+
+    for i in range(500):
+        flood.send(0, f"/notify Spam {i}")
+    for chat_id in range(1, 51):
+        flood.send(chat_id)
+    await flood.finish()
+
+    assert flood.handled[0] == 5
+    assert admission.throttled == 495
+    assert all(flood.handled[chat_id] == 1 for chat_id in range(1, 51))
+
+    # The bucket refills at chat_rate
+    clock.now += 3
+    for i in range(500, 510):
+        flood.send(0, f"/notify Spam {i}")
+    await flood.finish()
+    assert flood.handled[0] == 8
+
+
+async def test_double_presses_are_handled_once(clock):
+    admission = Admission(duplicate_seconds=2.0, clock=clock)
+    flood = Flood(admission)
+    flood.hold = asyncio.Event()
+
+    # Presses while the first one is being handled
+    for _ in range(5):
+        for chat_id in range(1, 101):
+            flood.send(chat_id)
+        await flood.settle()
+    await flood.finish()
+
+    assert sum(flood.handled.values()) == 100
+    assert admission.duplicates == 400
+
+    # And shortly after it was answered
+    clock.now += 1
+    flood.send(1)
+    await flood.finish()
+    assert flood.handled[1] == 1
+
+    clock.now += 1.5
+    flood.send(1)
+    await flood.finish()
+    assert flood.handled[1] == 2
+
+
+async def test_group_members_pressing_together_are_all_answered(clock):
+    admission = Admission(chat_burst=10.0, clock=clock)
+    flood = Flood(admission)
+    flood.hold = asyncio.Event()
+
+    for user_id in range(1, 6):
+        flood.send(-100, user_id=user_id)
+        flood.send(-100, user_id=user_id)
+    await flood.finish()
+
+    assert flood.handled[-100] == 5
+    assert admission.duplicates == 5
+
+
+async def test_dropped_updates_get_one_slow_down_answer_per_window(clock):
+    admission = Admission(chat_burst=5.0, notice_seconds=30.0, clock=clock)
+    flood = Flood(admission)
+
+    for i in range(100):
+        flood.send(0, f"/notify Spam {i}")
+    for _ in range(3):
+        flood.send(1)
+        await flood.settle()
+    await flood.finish()
+
+    assert admission.throttled == 95
+    assert admission.duplicates == 2
+    assert flood.slowed == [0, 1]
+
+    clock.now += 10
+    flood.send(0, "/notify Spam again")
+    flood.send(0, "/notify Spam again")
+    await flood.finish()
+    assert flood.slowed == [0, 1]
+
+    clock.now += 25
+    for i in range(50):
+        flood.send(0, f"/notify More spam {i}")
+    await flood.finish()
+    assert flood.slowed == [0, 1, 0]
+    assert admission.metrics()["notices"] == 3
+
+
+async def test_overload_sheds_low_priority_first(clock):
+    admission = Admission(max_concurrent=8, low_share=0.5, wait=5.0, clock=clock)
+    flood = Flood(admission)
+    flood.hold = asyncio.Event()
+
+    for chat_id in range(1, 201):
+        if chat_id % 2:
+            flood.send(chat_id, STATUS, HIGH)
+        else:
+            flood.send(chat_id, "/stats", LOW)
+    await flood.settle()
+
+    metrics = admission.metrics()
+    assert metrics["running"] == 8
+    assert metrics["shed_low"] > 0
+    assert metrics["shed_high"] == 0
+    # Only up to the low share of the slots went to /stats, the rest was shed
+    low_started = [chat_id for chat_id in flood.started if chat_id % 2 == 0]
+    assert 0 < len(low_started) <= admission.low_limit
+    assert sorted(flood.busy + low_started) == list(range(2, 201, 2))
+
+    await flood.finish()
+    assert admission.metrics()["shed_high"] == 0
+    # Every status request waited for a slot and was answered
+    assert all(flood.handled.get(chat_id) == 1 for chat_id in range(1, 201, 2))
+    assert len(flood.busy) == admission.metrics()["shed_low"]
+
+
+async def test_high_priority_is_shed_after_waiting(clock):
+    admission = Admission(max_concurrent=2, wait=0.05, clock=clock)
+    flood = Flood(admission)
+    flood.hold = asyncio.Event()
+
+    for chat_id in range(1, 4):
+        flood.send(chat_id)
+    await asyncio.sleep(0.2)
+
+    assert admission.metrics()["shed_high"] == 1
+    assert flood.busy == [3]
+    await flood.finish()
+    assert flood.handled == {1: 1, 2: 1}
+
+
+async def test_concurrent_handlers_are_capped(clock):
+    admission = Admission(max_concurrent=16, wait=5.0, clock=clock)
+    flood = Flood(admission)
+
+    for chat_id in range(1, 1001):
+        flood.send(chat_id)
+    await flood.finish()
+
+    assert flood.peak == 16
+    assert sum(flood.handled.values()) == 1000
+    assert admission.metrics()["running"] == 0
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.geocoding import GeocodeCache, GeocoderBusy, GeocodingService
+
+"""
+The geocoding service and its cache against a local fake geocoder.
+"""
+
+CITIES = {"milan": (45.46, 9.19), "toronto": (43.65, -79.38)}
+
+
+class FakeGeocoder:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.queries = []
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str):
+        with self._lock:
+            self.queries.append(query)
+        if self.delay:
+            threading.Event().wait(self.delay)
+        if self.fail:
+            raise ConnectionError("Nominatim is down")
+        return CITIES.get(query.strip().lower())
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+async def service_for():
+    services = []
+
+    def make(geocode: FakeGeocoder) -> GeocodingService:
+        service = GeocodingService(geocode, rate=1000, timeout=5)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        await service.stop()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "geocode_cache.sqlite3"
+
+
+async def test_normalized_queries_share_an_entry(service_for, db_path):
+    fake = FakeGeocoder()
+    cache = GeocodeCache(service_for(fake), db_path)
+
+    assert await cache.lookup("Milan") == CITIES["milan"]
+    assert await cache.lookup("  MILAN ") == CITIES["milan"]
+    assert await cache.lookup("milan") == CITIES["milan"]
+
+    assert fake.queries == ["Milan"]
+    assert cache.metrics()["memory_hits"] == 2
+
+
+async def test_found_cities_never_expire(service_for, db_path):
+    fake = FakeGeocoder()
+    clock = Clock()
+    cache = GeocodeCache(service_for(fake), db_path, negative_ttl=60, clock=clock)
+
+    await cache.lookup("Toronto")
+    clock.now += 365 * 24 * 3600
+    assert await cache.lookup("Toronto") == CITIES["toronto"]
+    assert len(fake.queries) == 1
+
+
+async def test_unknown_cities_expire_after_negative_ttl(service_for, db_path):
+    fake = FakeGeocoder()
+    clock = Clock()
+    cache = GeocodeCache(service_for(fake), db_path, negative_ttl=60, clock=clock)
+
+    assert await cache.lookup("Atlantis") is None
+    clock.now += 59
+    assert await cache.lookup("Atlantis") is None
+    assert len(fake.queries) == 1
+
+    clock.now += 1
+    assert await cache.lookup("Atlantis") is None
+    assert len(fake.queries) == 2
+
+
+async def test_concurrent_lookups_go_upstream_once(service_for, db_path):
+    fake = FakeGeocoder(delay=0.05)
+    cache = GeocodeCache(service_for(fake), db_path)
+
+    results = await asyncio.gather(*(cache.lookup("Milan") for _ in range(50)))
+
+    assert results == [CITIES["milan"]] * 50
+    assert fake.queries == ["Milan"]
+    assert cache.metrics()["coalesced"] == 49
+
+
+async def test_errors_reach_waiters_and_are_not_cached(service_for, db_path):
+    fake = FakeGeocoder(delay=0.02)
+    fake.fail = True
+    cache = GeocodeCache(service_for(fake), db_path)
+
+    results = await asyncio.gather(
+        *(cache.lookup("Milan") for _ in range(5)), return_exceptions=True
+    )
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+    fake.fail = False
+    assert await cache.lookup("Milan") == CITIES["milan"]
+    assert len(fake.queries) == 2
+
+
+async def test_entries_survive_a_restart(service_for, db_path):
+    fake = FakeGeocoder()
+    clock = Clock()
+    cache = GeocodeCache(service_for(fake), db_path, negative_ttl=60, clock=clock)
+    await cache.lookup("Milan")
+    await cache.lookup("Atlantis")
+
+    restarted = GeocodeCache(service_for(fake), db_path, negative_ttl=60, clock=clock)
+    assert await restarted.lookup("milan") == CITIES["milan"]
+    assert await restarted.lookup("atlantis") is None
+    assert restarted.metrics()["disk_hits"] == 2
+    assert len(fake.queries) == 2
+
+    # The negative entry expires on disk too
+    clock.now += 60
+    fresh = GeocodeCache(service_for(fake), db_path, negative_ttl=60, clock=clock)
+    assert await fresh.lookup("Atlantis") is None
+    assert len(fake.queries) == 3
+
+
+async def test_memory_tier_is_bounded(service_for, db_path):
+    fake = FakeGeocoder()
+    cache = GeocodeCache(service_for(fake), db_path, max_entries=2)
+
+    for city in ["Milan", "Toronto", "Atlantis"]:
+        await cache.lookup(city)
+
+    assert cache.metrics()["entries"] == 2
+    # Evicted from memory, still on disk
+    await cache.lookup("Milan")
+    assert cache.metrics()["disk_hits"] == 1
+    assert len(fake.queries) == 3
+
+
+async def test_cancelled_lookup_does_not_block_waiters(service_for, db_path):
+    fake = FakeGeocoder(delay=0.1)
+    cache = GeocodeCache(service_for(fake), db_path)
+
+    leader = asyncio.create_task(cache.lookup("Milan"))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(cache.lookup("Milan"))
+    await asyncio.sleep(0.01)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    # The waiter looks it up again instead of waiting forever
+    assert await asyncio.wait_for(waiter, 2) == CITIES["milan"]
+    assert len(cache._flight) == 0
+    assert await cache.lookup("Milan") == CITIES["milan"]
+
+
+async def test_service_rejects_when_queue_is_full():
+    service = GeocodingService(FakeGeocoder(delay=0.2), rate=1000, queue_size=2)
+    try:
+        # One lookup is taken by the worker, two wait in the queue
+        tasks = [asyncio.create_task(service.geocode("Milan"))]
+        await asyncio.sleep(0.05)
+        tasks += [asyncio.create_task(service.geocode("Milan")) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(GeocoderBusy):
+            await service.geocode("Toronto")
+        assert service.metrics()["rejected"] == 1
+        assert service.metrics()["queue_depth"] == 2
+
+        assert await asyncio.gather(*tasks) == [CITIES["milan"]] * 3
+    finally:
+        await service.stop()
+
+
+async def test_service_respects_its_rate():
+    fake = FakeGeocoder()
+    service = GeocodingService(fake, rate=20)
+    try:
+        started = time.monotonic()
+        await asyncio.gather(*(service.geocode(f"City {i}") for i in range(5)))
+        elapsed = time.monotonic() - started
+    finally:
+        await service.stop()
+
+    # The first request goes at once, the next four 50 ms apart
+    assert elapsed >= 0.19
+    assert service.metrics()["served"] == 5
+    assert service.metrics()["max_wait_s"] >= 0.19
+
+
+async def test_service_times_out_slow_lookups():
+    service = GeocodingService(FakeGeocoder(delay=0.3), rate=1000, timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            await service.geocode("Milan")
+        assert service.metrics()["timeouts"] == 1
+    finally:
+        await service.stop()
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+from services.lease import Lease
+
+"""
+The SQLite lease that makes a single worker send the city alerts.
+"""
+
+TTL = 0.3
+
+
+@pytest.fixture
+def lease_for(tmp_path):
+    def make(holder: str, ttl: float = TTL) -> Lease:
+        return Lease(tmp_path / "subscriptions.sqlite3", "scheduler", holder, ttl)
+
+    return make
+
+
+def test_only_one_holder_at_a_time(lease_for):
+    first, second = lease_for("first"), lease_for("second")
+
+    assert first.acquire()
+    assert not second.acquire()
+    # Renewing does not conflict with itself
+    assert first.acquire()
+    assert first.held
+    assert not second.held
+
+
+def test_expired_lease_is_taken_over(lease_for):
+    first, second = lease_for("first"), lease_for("second")
+    assert first.acquire()
+
+    time.sleep(TTL + 0.05)
+
+    assert second.acquire()
+    assert not first.acquire()
+    assert not first.held
+    assert second.held
+
+
+def test_release_hands_over_right_away(lease_for):
+    first, second = lease_for("first", ttl=60), lease_for("second", ttl=60)
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+
+    assert not first.held
+    assert second.acquire()
+
+
+def test_holder_gives_up_before_a_rival_can_take_over(lease_for):
+    first, second = lease_for("first"), lease_for("second")
+    assert first.acquire()
+
+    deadline = time.monotonic() + TTL * 3
+    while not second.acquire():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+    # At no point could both think they hold the lease
+    assert not first.held
+    assert second.held
+
+
+async def test_one_leader_and_a_handover_on_stop(lease_for):
+    leases = [lease_for("first"), lease_for("second")]
+    events = []
+
+    def callbacks(lease: Lease):
+        async def on_elected():
+            events.append(("elected", lease.holder))
+
+        async def on_deposed():
+            events.append(("deposed", lease.holder))
+
+        return on_elected, on_deposed
+
+    for lease in leases:
+        lease.start(*callbacks(lease))
+    await asyncio.sleep(TTL)
+
+    assert len(events) == 1
+    kind, leader = events[0]
+    assert kind == "elected"
+
+    leader_lease = next(lease for lease in leases if lease.holder == leader)
+    other = next(lease for lease in leases if lease.holder != leader)
+    await leader_lease.stop()
+    # The release lets the other one in at its next attempt, within TTL / 3
+    await asyncio.sleep(TTL / 3 + 0.1)
+    await other.stop()
+
+    assert events == [
+        ("elected", leader),
+        ("deposed", leader),
+        ("elected", other.holder),
+        ("deposed", other.holder),
+    ]
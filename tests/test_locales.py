@@ -0,0 +1,98 @@
+import asyncio
+import threading
+
+from services.locales import LocaleRegistry
+
+"""
+Loading the names of a language while the route is reloaded or requests are
+cancelled.
+"""
+
+
+class FakeRoute:
+    def __init__(self, version: int):
+        self.version = version
+
+    def names(self, locale: str):
+        return (self.version, locale)
+
+
+class FakeAPI:
+    def __init__(self, data_dir):
+        (data_dir / "santa_en.json").write_text("{}")
+        (data_dir / "santa_de.json").write_text("{}")
+        self.data_path = data_dir / "santa_en.json"
+        self.route = FakeRoute(1)
+
+    def get_route(self) -> FakeRoute:
+        return self.route
+
+
+class SlowLoads:
+    """Stands in for LocaleRegistry._load, each load waits to be released."""
+
+    def __init__(self):
+        self.started = []
+        self.release = threading.Event()
+
+    def __call__(self, route: FakeRoute, locale: str):
+        self.started.append(route.version)
+        self.release.wait(5)
+        return (route.version, f"{locale} loaded")
+
+
+async def until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+def registry_for(tmp_path):
+    api = FakeAPI(tmp_path)
+    registry = LocaleRegistry(api)
+    loads = registry._load = SlowLoads()
+    return api, registry, loads
+
+
+async def test_names_of_a_replaced_route_are_not_served(tmp_path):
+    api, registry, loads = registry_for(tmp_path)
+
+    first = asyncio.create_task(registry.names("de"))
+    await until(lambda: loads.started == [1])
+
+    api.route = FakeRoute(2)
+    second = asyncio.create_task(registry.names("de"))
+    # The new route gets its own load instead of waiting on the old one
+    await until(lambda: loads.started == [1, 2])
+
+    loads.release.set()
+    assert await first == (2, "de loaded")
+    assert await second == (2, "de loaded")
+    assert await registry.names("de") == (2, "de loaded")
+    assert loads.started == [1, 2]
+
+
+async def test_waiters_retry_when_the_loading_request_is_cancelled(tmp_path):
+    api, registry, loads = registry_for(tmp_path)
+
+    leader = asyncio.create_task(registry.names("de"))
+    await until(lambda: loads.started == [1])
+    waiter = asyncio.create_task(registry.names("de"))
+    await asyncio.sleep(0.05)
+
+    leader.cancel()
+    await until(lambda: len(loads.started) == 2)
+    loads.release.set()
+
+    assert await waiter == (1, "de loaded")
+    assert leader.cancelled()
+
+
+async def test_default_locale_is_not_loaded(tmp_path):
+    api, registry, loads = registry_for(tmp_path)
+
+    assert await registry.names("en-US") == (1, "en")
+    assert await registry.names("fr") == (1, "en")
+    assert loads.started == []
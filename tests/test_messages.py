@@ -0,0 +1,97 @@
+import pytest
+
+from core.messages import city_alert, escape_markdown, prettify
+from core.tracker import get_santa_status
+from synthetic import synthetic_route
+
+"""
+Status and alert texts for names that have a meaning in Markdown.
+"""
+
+AWKWARD = "San_Juan *[Old]* `Town`"
+ESCAPED = r"San\_Juan \*\[Old]\* \`Town\`"
+
+
+def route_with(city: str, region: str = "Region_1"):
+    route = synthetic_route(10)
+    route.cities[3] = city
+    route.regions[3] = region
+    return route
+
+
+def unescaped(text: str, name: str) -> bool:
+    return name in text.replace(escape_markdown(name), "")
+
+
+def test_escape_markdown():
+    assert escape_markdown(AWKWARD) == ESCAPED
+    assert escape_markdown("Zürich") == "Zürich"
+
+
+def test_visiting_status_escapes_the_names():
+    route = route_with(AWKWARD)
+    text, current, _ = get_santa_status(route, route.arrival[3] + 1)
+
+    assert current["index"] == 3
+    assert f"**Santa is currently visiting {ESCAPED}!**" in text
+    assert r"right now in Region\_1." in text
+    assert not unescaped(text, AWKWARD)
+
+
+@pytest.mark.parametrize("index", [3, 4])
+def test_in_flight_status_escapes_origin_and_destination(index):
+    route = route_with(AWKWARD)
+    # In the air before stop 3, then just after it
+    text, _, next_stop = get_santa_status(route, route.departure[index - 1] + 1)
+
+    assert next_stop["index"] == index
+    assert f"**{ESCAPED}**" in text
+    assert not unescaped(text, AWKWARD)
+
+
+@pytest.mark.parametrize("on_route", [True, False])
+def test_alert_escapes_the_city(on_route):
+    text = city_alert(AWKWARD, on_route)
+
+    assert f"**{ESCAPED}**" in text
+    assert not unescaped(text, AWKWARD)
+
+
+def test_plain_names_are_unchanged():
+    route = route_with("Rovaniemi", "Lapland")
+    text, _, _ = get_santa_status(route, route.arrival[3] + 1)
+    assert text == (
+        "🎅🏻 **Santa is currently visiting Rovaniemi!** \n\n"
+        "He is delivering presents right now in Lapland. 🎁"
+    )
+
+    minutes = int((route.arrival[4] - route.departure[3] - 1) / 1000 / 60)
+    text, _, _ = get_santa_status(route, route.departure[3] + 1)
+    assert text == (
+        "🎅🏻 **Santa is in the air!** 🛷\n\n"
+        "He has just left **Rovaniemi**.\n"
+        f"He is heading to **{route.cities[4]}** and will land in {minutes} minutes!"
+    )
+
+    assert city_alert("Rovaniemi", True) == (
+        "🚨 **SANTA ALERT!** 🚨\n\nSanta has just landed in **Rovaniemi**! "
+        "🎁 Get to bed!"
+    )
+
+
+@pytest.mark.parametrize(
+    "minutes, text",
+    [(0, "0 minutes"), (59, "59 minutes"), (90, "1h 30"), (1501, "1d 1h 1m")],
+)
+def test_prettify(minutes, text):
+    assert prettify(minutes) == text
+
+
+def test_pre_flight_status():
+    route = route_with("Rovaniemi")
+    text, _, _ = get_santa_status(route, route.departure[0] - 90 * 60 * 1000)
+    assert text == (
+        "🎅🏻 **Santa is at the North Pole!** 🏠\n\n"
+        "He is currently preparing the sleigh and feeding the reindeer.\n"
+        "🚀 **Takeoff in:** 1h 30"
+    )
@@ -0,0 +1,189 @@
+import asyncio
+import time
+
+import pytest
+from fake_bot_api import FakeBotAPI
+from telegram import Bot
+from telegram.error import NetworkError
+
+from services.outbox import BULK, Outbox, OutboxFull
+
+"""
+The outbox against the local fake Bot API server.
+"""
+
+# Fast enough that only the limit under test slows anything down
+NO_LIMIT = {"global_rate": 1e6, "chat_rate": 1e6, "chat_burst": 1e6}
+
+
+@pytest.fixture
+def server():
+    with FakeBotAPI(retry_after=1) as server:
+        yield server
+
+
+@pytest.fixture
+async def bot(server):
+    bot = Bot("123:fake", base_url=server.base_url)
+    await bot.initialize()
+    yield bot
+    await bot.shutdown()
+
+
+@pytest.fixture
+async def outboxes():
+    started = []
+
+    def make(**options) -> Outbox:
+        outbox = Outbox(**{**NO_LIMIT, **options})
+        started.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in started:
+        await outbox.stop()
+
+
+def texts_to(server: FakeBotAPI, chat_id: int):
+    return [text for _, _, chat, text in server.sends if chat == chat_id]
+
+
+async def test_messages_to_a_chat_arrive_in_order(outboxes):
+    server = FakeBotAPI(slow_rate=0.3, slow_latency=0.03, seed=1)
+    with server:
+        slow_bot = Bot("123:fake", base_url=server.base_url)
+        await slow_bot.initialize()
+        outbox = outboxes()
+        outbox.start(slow_bot)
+
+        for i in range(20):
+            for chat_id in (1, 2, 3):
+                await outbox.post("send_message", chat_id, text=f"{chat_id}-{i}")
+        await outbox.drain(10)
+        await slow_bot.shutdown()
+
+    for chat_id in (1, 2, 3):
+        assert texts_to(server, chat_id) == [f"{chat_id}-{i}" for i in range(20)]
+    assert outbox.metrics()["sent"] == 60
+    assert outbox.metrics()["held"] == 0
+
+
+async def test_interactive_replies_go_before_bulk_alerts(server, bot, outboxes):
+    outbox = outboxes(concurrency=1)
+    for chat_id in range(5):
+        await outbox.post("send_message", chat_id, BULK, text="alert")
+    reply = asyncio.create_task(outbox.send_message(9, text="reply"))
+    await asyncio.sleep(0)
+
+    outbox.start(bot)
+    await reply
+    await outbox.drain(5)
+
+    assert [chat for _, _, chat, _ in server.sends][0] == 9
+    assert len(server.sends) == 6
+
+
+async def test_chat_rate_is_respected(server, bot, outboxes):
+    outbox = outboxes(chat_rate=20, chat_burst=1)
+    outbox.start(bot)
+
+    for i in range(5):
+        await outbox.post("send_message", 1, text=str(i))
+    await outbox.drain(5)
+
+    times = [at for at, _, _, _ in server.sends]
+    # One message every 50 ms after the first
+    assert times[-1] - times[0] >= 0.19
+
+
+async def test_retry_after_pauses_every_chat(server, bot, outboxes):
+    outbox = outboxes()
+    outbox.start(bot)
+    server.fail(429)
+
+    throttled = asyncio.create_task(outbox.send_message(1, text="first"))
+    await asyncio.sleep(0.2)
+    other = asyncio.create_task(outbox.send_message(2, text="other"))
+    await asyncio.gather(throttled, other)
+
+    first_try, retry = [at for at, _, chat, _ in server.sends if chat == 1]
+    other_chat = [at for at, _, chat, _ in server.sends if chat == 2][0]
+    assert retry - first_try >= 0.95
+    # Flood control may be global, the other chat waited for it too
+    assert other_chat - first_try >= 0.95
+    assert outbox.metrics()["rate_limited"] == 1
+    assert outbox.metrics()["retried"] == 1
+
+
+async def test_network_errors_are_retried_with_jittered_backoff(server, bot, outboxes):
+    outbox = outboxes(backoff=0.1)
+    outbox.start(bot)
+    server.fail(502, 502)
+
+    message = await outbox.send_message(1, text="hello")
+    assert message.text == "hello"
+
+    times = [at for at, _, _, _ in server.sends]
+    # 0.1 s then 0.2 s, each between half and one and a half times that
+    assert 0.05 <= times[1] - times[0] <= 0.2
+    assert 0.1 <= times[2] - times[1] <= 0.35
+    assert outbox.metrics()["retried"] == 2
+
+
+async def test_retry_delays_are_spread(server, bot, outboxes):
+    outbox = outboxes(backoff=0.2)
+    outbox.start(bot)
+    server.fail(*[502] * 20)
+
+    started = time.monotonic()
+    await asyncio.gather(*(outbox.send_message(c, text=str(c)) for c in range(20)))
+
+    retries = [at - started for at, _, _, text in server.sends[20:]]
+    assert len(retries) == 20
+    assert max(retries) - min(retries) > 0.05
+
+
+async def test_errors_reach_the_caller_after_the_last_retry(server, bot, outboxes):
+    outbox = outboxes(backoff=0.01, max_retries=2)
+    outbox.start(bot)
+    server.fail(502, 502, 502)
+
+    with pytest.raises(NetworkError):
+        await outbox.send_message(1, text="hello")
+    assert len(server.sends) == 3
+    assert outbox.metrics()["failed"] == 1
+
+    # The chat is free again
+    assert (await outbox.send_message(1, text="again")).text == "again"
+
+
+async def test_interactive_sends_fail_fast_when_full(outboxes):
+    outbox = outboxes(queue_size=2)
+    queued = [
+        asyncio.create_task(outbox.send_message(1, text=str(i))) for i in range(2)
+    ]
+    await asyncio.sleep(0)
+
+    with pytest.raises(OutboxFull):
+        await outbox.send_message(1, text="one too many")
+    assert outbox.metrics()["rejected"] == 1
+    assert outbox.metrics()["queued_interactive"] == 2
+
+    for task in queued:
+        task.cancel()
+
+
+async def test_bulk_posts_wait_for_room(server, bot, outboxes):
+    outbox = outboxes(queue_size=2)
+    await outbox.post("send_message", 1, text="0")
+    await outbox.post("send_message", 2, text="1")
+
+    third = asyncio.create_task(outbox.post("send_message", 3, text="2"))
+    await asyncio.sleep(0.05)
+    assert not third.done()
+    assert outbox.metrics()["queued_bulk"] == 2
+
+    outbox.start(bot)
+    await asyncio.wait_for(third, 5)
+    await outbox.drain(5)
+    assert sorted(text for _, _, _, text in server.sends) == ["0", "1", "2"]
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from services.outbox import INTERACTIVE
+from services.photos import PhotoCache
+
+"""
+The photo file_id cache, shared by several workers through one database.
+"""
+
+URLS = [f"https://photos.example/stop-{i}.jpg" for i in range(20)]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.photos = []
+        self.broken = set()
+
+    async def send(self, method, chat_id, priority, photo, **kwargs):
+        self.photos.append(photo)
+        if photo in self.broken:
+            raise BadRequest("Wrong file identifier/http url specified")
+        file_id = photo if photo.startswith("file-") else f"file-{photo}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)], message_id=1)
+
+
+@pytest.fixture
+def workers(tmp_path):
+    caches = []
+
+    def make(max_failures: int = 3) -> PhotoCache:
+        cache = PhotoCache(tmp_path / "subscriptions.sqlite3", max_failures)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+async def test_workers_keep_each_others_file_ids(workers):
+    first, second = workers(), workers()
+    outbox = FakeOutbox()
+
+    # Both workers upload different photos at the same time
+    for i, url in enumerate(URLS):
+        await (first if i % 2 else second).send(outbox, 1, url, INTERACTIVE)
+
+    restarted = workers()
+    assert restarted.metrics()["file_ids"] == len(URLS)
+    assert all(restarted.resolve(url) == f"file-{url}" for url in URLS)
+
+
+async def test_photo_uploaded_by_another_worker_is_not_uploaded_again(workers):
+    first, second = workers(), workers()
+    outbox = FakeOutbox()
+
+    await first.send(outbox, 1, URLS[0], INTERACTIVE)
+    await second.send(outbox, 2, URLS[0], INTERACTIVE)
+
+    assert outbox.photos == [URLS[0], f"file-{URLS[0]}"]
+    assert second.metrics()["uploads"] == 0
+
+
+async def test_failures_are_shared_and_photo_given_up(workers):
+    first, second = workers(max_failures=2), workers(max_failures=2)
+    outbox = FakeOutbox()
+    outbox.broken.add(URLS[0])
+
+    with pytest.raises(BadRequest):
+        await first.send(outbox, 1, URLS[0], INTERACTIVE)
+    with pytest.raises(BadRequest):
+        await second.send(outbox, 1, URLS[0], INTERACTIVE)
+
+    assert not workers(max_failures=2).usable(URLS[0])
+    with pytest.raises(ValueError):
+        await first.send(outbox, 1, URLS[0], INTERACTIVE)
+
+
+async def test_stale_file_id_is_forgotten_for_every_worker(workers):
+    first = workers()
+    outbox = FakeOutbox()
+    await first.send(outbox, 1, URLS[0], INTERACTIVE)
+
+    outbox.broken.add(f"file-{URLS[0]}")
+    second = workers()
+    with pytest.raises(BadRequest):
+        await second.send(outbox, 1, URLS[0], INTERACTIVE)
+
+    # Uploaded again from the URL, not counted as a failure of the URL
+    assert workers().resolve(URLS[0]) == URLS[0]
+    outbox.broken.clear()
+    await second.send(outbox, 1, URLS[0], INTERACTIVE)
+    assert second.metrics()["uploads"] == 1
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+import pytest
+
+from core.tracker import get_santa_status
+from services.santa_api import SantaAPI
+from services.scheduler import NotificationScheduler
+from services.subscriptions import MemorySubscriptionStore, Subscription
+from synthetic import write_synthetic_data
+
+"""
+Route reloads when the data file is replaced while the bot runs.
+"""
+
+STOPS = 50
+
+
+def touch(path, seconds: int):
+    # Every write gets its own mtime, however fast the test runs
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+@pytest.fixture
+def api(tmp_path):
+    data_path = tmp_path / "santa_en.json"
+    write_synthetic_data(data_path, STOPS)
+
+    api = SantaAPI()
+    api.data_path = data_path
+    api.snapshot_path = data_path.with_suffix(".route")
+    api.raster_path = data_path.with_suffix(".eta.npy")
+    api.get_route()
+    return api
+
+
+def city_eta(api: SantaAPI):
+    def eta_for(subscription: Subscription):
+        route = api.get_route()
+        index = route.index_of_city(subscription.city)
+        return route.arrival[index] if index is not None else None
+
+    return eta_for
+
+
+def test_unparseable_data_keeps_the_current_route(api):
+    route = api.get_route()
+    data = api.data_path.read_bytes()
+
+    api.data_path.write_bytes(data[: len(data) // 2])
+    touch(api.data_path, 1)
+    with pytest.raises(ValueError):
+        api.refresh()
+    assert api.get_route() is route
+    assert api.epoch == 1
+
+    # Not marked as loaded, the next poll tries again
+    with pytest.raises(ValueError):
+        api.refresh()
+
+    api.data_path.write_bytes(data)
+    touch(api.data_path, 2)
+    assert api.refresh()
+    assert api.epoch == 2
+    assert len(api.get_route()) == STOPS
+
+
+def test_file_without_destinations_is_not_swapped_in(api):
+    route = api.get_route()
+    api.data_path.write_text('{"destinations": []}')
+    touch(api.data_path, 1)
+
+    with pytest.raises(ValueError):
+        api.refresh()
+    assert api.get_route() is route
+
+
+async def test_status_and_alerts_survive_a_truncated_file(api):
+    store = MemorySubscriptionStore()
+    cities = [f"City {i * 5}" for i in range(10)]
+    for i, city in enumerate(cities):
+        store.add(Subscription(i, city))
+    scheduler = NotificationScheduler(store)
+    await scheduler.rebuild(city_eta(api))
+    planned = {city: scheduler.due_at(city) for city in cities}
+    assert len(scheduler) == 10
+
+    reloads = []
+
+    async def on_reload(route):
+        reloads.append(route)
+        await scheduler.replan(city_eta(api))
+
+    data = api.data_path.read_bytes()
+    api.data_path.write_bytes(data[: len(data) // 3])
+    touch(api.data_path, 1)
+
+    api.start_watching(0.01, on_reload)
+    try:
+        await asyncio.sleep(0.2)
+
+        assert reloads == []
+        route = api.get_route()
+        assert len(route) == STOPS
+        message, current, _ = get_santa_status(route, route.arrival[STOPS // 2] + 1)
+        assert current is not None and message
+        assert {city: scheduler.due_at(city) for city in cities} == planned
+
+        # The complete file is picked up by the next poll
+        api.data_path.write_bytes(data)
+        touch(api.data_path, 2)
+        for _ in range(100):
+            if reloads:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await api.stop()
+
+    assert len(reloads) == 1
+    assert len(scheduler) == 10
@@ -0,0 +1,256 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from services.scheduler import COMPACT_SLACK, NotificationScheduler
+from services.subscriptions import MemorySubscriptionStore, Subscription
+
+"""
+The notification scheduler driven by a simulated clock.
+"""
+
+START = 1_766_570_400.0  # 24 Dec 2025 10:00 UTC, in seconds
+
+
+class Clock:
+    def __init__(self):
+        self.now = START
+
+    def __call__(self) -> float:
+        return self.now
+
+    def at(self, offset_ms: float):
+        self.now = START + offset_ms / 1000
+
+
+class Sent:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, city, user_ids, on_route):
+        self.batches.append((city, set(user_ids), on_route))
+
+
+def ms(offset_ms: float) -> float:
+    return START * 1000 + offset_ms
+
+
+def make_scheduler(store=None, claim=None):
+    store = store or MemorySubscriptionStore()
+    clock = Clock()
+    scheduler = NotificationScheduler(store, clock=clock, claim=claim)
+    sent = Sent()
+    scheduler._send_alerts = sent
+    return scheduler, store, clock, sent
+
+
+async def test_alerts_fire_at_their_eta():
+    scheduler, store, clock, sent = make_scheduler()
+    store.add(Subscription(1, "Milan"))
+    store.add(Subscription(2, "Milan"))
+    store.add(Subscription(3, "Rome", 41.9, 12.5))
+    scheduler.schedule("Milan", ms(1000), on_route=True)
+    scheduler.schedule("Rome", ms(2000), on_route=False)
+
+    clock.at(999)
+    await scheduler.fire_due()
+    assert sent.batches == []
+
+    clock.at(1000)
+    await scheduler.fire_due()
+    assert sent.batches == [("Milan", {1, 2}, True)]
+    assert scheduler.last_lag_ms == 0
+
+    clock.at(2500)
+    await scheduler.fire_due()
+    assert sent.batches[1:] == [("Rome", {3}, False)]
+    assert scheduler.last_lag_ms == 500
+    assert scheduler.metrics()["fired"] == 2
+    assert len(scheduler) == 0
+
+
+async def test_past_etas_are_rejected():
+    scheduler, _, clock, _ = make_scheduler()
+    clock.at(5000)
+
+    assert not scheduler.schedule("Milan", ms(4000), on_route=True)
+    assert not scheduler.schedule("Milan", ms(5000), on_route=True)
+    assert scheduler.due_at("Milan") is None
+    assert scheduler.metrics()["heap_size"] == 0
+
+    assert scheduler.schedule("Milan", ms(5001), on_route=True)
+    assert scheduler.due_at("Milan") == ms(5001)
+
+
+async def test_moved_and_cancelled_entries_are_skipped():
+    scheduler, store, clock, sent = make_scheduler()
+    store.add(Subscription(1, "Milan"))
+    store.add(Subscription(2, "Rome"))
+
+    scheduler.schedule("Milan", ms(1000), on_route=True)
+    scheduler.schedule("Milan", ms(3000), on_route=True)
+    scheduler.schedule("Rome", ms(2000), on_route=True)
+    scheduler.cancel("Rome")
+
+    clock.at(2500)
+    await scheduler.fire_due()
+    assert sent.batches == []
+
+    clock.at(3000)
+    await scheduler.fire_due()
+    assert sent.batches == [("Milan", {1}, True)]
+    assert scheduler.metrics()["fired"] == 1
+    assert scheduler.metrics()["heap_size"] == 0
+
+
+async def test_one_entry_per_city_whatever_the_subscribers():
+    scheduler, store, _, _ = make_scheduler()
+    for user_id in range(10_000):
+        store.add(Subscription(user_id, "Milan"))
+    store.add(Subscription(1, "Rome"))
+
+    await scheduler.rebuild(lambda s: ms(1000 if s.city == "Milan" else 2000))
+
+    assert len(scheduler) == 2
+    assert scheduler.metrics()["heap_size"] == 2
+
+
+async def test_replan_only_touches_moved_cities():
+    scheduler, store, _, _ = make_scheduler()
+    store.add(Subscription(1, "Milan"))
+    store.add(Subscription(2, "Rome"))
+    store.add(Subscription(3, "Paris"))
+    etas = {"Milan": ms(1000), "Rome": ms(2000), "Paris": ms(3000)}
+    await scheduler.rebuild(lambda s: etas[s.city])
+
+    etas["Rome"] = ms(2500)
+    etas["Paris"] = None
+    store.remove(1, "Milan")
+
+    # Rome moved, Paris left the route, Milan lost its last subscriber
+    assert await scheduler.replan(lambda s: etas[s.city]) == 3
+    assert scheduler.due_at("Rome") == ms(2500)
+    assert scheduler.due_at("Paris") is None
+    assert scheduler.due_at("Milan") is None
+    assert await scheduler.replan(lambda s: etas[s.city]) == 0
+
+
+async def test_replan_does_not_block_the_event_loop():
+    scheduler, store, _, _ = make_scheduler()
+    for i in range(200):
+        store.add(Subscription(i, f"City {i}"))
+    threads = set()
+
+    def slow_eta(subscription):
+        threads.add(threading.get_ident())
+        time.sleep(0.002)
+        return ms(1000)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(ticker())
+    replan = asyncio.create_task(scheduler.replan(slow_eta))
+    await asyncio.sleep(0.05)
+
+    # Subscribed while the ETAs are computed, not cancelled by the replan
+    store.add(Subscription(1000, "Oslo"))
+    scheduler.schedule("Oslo", ms(5000), on_route=True)
+
+    assert await replan == 200
+    task.cancel()
+
+    assert threading.get_ident() not in threads
+    assert ticks > 10
+    assert len(scheduler) == 201
+    assert scheduler.due_at("Oslo") == ms(5000)
+
+
+async def test_rebuild_on_election_runs_off_the_event_loop():
+    scheduler, store, clock, _ = make_scheduler()
+    store.add(Subscription(1, "Milan"))
+    store.add(Subscription(2, "Rome"))
+    # Planned while this process was not the leader, now outdated
+    for offset in range(100):
+        scheduler.schedule("Milan", ms(1000 + offset), on_route=True)
+    scheduler.schedule("Paris", ms(1000), on_route=True)
+    threads = set()
+
+    def eta(subscription):
+        threads.add(threading.get_ident())
+        return ms(500) if subscription.city == "Milan" else ms(3000)
+
+    clock.at(1000)
+    await scheduler.rebuild(eta)
+
+    assert threading.get_ident() not in threads
+    # Milan's alert is in the past and Paris has no subscribers left
+    assert scheduler.due_at("Milan") is None
+    assert scheduler.due_at("Paris") is None
+    assert scheduler.due_at("Rome") == ms(3000)
+    assert scheduler.metrics()["heap_size"] == 1
+
+
+async def test_heap_stays_bounded_under_reschedules():
+    scheduler, _, _, _ = make_scheduler()
+    cities = [f"City {i}" for i in range(100)]
+    for city in cities:
+        scheduler.schedule(city, ms(1000), on_route=True)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    max_heap = 0
+    for step in range(1, 1001):
+        for city in cities:
+            scheduler.schedule(city, ms(1000 + step), on_route=True)
+            max_heap = max(max_heap, scheduler.metrics()["heap_size"])
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    assert max_heap <= 2 * len(cities) + COMPACT_SLACK + 1
+    assert len(scheduler) == len(cities)
+    # 100k reschedules, the heap never holds more than ~1.2k entries
+    assert grown < 512 * 1024
+
+
+async def test_alerts_claimed_elsewhere_are_not_sent():
+    scheduler, store, clock, sent = make_scheduler(claim=lambda city, eta: False)
+    store.add(Subscription(1, "Milan"))
+    scheduler.schedule("Milan", ms(1000), on_route=True)
+
+    clock.at(1000)
+    await scheduler.fire_due()
+    assert sent.batches == []
+    assert scheduler.metrics()["claimed_elsewhere"] == 1
+
+
+async def test_running_task_fires_on_time_and_wakes_for_earlier_alerts():
+    store = MemorySubscriptionStore()
+    store.add(Subscription(1, "Milan"))
+    store.add(Subscription(2, "Rome"))
+    scheduler = NotificationScheduler(store)
+    fired = {}
+
+    async def send(city, user_ids, on_route):
+        fired[city] = time.time() * 1000
+
+    now = time.time() * 1000
+    scheduler.schedule("Milan", now + 400, on_route=True)
+    scheduler.start(send)
+    try:
+        await asyncio.sleep(0.01)
+        # Earlier than the timer the task is sleeping on
+        scheduler.schedule("Rome", time.time() * 1000 + 50, on_route=True)
+        await asyncio.sleep(0.5)
+    finally:
+        await scheduler.stop()
+
+    assert list(fired) == ["Rome", "Milan"]
+    assert fired["Milan"] - (now + 400) < 100
+    assert scheduler.max_lag_ms < 100
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+"""
+Coalescing, errors and cancellation of a shared computation.
+"""
+
+
+class Computation:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.calls
+
+
+async def test_callers_share_one_computation():
+    flight, compute = SingleFlight(), Computation()
+
+    tasks = [asyncio.create_task(flight.run("key", compute)) for _ in range(10)]
+    # Other keys are computed on their own
+    other_compute = Computation()
+    other = asyncio.create_task(flight.run("other", other_compute))
+    await asyncio.sleep(0)
+    compute.release.set()
+    other_compute.release.set()
+
+    assert await asyncio.gather(*tasks) == [1] * 10
+    assert await other == 1
+    assert flight.coalesced == 9
+    assert len(flight) == 0
+
+
+async def test_waiters_get_the_error():
+    flight, compute = SingleFlight(), Computation()
+    compute.error = ConnectionError("upstream down")
+
+    tasks = [asyncio.create_task(flight.run("key", compute)) for _ in range(3)]
+    await asyncio.sleep(0)
+    compute.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert compute.calls == 1
+    assert len(flight) == 0
+
+
+async def test_waiter_takes_over_when_the_computation_is_cancelled():
+    flight, compute = SingleFlight(), Computation()
+
+    leader = asyncio.create_task(flight.run("key", compute))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flight.run("key", compute))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    compute.release.set()
+
+    assert await waiter == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+async def test_cancelled_waiter_leaves_the_computation_running():
+    flight, compute = SingleFlight(), Computation()
+
+    leader = asyncio.create_task(flight.run("key", compute))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flight.run("key", compute))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    await asyncio.sleep(0)
+    compute.release.set()
+
+    assert await leader == 1
+    assert waiter.cancelled()
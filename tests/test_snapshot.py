@@ -0,0 +1,112 @@
+import os
+import struct
+
+import pytest
+
+from core.snapshot import HEADER, SECTION, SECTIONS, RouteSnapshot, SnapshotError
+from services.santa_api import SantaAPI
+from synthetic import write_synthetic_data
+
+"""
+The binary route snapshot against the JSON data file it is compiled from.
+"""
+
+STOPS = 40
+
+
+def make_api(data_path) -> SantaAPI:
+    api = SantaAPI()
+    api.data_path = data_path
+    api.snapshot_path = data_path.with_suffix(".route")
+    api.raster_path = data_path.with_suffix(".eta.npy")
+    return api
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = tmp_path / "santa_en.json"
+    write_synthetic_data(path, STOPS)
+    # Some names the string table must keep apart
+    text = path.read_text(encoding="utf-8")
+    path.write_text(text.replace('"City 3"', '"Zürich_2 *"'), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def compiled(data_path):
+    api = make_api(data_path)
+    assert api.compile_route() == STOPS
+    return api
+
+
+def json_route(data_path):
+    api = make_api(data_path)
+    api.snapshot_path = data_path.with_suffix(".missing")
+    return api.get_route()
+
+
+def test_snapshot_loads_the_same_route_as_the_json(compiled, data_path):
+    route = compiled.get_route()
+    # Read from the snapshot, not the JSON file
+    assert compiled._load_snapshot() is not None
+    expected = json_route(data_path)
+
+    for column in ["ids", "cities", "regions"]:
+        assert list(getattr(route, column)) == list(getattr(expected, column))
+    for column in [
+        "lat",
+        "lng",
+        "arrival",
+        "departure",
+        "population",
+        "presents_delivered",
+    ]:
+        assert list(getattr(route, column)) == list(getattr(expected, column))
+    assert "Zürich_2 *" in route.cities
+    assert all(route.details(i) == expected.details(i) for i in range(STOPS))
+
+
+def test_columns_are_little_endian(compiled):
+    data = compiled.snapshot_path.read_bytes()
+    lat = SECTIONS.index(("lat", "d"))
+    offset, length = SECTION.unpack_from(data, HEADER.size + lat * SECTION.size)
+
+    lats = struct.unpack_from(f"<{STOPS}d", data, offset)
+    assert length == STOPS * 8
+    assert list(lats) == list(json_route(compiled.data_path).lat)
+
+
+def test_stale_snapshot_falls_back_to_json(compiled):
+    stat = compiled.data_path.stat()
+    os.utime(compiled.data_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert compiled._load_snapshot() is None
+    assert len(compiled.get_route()) == STOPS
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        pytest.param(lambda data: data[: len(data) // 2], id="truncated"),
+        pytest.param(lambda data: data[: HEADER.size + 4], id="truncated table"),
+        pytest.param(lambda data: b"", id="empty"),
+        pytest.param(lambda data: b"NOTSANTA" + data[8:], id="bad magic"),
+        pytest.param(
+            lambda data: data[:8] + struct.pack("<I", 99) + data[12:],
+            id="bad version",
+        ),
+    ],
+)
+def test_unreadable_snapshot_falls_back_to_json(compiled, corrupt):
+    path = compiled.snapshot_path
+    stat = path.stat()
+    path.write_bytes(corrupt(path.read_bytes()))
+    # Keeps the snapshot newer than the data file
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    with pytest.raises(SnapshotError):
+        RouteSnapshot(path)
+    assert compiled._load_snapshot() is None
+    assert list(compiled.get_route().cities) == list(
+        json_route(compiled.data_path).cities
+    )
@@ -0,0 +1,139 @@
+import math
+import random
+
+import pytest
+
+from core.route import Route
+from core.tracker import (
+    calculate_arrival_time,
+    calculate_distance,
+    find_nearest_stops,
+    match_segment,
+)
+
+"""
+The KD-tree searches against a brute-force scan over every stop and segment,
+on seeded random routes and users, including the poles and the antimeridian.
+"""
+
+TAKEOFF_MS = 1577181600000
+STEP_MS = 60_000
+
+
+def random_point(rng: random.Random):
+    # Uniform on the sphere
+    return math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180)
+
+
+def near_pole(rng: random.Random):
+    return rng.choice([1, -1]) * rng.uniform(88.0, 90.0), rng.uniform(-180, 180)
+
+
+def near_antimeridian(rng: random.Random):
+    return rng.uniform(-80, 80), rng.choice([1, -1]) * rng.uniform(179.0, 180.0)
+
+
+POINTS = {"global": random_point, "pole": near_pole, "antimeridian": near_antimeridian}
+
+
+def make_route(n: int, seed: int) -> Route:
+    rng = random.Random(seed)
+    kinds = list(POINTS.values())
+    destinations = []
+    for i in range(n):
+        lat, lng = rng.choice(kinds)(rng)
+        arrival = TAKEOFF_MS + i * 2 * STEP_MS
+        destinations.append(
+            {
+                "id": f"stop-{i}",
+                "arrival": arrival,
+                "departure": arrival + STEP_MS,
+                "population": i,
+                "presentsDelivered": i,
+                "city": f"City {i}",
+                "region": "Region",
+                "location": {"lat": lat, "lng": lng},
+            }
+        )
+    return Route.from_destinations(destinations)
+
+
+def brute_nearest(lat: float, lng: float, route: Route):
+    distances = [
+        (calculate_distance(lat, lng, route.lat[i], route.lng[i]), i)
+        for i in range(len(route))
+    ]
+    return sorted(distances)
+
+
+"""
+The scan calculate_arrival_time did over every segment: (detour, eta)
+"""
+
+
+def brute_arrival(lat: float, lng: float, route: Route):
+    best = (math.inf, None)
+    for i in range(len(route) - 1):
+        a = (route.lat[i], route.lng[i])
+        b = (route.lat[i + 1], route.lng[i + 1])
+        dist_a_b = calculate_distance(*a, *b)
+        dist_a_user = calculate_distance(*a, lat, lng)
+        dist_user_b = calculate_distance(lat, lng, *b)
+
+        detour = dist_a_user + dist_user_b - dist_a_b
+        if detour < best[0]:
+            total = dist_a_user + dist_user_b
+            fraction = dist_a_user / total if total > 0 else 0.0
+            duration = route.arrival[i + 1] - route.departure[i]
+            best = (detour, route.departure[i] + duration * fraction)
+    return best
+
+
+@pytest.fixture(scope="module")
+def route() -> Route:
+    return make_route(800, seed=2024)
+
+
+@pytest.mark.parametrize("kind", POINTS)
+def test_nearest_stops_match_brute_force(route: Route, kind: str):
+    rng = random.Random(kind)
+    for _ in range(200):
+        lat, lng = POINTS[kind](rng)
+        expected = brute_nearest(lat, lng, route)[:3]
+
+        found = find_nearest_stops(lat, lng, route, k=3)
+
+        assert [stop["id"] for stop in found] == [f"stop-{i}" for _, i in expected]
+        for stop, (distance, _) in zip(found, expected):
+            assert stop["distance_from_user_km"] == round(distance, 2)
+
+
+@pytest.mark.parametrize("kind", POINTS)
+def test_arrival_time_matches_brute_force(route: Route, kind: str):
+    rng = random.Random(kind)
+    for _ in range(200):
+        lat, lng = POINTS[kind](rng)
+        detour, eta = brute_arrival(lat, lng, route)
+
+        match = match_segment(lat, lng, route)
+
+        assert match.detour_km == pytest.approx(detour, abs=1e-6)
+        assert match.eta_ms == pytest.approx(eta, abs=1)
+        assert calculate_arrival_time(lat, lng, route) == match.eta_ms
+
+
+def test_exact_stop_positions(route: Route):
+    for i in range(0, len(route), 37):
+        found = find_nearest_stops(route.lat[i], route.lng[i], route)
+        assert found[0]["distance_from_user_km"] == 0.0
+
+
+def test_tiny_routes():
+    assert find_nearest_stops(0.0, 0.0, make_route(0, seed=1)) == []
+    assert calculate_arrival_time(0.0, 0.0, make_route(1, seed=1)) is None
+
+    route = make_route(2, seed=1)
+    assert len(find_nearest_stops(10.0, 10.0, route, k=5)) == 2
+    assert calculate_arrival_time(10.0, 10.0, route) == pytest.approx(
+        brute_arrival(10.0, 10.0, route)[1], abs=1
+    )
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from services.status_cache import StatusSnapshot, StatusSnapshotCache
+
+BUCKET_MS = 15_000
+
+
+class Computer:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, now_ms: float) -> StatusSnapshot:
+        self.calls += 1
+        await self.release.wait()
+        return StatusSnapshot(
+            ("flying",), f"caption {self.calls}", None, now_ms + 60_000
+        )
+
+
+async def test_concurrent_misses_share_one_computation():
+    compute = Computer()
+    cache = StatusSnapshotCache(compute)
+
+    tasks = [asyncio.create_task(cache.get(1_000)) for _ in range(20)]
+    await asyncio.sleep(0)
+    compute.release.set()
+    snapshots = await asyncio.gather(*tasks)
+
+    assert compute.calls == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert cache.metrics() == {"hits": 0, "misses": 1, "coalesced": 19}
+
+
+async def test_snapshot_expires_at_bucket_boundary():
+    compute = Computer()
+    compute.release.set()
+    cache = StatusSnapshotCache(compute)
+
+    first = await cache.get(1_000)
+    assert first.expires_at_ms == BUCKET_MS
+    assert await cache.get(BUCKET_MS - 1) is first
+    assert await cache.get(BUCKET_MS) is not first
+    assert compute.calls == 2
+
+
+async def test_error_reaches_waiters_and_is_not_cached():
+    calls = 0
+
+    async def compute(now_ms: float) -> StatusSnapshot:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        if calls == 1:
+            raise RuntimeError("no route")
+        return StatusSnapshot(("flying",), "caption", None, now_ms + 60_000)
+
+    cache = StatusSnapshotCache(compute)
+    results = await asyncio.gather(
+        cache.get(1_000), cache.get(1_000), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    assert (await cache.get(1_000)).caption == "caption"
+
+
+async def test_cancelled_computation_does_not_block_waiters():
+    compute = Computer()
+    cache = StatusSnapshotCache(compute)
+
+    leader = asyncio.create_task(cache.get(1_000))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get(1_000))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    await asyncio.sleep(0)
+
+    # The waiter computes it again instead of waiting forever
+    compute.release.set()
+    snapshot = await asyncio.wait_for(waiter, 1)
+    assert compute.calls == 2
+    assert len(cache._flight) == 0
+    assert await cache.get(2_000) is snapshot
+
+
+async def test_cancelled_waiter_does_not_cancel_computation():
+    compute = Computer()
+    cache = StatusSnapshotCache(compute)
+
+    leader = asyncio.create_task(cache.get(1_000))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get(1_000))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    compute.release.set()
+    assert (await leader).caption == "caption 1"
@@ -0,0 +1,232 @@
+import asyncio
+import random
+import sqlite3
+import time
+from collections import Counter
+
+import pytest
+
+from services.subscriptions import (
+    MemorySubscriptionStore,
+    SQLiteSubscriptionStore,
+    Subscription,
+)
+
+"""
+Subscription stores and the /stats aggregate kept with them.
+"""
+
+CITIES = [f"City {i}" for i in range(40)]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemorySubscriptionStore()
+    else:
+        store = SQLiteSubscriptionStore(tmp_path / "subscriptions.sqlite3")
+    yield store
+    store.close()
+
+
+def assert_stats_match(store):
+    counts = Counter(subscription.city for subscription in store)
+    stats = store.stats
+
+    assert dict(stats.counts()) == dict(counts)
+    assert dict(store.city_counts()) == dict(counts)
+    assert stats.total == len(store) == sum(counts.values())
+    assert stats.cities == store.city_total() == len(counts)
+
+    expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    for k in (1, 3, 10, len(counts) + 1):
+        assert stats.top_k(k) == expected[:k]
+
+    top = max(counts.values(), default=0)
+    assert stats.top() == (top, {c for c, n in counts.items() if n == top})
+
+    by_city, by_user = {}, {}
+    for subscription in store:
+        by_city.setdefault(subscription.city, set()).add(subscription.user_id)
+        by_user.setdefault(subscription.user_id, set()).add(subscription.city)
+    for city in CITIES:
+        assert store.subscribers(city) == by_city.get(city, set())
+        assert store.subscriber_count(city) == len(by_city.get(city, ()))
+    for user_id, cities in by_user.items():
+        assert store.cities_of(user_id) == cities
+
+
+async def churn(store, seed: int, operations: int):
+    rng = random.Random(seed)
+    # Popular cities get most of the traffic, like on Christmas Eve
+    weights = [1 / (i + 1) for i in range(len(CITIES))]
+    for _ in range(operations):
+        user_id = rng.randrange(300)
+        city = rng.choices(CITIES, weights)[0]
+        if rng.random() < 0.6:
+            await asyncio.to_thread(store.add, Subscription(user_id, city))
+        else:
+            await asyncio.to_thread(store.remove, user_id, city)
+
+
+async def test_stats_stay_consistent_under_concurrent_writes(store):
+    await asyncio.gather(*(churn(store, seed, 400) for seed in range(16)))
+
+    assert len(store) > 0
+    assert_stats_match(store)
+
+
+async def test_stats_stay_consistent_when_emptied(store):
+    await asyncio.gather(*(churn(store, seed, 200) for seed in range(8)))
+
+    subscriptions = list(store)
+    await asyncio.gather(
+        *(asyncio.to_thread(store.remove, s.user_id, s.city) for s in subscriptions)
+    )
+
+    assert len(store) == 0
+    assert store.stats.top() == (0, set())
+    assert store.stats.top_k(5) == []
+    assert_stats_match(store)
+
+
+async def test_persisted_stats_match_after_reopening(tmp_path):
+    path = tmp_path / "subscriptions.sqlite3"
+    store = SQLiteSubscriptionStore(path)
+    await asyncio.gather(*(churn(store, seed, 300) for seed in range(8)))
+    expected = dict(store.stats.counts())
+    store.close()
+
+    reopened = SQLiteSubscriptionStore(path)
+    try:
+        assert dict(reopened.stats.counts()) == expected
+        assert_stats_match(reopened)
+    finally:
+        reopened.close()
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return tmp_path / "shared.sqlite3"
+
+
+async def test_changes_reach_the_other_processes(shared_path):
+    first = SQLiteSubscriptionStore(shared_path)
+    second = SQLiteSubscriptionStore(shared_path)
+    try:
+        first.add(Subscription(1, "Milan"))
+        first.add(Subscription(2, "Milan"))
+        first.remove(2, "Milan")
+        first.flush()
+
+        changes = second.sync()
+        assert [(s.city, s.user_id, added) for s, added in changes] == [
+            ("Milan", 1, True),
+            ("Milan", 2, True),
+            ("Milan", 2, False),
+        ]
+        assert second.subscribers("Milan") == {1}
+        assert second.sync() == []
+    finally:
+        first.close()
+        second.close()
+
+
+async def test_alerts_are_claimed_once_across_processes(shared_path):
+    first = SQLiteSubscriptionStore(shared_path)
+    second = SQLiteSubscriptionStore(shared_path)
+    try:
+        claims = await asyncio.gather(
+            asyncio.to_thread(first.claim_alert, "Milan", 1000.0),
+            asyncio.to_thread(second.claim_alert, "Milan", 1000.0),
+        )
+        assert sorted(claims) == [False, True]
+        assert not first.claim_alert("Milan", 1000.0)
+        assert second.claim_alert("Milan", 2000.0)
+    finally:
+        first.close()
+        second.close()
+
+
+async def test_reload_keeps_serving_and_keeps_concurrent_writes(shared_path):
+    store = SQLiteSubscriptionStore(shared_path)
+    other = SQLiteSubscriptionStore(shared_path)
+    try:
+        for user_id in range(20_000):
+            other.add(Subscription(user_id, CITIES[user_id % len(CITIES)]))
+        other.flush()
+        store.sync()
+        assert len(store) == 20_000
+
+        reload = asyncio.create_task(store._reload())
+        sizes = []
+        user_id = 100_000
+        while not reload.done():
+            store.add(Subscription(user_id, "Milan"))
+            store.remove(user_id - 1, "Milan")
+            sizes.append(len(store))
+            user_id += 1
+            await asyncio.sleep(0)
+        await reload
+
+        # Readers never saw a half loaded store, and no write was lost
+        assert min(sizes) >= 20_000
+        assert store.subscribers("Milan") == {user_id - 1}
+        assert len(store) == 20_001
+        assert_stats_match(store)
+    finally:
+        store.close()
+        other.close()
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failed_writes_are_retried_until_they_go_through(shared_path):
+    store = SQLiteSubscriptionStore(shared_path)
+    store.RETRY_SECONDS = 0.01
+    db = sqlite3.connect(shared_path, isolation_level=None)
+    # Makes every batch fail until it is put back
+    db.execute("ALTER TABLE subscriptions RENAME TO held")
+    try:
+        store.add(Subscription(1, "Milan"))
+        store.add(Subscription(2, "Milan"))
+        wait_for(lambda: store.write_errors >= 3)
+        assert store.metrics()["retrying_writes"] == 4
+
+        db.execute("ALTER TABLE held RENAME TO subscriptions")
+        store.flush()
+        assert store.metrics()["retrying_writes"] == 0
+        assert store.lost_writes == 0
+
+        other = SQLiteSubscriptionStore(shared_path)
+        try:
+            assert other.subscribers("Milan") == {1, 2}
+        finally:
+            other.close()
+    finally:
+        store.close()
+        db.close()
+
+
+def test_close_gives_up_on_writes_that_keep_failing(shared_path):
+    store = SQLiteSubscriptionStore(shared_path)
+    store.RETRY_SECONDS = store.MAX_RETRY_SECONDS = 60.0
+    db = sqlite3.connect(shared_path, isolation_level=None)
+    db.execute("ALTER TABLE subscriptions RENAME TO held")
+    try:
+        store.add(Subscription(1, "Milan"))
+        wait_for(lambda: store.write_errors >= 1)
+
+        started = time.monotonic()
+        store.close()
+        # Not waiting out the retry delay
+        assert time.monotonic() - started < 5
+        assert store.lost_writes == 2
+        assert store.metrics()["retrying_writes"] == 0
+    finally:
+        db.close()